@@ -1,6 +1,7 @@
 # ==========================================
 # File: agent_process_dao.py
 # Created in iteration: 2
+# Updated in iteration: 5
 # Author: Karl Concha
 #
 # #ChatGPT (OpenAI, 2025) – Assisted in renaming DAO to match
@@ -11,28 +12,41 @@
 # References:
 # - SQLite3 Documentation – https://docs.python.org/3/library/sqlite3.html
 # - UCC IS4470 FYP Bible – DAO patterns + Python standards
+#
+# Iteration 5: connections come from the shared manager (db_connection.py).
+# Iteration 5: get_AgentProcess_page (keyset-paginated list with column projection).
+# Iteration 5: Csv_Input_Mode column.
 # ==========================================
 
-import sqlite3
+from dao.db_connection import DEFAULT_PAGE_SIZE, BaseDAO
+from dao.row_mapper import fetch_all, fetch_one
 from model.agent_process import AgentProcess
 
 
-class AgentProcessDAO:
+# Columns a list page may select or filter on.
+AGENT_PROCESS_COLUMNS = (
+    "Process_ID", "User_ID", "Agent_Name", "Agent_Priming", "AI_Model",
+    "Operation_Selected", "Created_At", "Cache_TTL_Seconds", "Prompt_Mode",
+    "Csv_Input_Mode"
+)
+
+
+class AgentProcessDAO(BaseDAO):
     """ DAO class for CRUD operations on the AgentProcess table. """
 
     def __init__(self, db_name="rainn.db"):
-        self.conn = sqlite3.connect(db_name, check_same_thread=False)
-        self.conn.row_factory = sqlite3.Row
-        self.cursor = self.conn.cursor()
+        super().__init__(db_name)
 
     def add_AgentProcess(self, process):
         """ Inserts a new AgentProcess record. """
         self.cursor.execute("""
-            INSERT INTO AgentProcess (User_ID, Agent_Name, Agent_Priming, AI_Model, Operation_Selected)
-            VALUES (?, ?, ?, ?, ?)
-        """, (process.User_ID, process.Agent_Name, process.Agent_Priming, process.AI_Model, process.Operation_Selected))
+            INSERT INTO AgentProcess (User_ID, Agent_Name, Agent_Priming, AI_Model, Operation_Selected, Cache_TTL_Seconds,
+                                      Prompt_Mode, Csv_Input_Mode)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """, (process.User_ID, process.Agent_Name, process.Agent_Priming, process.AI_Model, process.Operation_Selected,
+              process.Cache_TTL_Seconds, process.Prompt_Mode, process.Csv_Input_Mode))
 
-        self.conn.commit()
+        self.commit()
         process.Process_ID = self.cursor.lastrowid
         return process
 
@@ -41,19 +55,7 @@ class AgentProcessDAO:
             "SELECT * FROM AgentProcess WHERE Process_ID = ?",
             (process_id,)
         )
-        row = self.cursor.fetchone()
-        if not row:
-            return None
-
-        return AgentProcess(
-            row["Process_ID"],
-            row["User_ID"],
-            row["Agent_Name"],
-            row["Agent_Priming"],
-            row["AI_Model"],
-            row["Operation_Selected"],
-            row["Created_At"]
-        )
+        return fetch_one(self.cursor, AgentProcess)
 
     def get_all_AgentProcesses(self):
         """ Returns all AgentProcess entries ordered by newest first. """
@@ -61,20 +63,16 @@ class AgentProcessDAO:
         self.cursor.execute(
             "SELECT * FROM AgentProcess ORDER BY Created_At DESC"
         )
-        rows = self.cursor.fetchall()
-
-        return [
-            AgentProcess(
-                r["Process_ID"],
-                r["User_ID"],
-                r["Agent_Name"],
-                r["Agent_Priming"],
-                r["AI_Model"],
-                r["Operation_Selected"],
-                r["Created_At"]
-            )
-            for r in rows
-        ]
+        return fetch_all(self.cursor, AgentProcess)
+
+    def get_AgentProcess_page(self, columns=AGENT_PROCESS_COLUMNS, before_id=None,
+                              limit=DEFAULT_PAGE_SIZE, user_id=None):
+        """ Keyset page of AgentProcesses (newest first). Returns (rows, next before_id). """
+        return self.fetch_page(
+            "AgentProcess", "Process_ID", columns, AGENT_PROCESS_COLUMNS,
+            {"User_ID": user_id},
+            before_id, limit
+        )
 
     def update_AgentProcess(self, process):
         """ Updates an existing AgentProcess record. """
@@ -87,7 +85,10 @@ class AgentProcessDAO:
                 Agent_Name = ?,
                 Agent_Priming = ?,
                 AI_Model = ?,
-                Operation_Selected = ?
+                Operation_Selected = ?,
+                Cache_TTL_Seconds = ?,
+                Prompt_Mode = ?,
+                Csv_Input_Mode = ?
             WHERE Process_ID = ?
             ''',
             (
@@ -96,11 +97,14 @@ class AgentProcessDAO:
                 process.Agent_Priming,
                 process.AI_Model,
                 process.Operation_Selected,
+                process.Cache_TTL_Seconds,
+                process.Prompt_Mode,
+                process.Csv_Input_Mode,
                 process.Process_ID
             )
         )
 
-        self.conn.commit()
+        self.commit()
 
     def delete_AgentProcess(self, process_id):
         """ Deletes an AgentProcess entry by its ID. """
@@ -108,8 +112,8 @@ class AgentProcessDAO:
             "DELETE FROM AgentProcess WHERE Process_ID = ?", 
             (process_id,)
         )
-        self.conn.commit()
+        self.commit()
 
     def close(self):
         """ Closes the database connection. """
-        self.conn.close()
+        self.close_connection()
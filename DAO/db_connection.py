@@ -0,0 +1,193 @@
+# ==========================================
+# File: db_connection.py
+# Added in iteration: 5
+# Author: Karl Concha
+#
+# Purpose:
+# Central SQLite connection manager shared by every DAO.
+# - One connection per thread per database file (thread-local), reused for
+#   the life of the thread instead of one connection per DAO instance
+# - journal_mode=WAL so readers do not block the writer (and vice versa)
+# - synchronous=NORMAL (safe with WAL, far fewer fsyncs per commit)
+# - busy_timeout so concurrent writers wait instead of failing with
+#   "database is locked"
+# - A larger per-connection statement cache, so the DAOs' fixed SQL strings
+#   are prepared once per connection and reused
+#
+# - transaction() groups several DAO writes on the calling thread into one
+#   commit (unit of work); DAOs commit through BaseDAO.commit(), which defers
+#   to the enclosing transaction when there is one
+# - id_batches() splits ID lists for set-based "WHERE ... IN (...)" statements
+# - BaseDAO.fetch_page() is the shared keyset pagination query (WHERE id < last
+#   seen id ORDER BY id DESC LIMIT n) with column projection, so list pages
+#   cost the same however much history the table holds
+#
+# Notes:
+# - DAOs subclass BaseDAO and keep using self.connection / self.cursor; both
+#   resolve to the calling thread's connection, so a DAO (or service) object
+#   can safely be shared between worker threads.
+#
+# References:
+# - SQLite Documentation – "Write-Ahead Logging" (https://www.sqlite.org/wal.html)
+# ==========================================
+
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+
+DEFAULT_DB_NAME = "rainn.db"
+BUSY_TIMEOUT_MS = 5000
+STATEMENT_CACHE_SIZE = 256
+
+# IDs bound in one "IN (...)" statement (keeps well under SQLite's
+# 999-variable limit on older builds).
+MAX_IDS_PER_STATEMENT = 500
+
+# Rows per page for the keyset-paginated list queries.
+DEFAULT_PAGE_SIZE = 50
+
+_local = threading.local()
+
+
+def get_connection(db_name=DEFAULT_DB_NAME):
+    """Returns the calling thread's connection to db_name, opening and configuring it on first use."""
+    connections = getattr(_local, "connections", None)
+    if connections is None:
+        connections = _local.connections = {}
+
+    connection = connections.get(db_name)
+    if connection is None:
+        connection = sqlite3.connect(
+            db_name,
+            timeout=BUSY_TIMEOUT_MS / 1000,
+            cached_statements=STATEMENT_CACHE_SIZE
+        )
+        connection.row_factory = sqlite3.Row
+        connection.execute("PRAGMA journal_mode = WAL;")
+        connection.execute("PRAGMA synchronous = NORMAL;")
+        connection.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS};")
+        connections[db_name] = connection
+    return connection
+
+
+def release_connection(db_name=DEFAULT_DB_NAME):
+    """Closes the calling thread's connection to db_name (reopened on next use)."""
+    connections = getattr(_local, "connections", None) or {}
+    connection = connections.pop(db_name, None)
+    if connection is not None:
+        connection.close()
+
+
+@contextmanager
+def transaction(db_name=DEFAULT_DB_NAME):
+    """
+    Unit of work: DAO writes made on this thread inside the block are committed
+    together when the outermost block exits, or rolled back if it raises.
+    Other connections do not see the writes until then.
+    """
+    depths = getattr(_local, "transaction_depths", None)
+    if depths is None:
+        depths = _local.transaction_depths = {}
+
+    connection = get_connection(db_name)
+    depths[db_name] = depths.get(db_name, 0) + 1
+    try:
+        yield connection
+    except BaseException:
+        depths[db_name] -= 1
+        if not depths[db_name]:
+            connection.rollback()
+        raise
+    else:
+        depths[db_name] -= 1
+        if not depths[db_name]:
+            connection.commit()
+
+
+def in_transaction(db_name=DEFAULT_DB_NAME):
+    """True while the calling thread is inside transaction(db_name)."""
+    return bool((getattr(_local, "transaction_depths", None) or {}).get(db_name))
+
+
+def id_batches(ids, size=MAX_IDS_PER_STATEMENT):
+    """Yields (ids, "?, ?, ...") slices of ids for set-based "IN (...)" statements."""
+    ids = list(ids)
+    for start in range(0, len(ids), size):
+        batch = ids[start:start + size]
+        yield batch, ", ".join("?" * len(batch))
+
+
+class BaseDAO:
+    """
+    Base class for DAOs: exposes the calling thread's shared connection and a
+    cursor on it (one cursor per DAO instance per thread).
+    """
+
+    def __init__(self, db_name=DEFAULT_DB_NAME):
+        self.db_name = db_name
+        self._local = threading.local()
+
+    @property
+    def connection(self):
+        return get_connection(self.db_name)
+
+    @property
+    def cursor(self):
+        connection = self.connection
+        cursor = getattr(self._local, "cursor", None)
+        if cursor is None or cursor.connection is not connection:
+            cursor = connection.cursor()
+            self._local.cursor = cursor
+        return cursor
+
+    def commit(self):
+        """ Commits now, unless an enclosing transaction() will commit later. """
+        if not in_transaction(self.db_name):
+            self.connection.commit()
+
+    def begin_write(self):
+        """
+        Takes the database write lock now (BEGIN IMMEDIATE) unless this thread
+        already holds it, so rows read next cannot change before they are written.
+        """
+        if not self.connection.in_transaction:
+            self.connection.execute("BEGIN IMMEDIATE;")
+
+    def fetch_page(self, table, key_column, columns, allowed_columns, filters=None,
+                   before=None, limit=DEFAULT_PAGE_SIZE):
+        """
+        Keyset page of table, newest first: rows with key_column < before (all
+        rows when before is None), at most limit, selecting only columns.
+        filters maps column -> value (equality, None values ignored).
+        Returns (rows, next_before); next_before is None on the last page.
+        Rows are sqlite3.Row (read as row["col"], or row.col in templates).
+        """
+        columns = list(columns)
+        if key_column not in columns:
+            columns.insert(0, key_column)
+        unknown = (set(columns) | set(filters or {})) - set(allowed_columns)
+        if unknown:
+            raise ValueError(f"Unknown {table} column(s): {', '.join(sorted(unknown))}")
+
+        clauses, params = [], []
+        for column, value in (filters or {}).items():
+            if value is not None:
+                clauses.append(f"{column} = ?")
+                params.append(value)
+        if before is not None:
+            clauses.append(f"{key_column} < ?")
+            params.append(before)
+
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        limit = max(1, int(limit))
+        rows = self.connection.execute(
+            f"SELECT {', '.join(columns)} FROM {table} {where} ORDER BY {key_column} DESC LIMIT ?",
+            (*params, limit + 1)
+        ).fetchall()
+        next_before = rows[limit - 1][key_column] if len(rows) > limit else None
+        return rows[:limit], next_before
+
+    def close_connection(self):
+        """ Closes this thread's shared database connection. """
+        release_connection(self.db_name)
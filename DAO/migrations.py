@@ -0,0 +1,316 @@
+# ==========================================
+# File: migrations.py
+# Added in iteration: 5
+# Author: Karl Concha
+#
+# Purpose:
+# Versioned, forward-only schema migrations for rainn.db.
+# - The applied version is stored in PRAGMA user_version
+# - Version 0 -> base schema: creates any missing table (CREATE TABLE IF NOT
+#   EXISTS) exactly as shipped before Iteration 5, so databases created by the
+#   old drop-and-recreate init_db keep their data; every Iteration 5 column
+#   and index is its own numbered migration
+# - migrate() applies every migration newer than the stored version:
+#   "schema" migrations run in one transaction together with the version bump,
+#   "backfill" migrations update rows in small committed batches (the write
+#   lock is released between batches, so the app keeps serving) and bump the
+#   version when done; an interrupted backfill resumes where it stopped
+# - When the schema is current, migrate() is a single PRAGMA read
+# - Versions 1-6 add the Iteration 5 columns, 7 the lookup indexes, 8 backfills
+#   legacy run expiries, 9 adds AgentProcess.Csv_Input_Mode
+#
+# Notes:
+# - Add new schema changes as a new entry at the end of MIGRATIONS; never edit
+#   an entry that has shipped.
+# - Called at app startup and by init_db.py.
+# ==========================================
+
+from dao.db_connection import DEFAULT_DB_NAME, get_connection
+
+
+# Rows updated per committed batch in backfill migrations.
+BACKFILL_BATCH_SIZE = 500
+
+# Same as TaskInstanceService.DEFAULT_TTL_SECONDS (privacy TTL of a run).
+LEGACY_RUN_TTL_SECONDS = 15 * 60
+
+
+def _create_base_schema(cursor):
+    """
+    Version 0: the Rainn tables as shipped before Iteration 5 (CREATE TABLE IF NOT
+    EXISTS, so databases made by the old drop-and-recreate init_db are kept).
+    Every later column or index is a numbered entry in MIGRATIONS.
+    """
+    # ------------------------------------------
+    # CORE TEMPLATE TABLES (Iteration 1/2)
+    # ------------------------------------------
+
+    # TaskDef Table
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS TaskDef (
+            TaskDef_ID INTEGER PRIMARY KEY AUTOINCREMENT,
+            TaskDef_Name TEXT NOT NULL UNIQUE,
+            TaskDef_Description TEXT
+        );
+    """)
+
+    # TaskStageDef Table
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS TaskStageDef (
+            TaskStageDef_ID INTEGER PRIMARY KEY AUTOINCREMENT,
+            TaskDef_ID_FK INTEGER NOT NULL,
+            TaskStageDef_Type TEXT NOT NULL,
+            TaskStageDef_Description TEXT,
+            FOREIGN KEY (TaskDef_ID_FK) REFERENCES TaskDef(TaskDef_ID)
+        );
+    """)
+
+    # AgentProcess Table (Iteration 2)
+    # Represents a saved "configured agent" with model + priming + selected template.
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS AgentProcess (
+            Process_ID INTEGER PRIMARY KEY AUTOINCREMENT,
+            User_ID INTEGER,
+            Agent_Name TEXT,
+            Agent_Priming TEXT DEFAULT NULL,
+            AI_Model TEXT,
+            Operation_Selected INTEGER NOT NULL,
+            Created_At DATETIME DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (Operation_Selected) REFERENCES TaskDef(TaskDef_ID)
+        );
+    """)
+
+    # ------------------------------------------
+    # EXECUTION TRACEABILITY TABLES (Iteration 3)
+    # ------------------------------------------
+
+    # TaskInstance Table (NEW Iteration 3)
+    # One row per execution run:
+    # "User ran AgentProcess Y using TaskDef Z at time T"
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS TaskInstance (
+            TaskInstance_ID INTEGER PRIMARY KEY AUTOINCREMENT,
+            Process_ID_FK INTEGER NOT NULL,
+            TaskDef_ID_FK INTEGER NOT NULL,
+            Status TEXT CHECK(Status IN ('RUNNING', 'COMPLETED', 'FAILED')) NOT NULL,
+            Run_Folder TEXT NOT NULL DEFAULT '',
+            Last_Accessed_At DATETIME,
+            Expires_At DATETIME,
+            Deleted_At DATETIME,
+            Downloaded_At DATETIME,
+            Created_At DATETIME DEFAULT CURRENT_TIMESTAMP,
+            Updated_At DATETIME DEFAULT CURRENT_TIMESTAMP,
+
+            FOREIGN KEY (Process_ID_FK) REFERENCES AgentProcess(Process_ID),
+            FOREIGN KEY (TaskDef_ID_FK) REFERENCES TaskDef(TaskDef_ID)
+        );
+    """)
+
+    # TaskStageInstance Table (NEW Iteration 3)
+    # One row per stage execution within a TaskInstance.
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS TaskStageInstance (
+            TaskStageInstance_ID INTEGER PRIMARY KEY AUTOINCREMENT,
+            TaskInstance_ID_FK INTEGER NOT NULL,
+            Stage_Order INTEGER NOT NULL,
+            Stage_Name TEXT NOT NULL,
+            Status TEXT CHECK(Status IN ('PENDING', 'RUNNING', 'COMPLETED', 'FAILED')) NOT NULL,
+            Output_Artifact_Path TEXT,
+            Started_At DATETIME,
+            Ended_At DATETIME,
+            Error_Message TEXT,
+
+            FOREIGN KEY (TaskInstance_ID_FK) REFERENCES TaskInstance(TaskInstance_ID)
+        );
+    """)
+
+
+def _add_missing_columns(cursor, columns):
+    """ALTER TABLE ... ADD COLUMN for each (table, column, declaration) the table does not have yet."""
+    for table, column, declaration in columns:
+        existing = {row[1] for row in cursor.execute(f"PRAGMA table_info({table});").fetchall()}
+        if column not in existing:
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {declaration};")
+
+
+def _add_lookup_indexes(cursor):
+    """Indexes for the per-run, per-flow and privacy-cleanup lookups."""
+    # get_stages_for_task_instance (WHERE run ORDER BY stage), stage cleanup/deletes
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_stage_instance_task_order
+        ON TaskStageInstance (TaskInstance_ID_FK, Stage_Order)
+    """)
+    # get_TaskStageDefs_for_task
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_stage_def_taskdef
+        ON TaskStageDef (TaskDef_ID_FK, TaskStageDef_ID)
+    """)
+    # get_expired_task_instances: only live runs with an expiry are candidates
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_task_instance_expiry_live
+        ON TaskInstance (Expires_At)
+        WHERE Deleted_At IS NULL AND Expires_At IS NOT NULL
+    """)
+    # get_deleted_task_instances_before: only deleted runs (receipts)
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_task_instance_deleted
+        ON TaskInstance (Deleted_At)
+        WHERE Deleted_At IS NOT NULL
+    """)
+    # get_child_task_instances: only batch children have a parent
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_task_instance_parent
+        ON TaskInstance (Parent_TaskInstance_ID_FK, TaskInstance_ID)
+        WHERE Parent_TaskInstance_ID_FK IS NOT NULL
+    """)
+
+
+def _expire_legacy_runs(connection):
+    """
+    Runs created before the privacy TTL have no Expires_At, so the cleanup never
+    reaches them; give each one the TTL counted from its last activity.
+    """
+    return backfill_in_batches(
+        connection,
+        "TaskInstance",
+        "Expires_At = datetime(COALESCE(Last_Accessed_At, Updated_At, Created_At), ?)",
+        "Expires_At IS NULL AND Deleted_At IS NULL AND Status != 'RUNNING'",
+        (f"+{LEGACY_RUN_TTL_SECONDS} seconds",)
+    )
+
+
+def _add_cache_ttl(cursor):
+    """AgentProcess.Cache_TTL_Seconds (NULL = response cache off for this flow)."""
+    _add_missing_columns(cursor, [
+        ("AgentProcess", "Cache_TTL_Seconds", "INTEGER DEFAULT NULL"),
+    ])
+
+
+def _add_stage_depends_on(cursor):
+    """TaskStageDef.TaskStageDef_Depends_On (comma-separated earlier stage names, NULL = previous stage)."""
+    _add_missing_columns(cursor, [
+        ("TaskStageDef", "TaskStageDef_Depends_On", "TEXT DEFAULT NULL"),
+    ])
+
+
+def _add_parent_task_instance(cursor):
+    """TaskInstance.Parent_TaskInstance_ID_FK (batch runs create one child row per file)."""
+    _add_missing_columns(cursor, [
+        ("TaskInstance", "Parent_TaskInstance_ID_FK",
+         "INTEGER DEFAULT NULL REFERENCES TaskInstance(TaskInstance_ID)"),
+    ])
+
+
+def _add_stage_chunk_tokens(cursor):
+    """TaskStageDef.TaskStageDef_Chunk_Tokens (map-reduce chunk size, NULL = no chunking)."""
+    _add_missing_columns(cursor, [
+        ("TaskStageDef", "TaskStageDef_Chunk_Tokens", "INTEGER DEFAULT NULL"),
+    ])
+
+
+def _add_prompt_mode(cursor):
+    """
+    AgentProcess.Prompt_Mode ('full' repeats the input in every stage prompt, 'compact'
+    does not) and TaskStageDef.TaskStageDef_Include_Input (1 = compact mode still sends it).
+    """
+    _add_missing_columns(cursor, [
+        ("AgentProcess", "Prompt_Mode",
+         "TEXT CHECK(Prompt_Mode IN ('full', 'compact')) NOT NULL DEFAULT 'full'"),
+        ("TaskStageDef", "TaskStageDef_Include_Input", "INTEGER NOT NULL DEFAULT 0"),
+    ])
+
+
+def _add_prompt_tokens(cursor):
+    """TaskStageInstance.Prompt_Tokens (estimated prompt size sent to the model)."""
+    _add_missing_columns(cursor, [
+        ("TaskStageInstance", "Prompt_Tokens", "INTEGER"),
+    ])
+
+
+def _add_csv_input_mode(cursor):
+    """AgentProcess.Csv_Input_Mode ('full' rows, or a 'summary' / 'sample' of CSV uploads)."""
+    _add_missing_columns(cursor, [
+        ("AgentProcess", "Csv_Input_Mode",
+         "TEXT CHECK(Csv_Input_Mode IN ('full', 'summary', 'sample')) NOT NULL DEFAULT 'full'"),
+    ])
+
+
+# (version, description, kind, function) in the order they must be applied.
+# kind "schema": function(cursor), run in one transaction with the version bump.
+# kind "backfill": function(connection), commits its own batches (see backfill_in_batches).
+# Column migrations skip columns that already exist, so databases upgraded by
+# earlier builds of this list (which added them in the version 0 step) are safe.
+MIGRATIONS = [
+    (1, "Per-flow response cache TTL", "schema", _add_cache_ttl),
+    (2, "Stage dependencies (DAG)", "schema", _add_stage_depends_on),
+    (3, "Batch run parent", "schema", _add_parent_task_instance),
+    (4, "Stage chunk size (map-reduce)", "schema", _add_stage_chunk_tokens),
+    (5, "Compact prompt mode", "schema", _add_prompt_mode),
+    (6, "Per-stage prompt size", "schema", _add_prompt_tokens),
+    (7, "Indexes for run, stage and cleanup lookups", "schema", _add_lookup_indexes),
+    (8, "Give legacy runs a privacy expiry", "backfill", _expire_legacy_runs),
+    (9, "Per-flow CSV input mode", "schema", _add_csv_input_mode),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def get_schema_version(db_name=DEFAULT_DB_NAME):
+    """Returns the migration version recorded in the database (0 = none applied)."""
+    return get_connection(db_name).execute("PRAGMA user_version;").fetchone()[0]
+
+
+def backfill_in_batches(connection, table, assignments, where, params=(), batch_size=BACKFILL_BATCH_SIZE):
+    """
+    UPDATE table SET assignments WHERE where, batch_size rows per committed transaction.
+    The assignments must make where false for updated rows (otherwise this never ends).
+    params are bound to assignments then where. Returns the number of rows updated.
+    """
+    total = 0
+    while True:
+        cursor = connection.execute(
+            f"""
+            UPDATE {table} SET {assignments}
+            WHERE rowid IN (SELECT rowid FROM {table} WHERE {where} LIMIT ?)
+            """,
+            (*params, batch_size)
+        )
+        connection.commit()
+        total += cursor.rowcount
+        if cursor.rowcount < batch_size:
+            return total
+
+
+def migrate(db_name=DEFAULT_DB_NAME):
+    """
+    Applies pending migrations and returns the versions applied (empty when the
+    schema is already current). A failing migration is rolled back and re-raised;
+    earlier migrations stay applied.
+    """
+    connection = get_connection(db_name)
+    current = get_schema_version(db_name)
+    if current >= LATEST_VERSION:
+        return []
+
+    applied = []
+    for version, description, kind, apply in MIGRATIONS:
+        if version <= current:
+            continue
+        cursor = connection.cursor()
+        try:
+            if kind == "backfill":
+                apply(connection)
+                cursor.execute("BEGIN;")
+            else:
+                cursor.execute("BEGIN;")
+                if current == 0 and not applied:
+                    _create_base_schema(cursor)
+                apply(cursor)
+            cursor.execute(f"PRAGMA user_version = {int(version)};")
+            connection.commit()
+        except Exception as e:
+            connection.rollback()
+            raise Exception(f"Migration {version} ({description}) failed: {e}") from e
+        applied.append(version)
+
+    return applied
@@ -0,0 +1,112 @@
+# ==========================================
+# File: query_plans.py
+# Added in iteration: 5
+# Author: Karl Concha
+#
+# Purpose:
+# Developer CLI: prints SQLite's EXPLAIN QUERY PLAN for every query in the
+# DAO layer, so full-table scans are easy to spot after a schema change.
+#
+# Usage:
+#   python -m dao.query_plans [--db rainn.db] [--scans-only]
+#
+# Notes:
+# - Queries are read from the DAO sources (cursor.execute / executemany with
+#   a literal SQL string), so new DAO methods are picked up automatically.
+# - SQL built at runtime (f-strings) is listed but not explained.
+# - Parameters are bound as NULL; the plan does not depend on their values.
+# ==========================================
+
+import argparse
+import ast
+import glob
+import os
+import sqlite3
+
+from dao.db_connection import DEFAULT_DB_NAME
+
+
+DAO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def collect_queries(dao_dir=DAO_DIR):
+    """
+    Yields (file name, class.method, line, sql) for each DAO query.
+    sql is None for queries built at runtime.
+    """
+    for path in sorted(glob.glob(os.path.join(dao_dir, "*_dao.py"))):
+        with open(path, "r", encoding="utf-8") as f:
+            tree = ast.parse(f.read(), filename=path)
+
+        for cls in (n for n in tree.body if isinstance(n, ast.ClassDef)):
+            for fn in (n for n in cls.body if isinstance(n, ast.FunctionDef)):
+                for node in ast.walk(fn):
+                    if not (
+                        isinstance(node, ast.Call)
+                        and isinstance(node.func, ast.Attribute)
+                        and node.func.attr in ("execute", "executemany")
+                        and node.args
+                    ):
+                        continue
+                    arg = node.args[0]
+                    if isinstance(arg, ast.Constant) and isinstance(arg.value, str):
+                        sql = " ".join(arg.value.split())
+                    else:
+                        sql = None
+                    yield os.path.basename(path), f"{cls.name}.{fn.name}", node.lineno, sql
+
+
+def explain(connection, sql):
+    """Returns the EXPLAIN QUERY PLAN detail lines for sql."""
+    rows = connection.execute(f"EXPLAIN QUERY PLAN {sql}", [None] * sql.count("?")).fetchall()
+    return [row[3] for row in rows]
+
+
+def _is_scan(detail):
+    # "SCAN t" is a full scan; "SCAN t USING [COVERING] INDEX" still walks an index in order.
+    return detail.startswith("SCAN") and "USING" not in detail
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Print EXPLAIN QUERY PLAN for every DAO query.")
+    parser.add_argument("--db", default=DEFAULT_DB_NAME, help="SQLite database file (default: rainn.db)")
+    parser.add_argument("--scans-only", action="store_true", help="Only list queries with a full table scan")
+    args = parser.parse_args(argv)
+
+    if not os.path.isfile(args.db):
+        parser.error(f"database not found: {args.db}")
+
+    connection = sqlite3.connect(args.db)
+    scans = 0
+    try:
+        for file_name, method, line, sql in collect_queries():
+            if sql is None:
+                if not args.scans_only:
+                    print(f"{file_name}:{line} {method}\n    (SQL built at runtime, not explained)\n")
+                continue
+            if sql.upper().startswith("PRAGMA"):
+                continue
+
+            try:
+                details = explain(connection, sql)
+            except sqlite3.Error as e:
+                details = [f"ERROR: {e}"]
+
+            has_scan = any(_is_scan(d) for d in details)
+            scans += has_scan
+            if args.scans_only and not has_scan:
+                continue
+
+            print(f"{file_name}:{line} {method}")
+            print(f"    {sql}")
+            for detail in details:
+                print(f"    -> {detail}{'   <-- full scan' if _is_scan(detail) else ''}")
+            print()
+    finally:
+        connection.close()
+
+    print(f"{scans} quer{'y' if scans == 1 else 'ies'} with a full table scan.")
+
+
+if __name__ == "__main__":
+    main()
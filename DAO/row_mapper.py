@@ -0,0 +1,53 @@
+# ==========================================
+# File: row_mapper.py
+# Added in iteration: 5
+# Author: Karl Concha
+#
+# Purpose:
+# Shared mapping from query results to the model classes, replacing the
+# hand-written "Model(row[...], row[...], ...)" blocks in each DAO.
+# - Columns are matched to the model's __slots__ by name, so SELECT column
+#   order does not matter and a new column only needs adding to the model
+# - The column -> argument layout is worked out once per (model, columns)
+#   and reused for every row
+# - Rows are mapped while iterating the cursor, without an intermediate
+#   list of sqlite3.Row objects
+#
+# Notes:
+# - Model __slots__ must list the fields in constructor argument order.
+# - Columns without a matching slot are ignored; slots without a column
+#   fall back to the constructor default.
+# ==========================================
+
+from functools import lru_cache
+from operator import itemgetter
+
+
+@lru_cache(maxsize=None)
+def _row_builder(model_cls, columns):
+    """Returns a function row -> model_cls instance for results with these columns."""
+    fields = model_cls.__slots__
+    if len(fields) > 1 and all(field in columns for field in fields):
+        # itemgetter returns a tuple only for two or more indexes.
+        get = itemgetter(*(columns.index(field) for field in fields))
+        return lambda row: model_cls(*get(row))
+
+    present = [(field, columns.index(field)) for field in fields if field in columns]
+    return lambda row: model_cls(**{field: row[i] for field, i in present})
+
+
+def _columns(cursor):
+    return tuple(column[0] for column in cursor.description)
+
+
+def fetch_all(cursor, model_cls):
+    """Maps the remaining rows of cursor's last query to model_cls objects."""
+    return list(map(_row_builder(model_cls, _columns(cursor)), cursor))
+
+
+def fetch_one(cursor, model_cls):
+    """Maps the next row of cursor's last query to a model_cls object (None when there is none)."""
+    row = cursor.fetchone()
+    if row is None:
+        return None
+    return _row_builder(model_cls, _columns(cursor))(row)
@@ -1,6 +1,6 @@
 # ==========================================
 # File: task_def_dao.py
-# Updated in iteration: 4
+# Updated in iteration: 5
 # Author: Karl Concha
 #
 # #ChatGPT (OpenAI, 2025) – Assisted in structuring CRUD methods for TaskDefDAO
@@ -12,20 +12,25 @@
 # - SQLite Documentation – "Python SQLite3 Module" (https://docs.python.org/3/library/sqlite3.html)
 # - Tutorial adapted: “CRUD Operations using SQLite3 in Python” – GeeksForGeeks
 #   (https://www.geeksforgeeks.org/python-sqlite/)
+#
+# Iteration 5: connections come from the shared manager (db_connection.py).
+# Iteration 5: get_TaskDef_page / get_TaskDef_names for paginated list pages.
 # ==========================================
 
-import sqlite3
+from dao.db_connection import DEFAULT_PAGE_SIZE, BaseDAO, id_batches
+from dao.row_mapper import fetch_all, fetch_one
 from model.task_def import TaskDef
 
 
-class TaskDefDAO:
+# Columns a list page may select or filter on.
+TASK_DEF_COLUMNS = ("TaskDef_ID", "TaskDef_Name", "TaskDef_Description")
 
-    def __init__(self, db_name="rainn.db"):
-        """ Initializes the connection to the SQLite database. """
 
-        self.connection = sqlite3.connect(db_name, check_same_thread=False)
-        self.connection.row_factory = sqlite3.Row
-        self.cursor = self.connection.cursor()
+class TaskDefDAO(BaseDAO):
+
+    def __init__(self, db_name="rainn.db"):
+        """ Uses the shared SQLite connection (see db_connection.py). """
+        super().__init__(db_name)
 
     def add_TaskDef(self, task_def):
         """ Inserts a new TaskDef record into the database. """
@@ -35,7 +40,7 @@ class TaskDefDAO:
                VALUES (?, ?)''',
             (task_def.TaskDef_Name, task_def.TaskDef_Description)
         )
-        self.connection.commit()
+        self.commit()
         task_def.TaskDef_ID = self.cursor.lastrowid
         return task_def
 
@@ -45,30 +50,29 @@ class TaskDefDAO:
         ChatGPT assisted in structuring list comprehension for cleaner mapping. """
 
         self.cursor.execute("SELECT * FROM TaskDef")
-        rows = self.cursor.fetchall()
-        return [
-            TaskDef(
-                row["TaskDef_ID"],
-                row["TaskDef_Name"],
-                row["TaskDef_Description"]
+        return fetch_all(self.cursor, TaskDef)
+
+    def get_TaskDef_page(self, columns=TASK_DEF_COLUMNS, before_id=None, limit=DEFAULT_PAGE_SIZE):
+        """ Keyset page of TaskDefs (newest first). Returns (rows, next before_id). """
+        return self.fetch_page("TaskDef", "TaskDef_ID", columns, TASK_DEF_COLUMNS, None, before_id, limit)
+
+    def get_TaskDef_names(self, TaskDef_IDs):
+        """ Returns {TaskDef_ID: TaskDef_Name} for the given IDs (e.g. the flows on one page). """
+        names = {}
+        for batch, placeholders in id_batches(set(TaskDef_IDs)):
+            self.cursor.execute(
+                f"SELECT TaskDef_ID, TaskDef_Name FROM TaskDef WHERE TaskDef_ID IN ({placeholders})",
+                batch
             )
-            for row in rows
-        ]
+            names.update((row["TaskDef_ID"], row["TaskDef_Name"]) for row in self.cursor.fetchall())
+        return names
 
     def get_TaskDef_by_id(self, TaskDef_ID):
         """ Retrieves a TaskDef record by its ID.
         ChatGPT confirmed use of parameter substitution syntax in SELECT queries. """
 
         self.cursor.execute("SELECT * FROM TaskDef WHERE TaskDef_ID = ?", (TaskDef_ID,))
-        row = self.cursor.fetchone()
-        if row:
-            return TaskDef(
-                row["TaskDef_ID"],
-                row["TaskDef_Name"],
-                row["TaskDef_Description"]
-            )
-        else:
-            return None
+        return fetch_one(self.cursor, TaskDef)
 
     def update_TaskDef(self, task_def):
         """ Updates an existing TaskDef record.
@@ -78,13 +82,10 @@ class TaskDefDAO:
             SET TaskDef_Name = ?, TaskDef_Description = ?
             WHERE TaskDef_ID = ?
         ''', (task_def.TaskDef_Name, task_def.TaskDef_Description, task_def.TaskDef_ID))
-        self.connection.commit()
+        self.commit()
 
     def delete_TaskDef(self, TaskDef_ID):
         """ Deletes a TaskDef record by its ID. """
         self.cursor.execute("DELETE FROM TaskDef WHERE TaskDef_ID = ?", (TaskDef_ID,))
-        self.connection.commit()
+        self.commit()
 
-    def close_connection(self):
-        """ Closes the SQLite database connection. """
-        self.connection.close()
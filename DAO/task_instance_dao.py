@@ -1,6 +1,6 @@
 # ==========================================
 # File: task_instance_dao.py
-# Updated in iteration: 4
+# Updated in iteration: 5
 # Author: Karl Concha
 #
 # Data access layer for TaskInstance persistence.
@@ -9,18 +9,43 @@
 # - Handles CRUD operations for execution runs
 # - Uses SQLite timestamps for Created_At / Updated_At
 # - Keeps logic intentionally simple and transparent
+# - Uses the shared per-thread connection (db_connection.py)
+# - Bulk cleanup methods take an ID list or a cutoff and run one set-based
+#   statement per table, returning the affected IDs
+# - get_task_instance_page is the keyset-paginated list query (BaseDAO.fetch_page)
 # ==========================================
 
-import sqlite3
+from dao.db_connection import DEFAULT_PAGE_SIZE, BaseDAO, id_batches, transaction
+from dao.row_mapper import fetch_all, fetch_one
 from model.task_instance import TaskInstance
 
 
-class TaskInstanceDAO:
+# Columns a list page may select or filter on.
+TASK_INSTANCE_COLUMNS = (
+    "TaskInstance_ID", "Process_ID_FK", "TaskDef_ID_FK", "Status", "Run_Folder",
+    "Last_Accessed_At", "Expires_At", "Deleted_At", "Downloaded_At",
+    "Created_At", "Updated_At", "Parent_TaskInstance_ID_FK"
+)
+
+# An expired run the cleanup may delete: live, past its expiry, not running and
+# not a child of a batch that is still running. Binds the current time.
+_EXPIRED_CONDITION = """
+    Deleted_At IS NULL
+    AND Expires_At IS NOT NULL
+    AND Expires_At < ?
+    AND Status != 'RUNNING'
+    AND NOT EXISTS (
+        SELECT 1 FROM TaskInstance AS parent
+        WHERE parent.TaskInstance_ID = TaskInstance.Parent_TaskInstance_ID_FK
+          AND parent.Status = 'RUNNING'
+    )
+"""
+
+
+class TaskInstanceDAO(BaseDAO):
 
     def __init__(self, db_name="rainn.db"):
-        self.connection = sqlite3.connect(db_name, check_same_thread=False)
-        self.connection.row_factory = sqlite3.Row
-        self.cursor = self.connection.cursor()
+        super().__init__(db_name)
 
     def create_task_instance(self, task_instance: TaskInstance):
         """Creates a new TaskInstance row and returns its ID."""
@@ -28,8 +53,9 @@ class TaskInstanceDAO:
             """
             INSERT INTO TaskInstance
                 (Process_ID_FK, TaskDef_ID_FK, Status, Run_Folder,
-                 Last_Accessed_At, Expires_At, Deleted_At, Downloaded_At)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                 Last_Accessed_At, Expires_At, Deleted_At, Downloaded_At,
+                 Parent_TaskInstance_ID_FK)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
             """,
             (
                 task_instance.Process_ID_FK,
@@ -39,10 +65,11 @@ class TaskInstanceDAO:
                 task_instance.Last_Accessed_At,
                 task_instance.Expires_At,
                 task_instance.Deleted_At,
-                task_instance.Downloaded_At
+                task_instance.Downloaded_At,
+                task_instance.Parent_TaskInstance_ID_FK
             )
         )
-        self.connection.commit()
+        self.commit()
         return self.cursor.lastrowid
 
     def get_task_instance_by_id(self, task_instance_id):
@@ -51,23 +78,7 @@ class TaskInstanceDAO:
             "SELECT * FROM TaskInstance WHERE TaskInstance_ID = ?",
             (task_instance_id,)
         )
-        row = self.cursor.fetchone()
-        if not row:
-            return None
-
-        return TaskInstance(
-            row["TaskInstance_ID"],
-            row["Process_ID_FK"],
-            row["TaskDef_ID_FK"],
-            row["Status"],
-            row["Run_Folder"],
-            row["Last_Accessed_At"],
-            row["Expires_At"],
-            row["Deleted_At"],
-            row["Downloaded_At"],
-            row["Created_At"],
-            row["Updated_At"]
-        )
+        return fetch_one(self.cursor, TaskInstance)
 
     def update_status(self, task_instance_id, status):
         """Updates execution status and timestamp."""
@@ -79,7 +90,7 @@ class TaskInstanceDAO:
             """,
             (status, task_instance_id)
         )
-        self.connection.commit()
+        self.commit()
 
     def update_run_folder(self, task_instance_id, run_folder):
         """Persists the filesystem run folder path."""
@@ -91,7 +102,7 @@ class TaskInstanceDAO:
             """,
             (run_folder, task_instance_id)
         )
-        self.connection.commit()
+        self.commit()
 
     def touch_access(self, task_instance_id, last_accessed_at, expires_at):
         """Updates access timestamps and extends expiry."""
@@ -103,7 +114,7 @@ class TaskInstanceDAO:
             """,
             (last_accessed_at, expires_at, task_instance_id)
         )
-        self.connection.commit()
+        self.commit()
 
     def mark_downloaded(self, task_instance_id, downloaded_at, expires_at):
         """Marks a run as downloaded and extends expiry."""
@@ -115,7 +126,7 @@ class TaskInstanceDAO:
             """,
             (downloaded_at, downloaded_at, expires_at, task_instance_id)
         )
-        self.connection.commit()
+        self.commit()
 
     def mark_deleted(self, task_instance_id, deleted_at):
         """Marks a run as deleted and clears run folder pointer."""
@@ -127,65 +138,129 @@ class TaskInstanceDAO:
             """,
             (deleted_at, task_instance_id)
         )
-        self.connection.commit()
+        self.commit()
+
+    def mark_deleted_many(self, task_instance_ids, deleted_at):
+        """Marks several runs as deleted with one set-based UPDATE. Returns the IDs."""
+        task_instance_ids = list(task_instance_ids)
+        with transaction(self.db_name):
+            for batch, placeholders in id_batches(task_instance_ids):
+                self.cursor.execute(
+                    f"""
+                    UPDATE TaskInstance
+                    SET Deleted_At = ?, Run_Folder = '', Updated_At = CURRENT_TIMESTAMP
+                    WHERE TaskInstance_ID IN ({placeholders})
+                    """,
+                    (deleted_at, *batch)
+                )
+        return task_instance_ids
+
+    def mark_expired_deleted(self, task_instance_ids, now_str, deleted_at):
+        """
+        Marks the given runs deleted, but only those that are still expired at now_str
+        (re-checked under the write lock, so a run viewed or resumed since it was
+        selected is kept). Returns the IDs actually marked.
+        """
+        task_instance_ids = list(task_instance_ids)
+        expired_ids = []
+        with transaction(self.db_name):
+            self.begin_write()
+            for batch, placeholders in id_batches(task_instance_ids):
+                self.cursor.execute(
+                    f"""
+                    SELECT TaskInstance_ID FROM TaskInstance
+                    WHERE TaskInstance_ID IN ({placeholders})
+                      AND {_EXPIRED_CONDITION}
+                    """,
+                    (*batch, now_str)
+                )
+                expired_ids.extend(row["TaskInstance_ID"] for row in self.cursor.fetchall())
+            self.mark_deleted_many(expired_ids, deleted_at)
+        return expired_ids
+
+    def fail_running_task_instances(self, last_accessed_at, expires_at):
+        """
+        Marks every RUNNING, not deleted TaskInstance FAILED with a fresh expiry
+        (runs interrupted by a restart). Returns their IDs.
+        """
+        with transaction(self.db_name):
+            self.begin_write()
+            self.cursor.execute(
+                """
+                SELECT TaskInstance_ID FROM TaskInstance
+                WHERE Status = 'RUNNING' AND Deleted_At IS NULL
+                """
+            )
+            task_instance_ids = [row["TaskInstance_ID"] for row in self.cursor.fetchall()]
+            for batch, placeholders in id_batches(task_instance_ids):
+                self.cursor.execute(
+                    f"""
+                    UPDATE TaskInstance
+                    SET Status = 'FAILED', Last_Accessed_At = ?, Expires_At = ?,
+                        Updated_At = CURRENT_TIMESTAMP
+                    WHERE TaskInstance_ID IN ({placeholders})
+                    """,
+                    (last_accessed_at, expires_at, *batch)
+                )
+        return task_instance_ids
 
-    def get_expired_task_instances(self, now_str):
-        """Returns TaskInstances that have expired and are not deleted."""
+    def get_expired_task_instances(self, now_str, limit=None):
+        """
+        Returns TaskInstances that have expired and are not deleted (at most limit,
+        oldest expiry first). Running runs and children of a running batch are skipped.
+        """
         self.cursor.execute(
-            """
+            f"""
             SELECT * FROM TaskInstance
-            WHERE Deleted_At IS NULL
-              AND Expires_At IS NOT NULL
-              AND Expires_At < ?
-              AND Status != 'RUNNING'
+            WHERE {_EXPIRED_CONDITION}
+            ORDER BY Expires_At
+            LIMIT ?
             """,
-            (now_str,)
+            (now_str, -1 if limit is None else limit)
         )
-        rows = self.cursor.fetchall()
-        return [
-            TaskInstance(
-                row["TaskInstance_ID"],
-                row["Process_ID_FK"],
-                row["TaskDef_ID_FK"],
-                row["Status"],
-                row["Run_Folder"],
-                row["Last_Accessed_At"],
-                row["Expires_At"],
-                row["Deleted_At"],
-                row["Downloaded_At"],
-                row["Created_At"],
-                row["Updated_At"]
-            )
-            for row in rows
-        ]
+        return fetch_all(self.cursor, TaskInstance)
+
+    def get_expired_task_instance_ids(self, now_str, limit=None):
+        """
+        Returns the IDs of expired, not deleted TaskInstances (at most limit, oldest
+        expiry first). Running runs and children of a running batch are skipped.
+        """
+        self.cursor.execute(
+            f"""
+            SELECT TaskInstance_ID FROM TaskInstance
+            WHERE {_EXPIRED_CONDITION}
+            ORDER BY Expires_At
+            LIMIT ?
+            """,
+            (now_str, -1 if limit is None else limit)
+        )
+        return [row["TaskInstance_ID"] for row in self.cursor.fetchall()]
 
-    def get_deleted_task_instances_before(self, cutoff_str):
-        """Returns TaskInstances deleted before the cutoff."""
+    def get_deleted_task_instances_before(self, cutoff_str, limit=None):
+        """Returns TaskInstances deleted before the cutoff (at most limit, oldest first)."""
         self.cursor.execute(
             """
             SELECT * FROM TaskInstance
             WHERE Deleted_At IS NOT NULL
               AND Deleted_At < ?
+            ORDER BY Deleted_At
+            LIMIT ?
             """,
-            (cutoff_str,)
+            (cutoff_str, -1 if limit is None else limit)
         )
-        rows = self.cursor.fetchall()
-        return [
-            TaskInstance(
-                row["TaskInstance_ID"],
-                row["Process_ID_FK"],
-                row["TaskDef_ID_FK"],
-                row["Status"],
-                row["Run_Folder"],
-                row["Last_Accessed_At"],
-                row["Expires_At"],
-                row["Deleted_At"],
-                row["Downloaded_At"],
-                row["Created_At"],
-                row["Updated_At"]
-            )
-            for row in rows
-        ]
+        return fetch_all(self.cursor, TaskInstance)
+
+    def get_child_task_instances(self, parent_task_instance_id):
+        """Returns the per-file TaskInstances of a batch run (oldest first)."""
+        self.cursor.execute(
+            """
+            SELECT * FROM TaskInstance
+            WHERE Parent_TaskInstance_ID_FK = ?
+            ORDER BY TaskInstance_ID ASC
+            """,
+            (parent_task_instance_id,)
+        )
+        return fetch_all(self.cursor, TaskInstance)
 
     def delete_task_instance(self, task_instance_id):
         """Hard deletes a TaskInstance row."""
@@ -193,31 +268,57 @@ class TaskInstanceDAO:
             "DELETE FROM TaskInstance WHERE TaskInstance_ID = ?",
             (task_instance_id,)
         )
-        self.connection.commit()
+        self.commit()
+
+    def delete_task_instances(self, task_instance_ids):
+        """Hard deletes several TaskInstance rows with one set-based DELETE. Returns the IDs."""
+        task_instance_ids = list(task_instance_ids)
+        with transaction(self.db_name):
+            for batch, placeholders in id_batches(task_instance_ids):
+                self.cursor.execute(
+                    f"DELETE FROM TaskInstance WHERE TaskInstance_ID IN ({placeholders})",
+                    batch
+                )
+        return task_instance_ids
+
+    def delete_deleted_before(self, cutoff_str, limit=None):
+        """
+        Hard deletes TaskInstances deleted before the cutoff (at most limit,
+        oldest first) and returns their IDs, so callers can remove dependent rows
+        in the same transaction.
+        """
+        with transaction(self.db_name):
+            self.begin_write()
+            self.cursor.execute(
+                """
+                SELECT TaskInstance_ID FROM TaskInstance
+                WHERE Deleted_At IS NOT NULL
+                  AND Deleted_At < ?
+                ORDER BY Deleted_At
+                LIMIT ?
+                """,
+                (cutoff_str, -1 if limit is None else limit)
+            )
+            task_instance_ids = [row["TaskInstance_ID"] for row in self.cursor.fetchall()]
+            self.delete_task_instances(task_instance_ids)
+        return task_instance_ids
+
+    def get_task_instance_page(self, columns=TASK_INSTANCE_COLUMNS, before_id=None,
+                               limit=DEFAULT_PAGE_SIZE, status=None, process_id=None):
+        """
+        Keyset page of TaskInstances (newest first, IDs below before_id),
+        optionally filtered by Status / Process_ID_FK. Returns (rows, next before_id).
+        """
+        return self.fetch_page(
+            "TaskInstance", "TaskInstance_ID", columns, TASK_INSTANCE_COLUMNS,
+            {"Status": status, "Process_ID_FK": process_id},
+            before_id, limit
+        )
 
     def get_all_task_instances(self):
         """Returns all TaskInstances (newest first)."""
         self.cursor.execute(
             "SELECT * FROM TaskInstance ORDER BY TaskInstance_ID DESC"
         )
-        rows = self.cursor.fetchall()
-
-        return [
-            TaskInstance(
-                row["TaskInstance_ID"],
-                row["Process_ID_FK"],
-                row["TaskDef_ID_FK"],
-                row["Status"],
-                row["Run_Folder"],
-                row["Last_Accessed_At"],
-                row["Expires_At"],
-                row["Deleted_At"],
-                row["Downloaded_At"],
-                row["Created_At"],
-                row["Updated_At"]
-            )
-            for row in rows
-        ]
+        return fetch_all(self.cursor, TaskInstance)
 
-    def close_connection(self):
-        self.connection.close()
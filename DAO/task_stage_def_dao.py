@@ -1,6 +1,6 @@
 # ==========================================
 # File: task_stage_def_dao.py
-# Updated in iteration: 4
+# Updated in iteration: 5
 # Author: Karl Concha
 #
 # #ChatGPT (OpenAI, 2025) – Assisted in structuring CRUD methods for TaskStageDefDAO
@@ -12,33 +12,45 @@
 # - SQLite Documentation – "Python SQLite3 Module" (https://docs.python.org/3/library/sqlite3.html)
 # - Tutorial adapted: “CRUD Operations using SQLite3 in Python” – GeeksForGeeks
 #   (https://www.geeksforgeeks.org/python-sqlite/)
+#
+# Iteration 5: connections come from the shared manager (db_connection.py).
+# Iteration 5: get_TaskStageDef_page (keyset-paginated list with column projection).
 # ==========================================
 
-import sqlite3
+from dao.db_connection import DEFAULT_PAGE_SIZE, BaseDAO
+from dao.row_mapper import fetch_all, fetch_one
 from model.task_stage_def import TaskStageDef
 
 
-class TaskStageDefDAO:
+# Columns a list page may select or filter on.
+TASK_STAGE_DEF_COLUMNS = (
+    "TaskStageDef_ID", "TaskDef_ID_FK", "TaskStageDef_Type", "TaskStageDef_Description",
+    "TaskStageDef_Depends_On", "TaskStageDef_Chunk_Tokens", "TaskStageDef_Include_Input"
+)
 
-    def __init__(self, db_name="rainn.db"):
-        """ Initializes the connection to the SQLite database. """
 
-        self.connection = sqlite3.connect(db_name, check_same_thread=False)
-        self.connection.row_factory = sqlite3.Row
-        self.cursor = self.connection.cursor()
+class TaskStageDefDAO(BaseDAO):
+
+    def __init__(self, db_name="rainn.db"):
+        """ Uses the shared SQLite connection (see db_connection.py). """
+        super().__init__(db_name)
 
     def add_TaskStageDef(self, stage_def):
         """ Inserts a new TaskStageDef record into the database. """
 
         self.cursor.execute(
             '''INSERT INTO TaskStageDef (
-                TaskDef_ID_FK, TaskStageDef_Type, TaskStageDef_Description)
-               VALUES (?, ?, ?)''',
+                TaskDef_ID_FK, TaskStageDef_Type, TaskStageDef_Description, TaskStageDef_Depends_On,
+                TaskStageDef_Chunk_Tokens, TaskStageDef_Include_Input)
+               VALUES (?, ?, ?, ?, ?, ?)''',
             (stage_def.TaskDef_ID_FK,
              stage_def.TaskStageDef_Type,
-             stage_def.TaskStageDef_Description)
+             stage_def.TaskStageDef_Description,
+             stage_def.TaskStageDef_Depends_On,
+             stage_def.TaskStageDef_Chunk_Tokens,
+             stage_def.TaskStageDef_Include_Input)
         )
-        self.connection.commit()
+        self.commit()
 
     def get_all_TaskStageDefs(self):
         """ Retrieves all TaskStageDef records from the database.
@@ -46,16 +58,7 @@ class TaskStageDefDAO:
         ChatGPT assisted in list comprehension for object mapping. """
 
         self.cursor.execute("SELECT * FROM TaskStageDef")
-        rows = self.cursor.fetchall()
-        return [
-            TaskStageDef(
-                row["TaskStageDef_ID"],
-                row["TaskDef_ID_FK"],
-                row["TaskStageDef_Type"],
-                row["TaskStageDef_Description"]
-            )
-            for row in rows
-        ]
+        return fetch_all(self.cursor, TaskStageDef)
 
     def get_TaskStageDefs_for_task(self, taskdef_id):
         """Returns all TaskStageDefs for a given TaskDef_ID_FK."""
@@ -63,18 +66,17 @@ class TaskStageDefDAO:
             "SELECT * FROM TaskStageDef WHERE TaskDef_ID_FK = ?",
             (taskdef_id,)
         )
-        rows = self.cursor.fetchall()
-
         # A list must be returned for templates that loop over stages.
-        return [
-            TaskStageDef(
-                r["TaskStageDef_ID"],
-                r["TaskDef_ID_FK"],
-                r["TaskStageDef_Type"],
-                r["TaskStageDef_Description"]
-            )
-            for r in rows
-        ]
+        return fetch_all(self.cursor, TaskStageDef)
+
+    def get_TaskStageDef_page(self, columns=TASK_STAGE_DEF_COLUMNS, before_id=None,
+                              limit=DEFAULT_PAGE_SIZE, taskdef_id=None):
+        """ Keyset page of TaskStageDefs (newest first, optionally one TaskDef's). Returns (rows, next before_id). """
+        return self.fetch_page(
+            "TaskStageDef", "TaskStageDef_ID", columns, TASK_STAGE_DEF_COLUMNS,
+            {"TaskDef_ID_FK": taskdef_id},
+            before_id, limit
+        )
 
     def get_TaskStageDef_by_id(self, stage_id):
         """Returns a single TaskStageDef by TaskStageDef_ID."""
@@ -82,15 +84,7 @@ class TaskStageDefDAO:
             "SELECT * FROM TaskStageDef WHERE TaskStageDef_ID = ?",
             (stage_id,)
         )
-        row = self.cursor.fetchone()
-        if not row:
-            return None
-        return TaskStageDef(
-            row["TaskStageDef_ID"],
-            row["TaskDef_ID_FK"],
-            row["TaskStageDef_Type"],
-            row["TaskStageDef_Description"]
-        )
+        return fetch_one(self.cursor, TaskStageDef)
 
 
     def update_TaskStageDef(self, stage_def):
@@ -98,13 +92,18 @@ class TaskStageDefDAO:
 
         self.cursor.execute('''
             UPDATE TaskStageDef
-            SET TaskDef_ID_FK = ?, TaskStageDef_Type = ?, TaskStageDef_Description = ?
+            SET TaskDef_ID_FK = ?, TaskStageDef_Type = ?, TaskStageDef_Description = ?,
+                TaskStageDef_Depends_On = ?, TaskStageDef_Chunk_Tokens = ?,
+                TaskStageDef_Include_Input = ?
             WHERE TaskStageDef_ID = ?
         ''', (stage_def.TaskDef_ID_FK,
               stage_def.TaskStageDef_Type,
               stage_def.TaskStageDef_Description,
+              stage_def.TaskStageDef_Depends_On,
+              stage_def.TaskStageDef_Chunk_Tokens,
+              stage_def.TaskStageDef_Include_Input,
               stage_def.TaskStageDef_ID))
-        self.connection.commit()
+        self.commit()
 
     def delete_TaskStageDef(self, TaskStageDef_ID):
         """ Deletes a TaskStageDef record by its ID. """
@@ -113,8 +112,5 @@ class TaskStageDefDAO:
             "DELETE FROM TaskStageDef WHERE TaskStageDef_ID = ?",
             (TaskStageDef_ID,)
         )
-        self.connection.commit()
+        self.commit()
 
-    def close_connection(self):
-        """ Closes the SQLite database connection. """
-        self.connection.close()
@@ -1,6 +1,6 @@
 # ==========================================
 # File: task_stage_instance_dao.py
-# Updated in iteration: 4
+# Updated in iteration: 5
 # Author: Karl Concha
 #
 # Purpose:
@@ -10,18 +10,28 @@
 # - One row per stage execution
 # - Stores output artifact paths and error messages
 # - Stage ordering is enforced via Stage_Order
+# - Uses the shared per-thread connection (db_connection.py)
+# - create_pending_stage_instances pre-creates a run's stage rows in one INSERT
+# - Bulk cleanup methods take an ID list and run one set-based statement
+# - get_stage_instance_page is the keyset-paginated list query (BaseDAO.fetch_page)
 # ==========================================
 
-import sqlite3
+from dao.db_connection import DEFAULT_PAGE_SIZE, BaseDAO, id_batches, transaction
+from dao.row_mapper import fetch_all
 from model.task_stage_instance import TaskStageInstance
 
 
-class TaskStageInstanceDAO:
+# Columns a list page may select or filter on.
+TASK_STAGE_INSTANCE_COLUMNS = (
+    "TaskStageInstance_ID", "TaskInstance_ID_FK", "Stage_Order", "Stage_Name", "Status",
+    "Output_Artifact_Path", "Started_At", "Ended_At", "Error_Message", "Prompt_Tokens"
+)
+
+
+class TaskStageInstanceDAO(BaseDAO):
 
     def __init__(self, db_name="rainn.db"):
-        self.connection = sqlite3.connect(db_name, check_same_thread=False)
-        self.connection.row_factory = sqlite3.Row
-        self.cursor = self.connection.cursor()
+        super().__init__(db_name)
 
     def create_stage_instance(self, stage_instance: TaskStageInstance):
         """Creates a TaskStageInstance row and returns its ID."""
@@ -40,36 +50,114 @@ class TaskStageInstanceDAO:
                 stage_instance.Output_Artifact_Path
             )
         )
-        self.connection.commit()
+        self.commit()
         return self.cursor.lastrowid
 
-    def mark_completed(self, stage_instance_id, output_artifact_path):
-        """Marks a stage as completed and records its output artifact."""
+    def create_pending_stage_instances(self, task_instance_id_fk, stages):
+        """
+        Creates PENDING rows for [(stage_order, stage_name), ...] with a single INSERT.
+        Returns {stage_order: TaskStageInstance_ID}.
+        """
+        if not stages:
+            return {}
+        placeholders = ", ".join("(?, ?, ?, 'PENDING')" for _ in stages)
+        params = []
+        for stage_order, stage_name in stages:
+            params.extend((task_instance_id_fk, stage_order, stage_name))
+
+        with transaction(self.db_name):
+            self.cursor.execute(
+                f"""
+                INSERT INTO TaskStageInstance
+                    (TaskInstance_ID_FK, Stage_Order, Stage_Name, Status)
+                VALUES {placeholders}
+                """,
+                params
+            )
+            # The rows were inserted by this statement, so their IDs are the last len(stages) IDs.
+            last_id = self.cursor.lastrowid
+            self.cursor.execute(
+                """
+                SELECT TaskStageInstance_ID, Stage_Order FROM TaskStageInstance
+                WHERE TaskInstance_ID_FK = ? AND TaskStageInstance_ID > ?
+                """,
+                (task_instance_id_fk, last_id - len(stages))
+            )
+            return {r["Stage_Order"]: r["TaskStageInstance_ID"] for r in self.cursor.fetchall()}
+
+    def mark_running(self, stage_instance_id):
+        """Moves a PENDING stage to RUNNING and records its start time."""
+        self.cursor.execute(
+            """
+            UPDATE TaskStageInstance
+            SET Status = 'RUNNING',
+                Started_At = CURRENT_TIMESTAMP
+            WHERE TaskStageInstance_ID = ?
+            """,
+            (stage_instance_id,)
+        )
+        self.commit()
+
+    def mark_completed(self, stage_instance_id, output_artifact_path, prompt_tokens=None):
+        """Marks a stage as completed and records its output artifact (and prompt size)."""
         self.cursor.execute(
             """
             UPDATE TaskStageInstance
             SET Status = 'COMPLETED',
                 Output_Artifact_Path = ?,
+                Prompt_Tokens = COALESCE(?, Prompt_Tokens),
                 Ended_At = CURRENT_TIMESTAMP
             WHERE TaskStageInstance_ID = ?
             """,
-            (output_artifact_path, stage_instance_id)
+            (output_artifact_path, prompt_tokens, stage_instance_id)
         )
-        self.connection.commit()
+        self.commit()
 
-    def mark_failed(self, stage_instance_id, error_message):
-        """Marks a stage as failed and stores the error message."""
+    def mark_failed(self, stage_instance_id, error_message, prompt_tokens=None):
+        """Marks a stage as failed and stores the error message (and prompt size)."""
         self.cursor.execute(
             """
             UPDATE TaskStageInstance
             SET Status = 'FAILED',
                 Error_Message = ?,
+                Prompt_Tokens = COALESCE(?, Prompt_Tokens),
                 Ended_At = CURRENT_TIMESTAMP
             WHERE TaskStageInstance_ID = ?
             """,
-            (error_message, stage_instance_id)
+            (error_message, prompt_tokens, stage_instance_id)
         )
-        self.connection.commit()
+        self.commit()
+
+    def mark_failed_many(self, stage_instance_ids, error_message):
+        """Marks several stages as failed with one set-based UPDATE (stages that never ran)."""
+        with transaction(self.db_name):
+            for batch, placeholders in id_batches(stage_instance_ids):
+                self.cursor.execute(
+                    f"""
+                    UPDATE TaskStageInstance
+                    SET Status = 'FAILED',
+                        Error_Message = ?,
+                        Ended_At = CURRENT_TIMESTAMP
+                    WHERE TaskStageInstance_ID IN ({placeholders})
+                    """,
+                    (error_message, *batch)
+                )
+
+    def fail_unfinished_for_task_instances(self, task_instance_ids, error_message):
+        """Marks the RUNNING / PENDING stages of several TaskInstances FAILED with one set-based UPDATE."""
+        with transaction(self.db_name):
+            for batch, placeholders in id_batches(task_instance_ids):
+                self.cursor.execute(
+                    f"""
+                    UPDATE TaskStageInstance
+                    SET Status = 'FAILED',
+                        Error_Message = ?,
+                        Ended_At = CURRENT_TIMESTAMP
+                    WHERE TaskInstance_ID_FK IN ({placeholders})
+                      AND Status IN ('RUNNING', 'PENDING')
+                    """,
+                    (error_message, *batch)
+                )
 
     def get_stages_for_task_instance(self, task_instance_id_fk):
         """Returns all stage executions for a TaskInstance."""
@@ -81,44 +169,26 @@ class TaskStageInstanceDAO:
             """,
             (task_instance_id_fk,)
         )
-        rows = self.cursor.fetchall()
-
-        return [
-            TaskStageInstance(
-                r["TaskStageInstance_ID"],
-                r["TaskInstance_ID_FK"],
-                r["Stage_Order"],
-                r["Stage_Name"],
-                r["Status"],
-                r["Output_Artifact_Path"],
-                r["Started_At"],
-                r["Ended_At"],
-                r["Error_Message"]
-            )
-            for r in rows
-        ]
+        return fetch_all(self.cursor, TaskStageInstance)
+
+    def get_stage_instance_page(self, columns=TASK_STAGE_INSTANCE_COLUMNS, before_id=None,
+                                limit=DEFAULT_PAGE_SIZE, task_instance_id=None, status=None):
+        """
+        Keyset page of TaskStageInstances (newest first, IDs below before_id),
+        optionally filtered by run / Status. Returns (rows, next before_id).
+        """
+        return self.fetch_page(
+            "TaskStageInstance", "TaskStageInstance_ID", columns, TASK_STAGE_INSTANCE_COLUMNS,
+            {"TaskInstance_ID_FK": task_instance_id, "Status": status},
+            before_id, limit
+        )
 
     def get_all_stage_instances(self):
         """Returns all TaskStageInstances (newest first)."""
         self.cursor.execute(
             "SELECT * FROM TaskStageInstance ORDER BY TaskStageInstance_ID DESC"
         )
-        rows = self.cursor.fetchall()
-
-        return [
-            TaskStageInstance(
-                row["TaskStageInstance_ID"],
-                row["TaskInstance_ID_FK"],
-                row["Stage_Order"],
-                row["Stage_Name"],
-                row["Status"],
-                row["Output_Artifact_Path"],
-                row["Started_At"],
-                row["Ended_At"],
-                row["Error_Message"]
-            )
-            for row in rows
-        ]
+        return fetch_all(self.cursor, TaskStageInstance)
 
     def clear_outputs_for_task_instance(self, task_instance_id_fk):
         """Clears output paths and error messages for a TaskInstance."""
@@ -131,7 +201,7 @@ class TaskStageInstanceDAO:
             """,
             (task_instance_id_fk,)
         )
-        self.connection.commit()
+        self.commit()
 
     def delete_for_task_instance(self, task_instance_id_fk):
         """Hard deletes TaskStageInstance rows for a TaskInstance."""
@@ -139,7 +209,36 @@ class TaskStageInstanceDAO:
             "DELETE FROM TaskStageInstance WHERE TaskInstance_ID_FK = ?",
             (task_instance_id_fk,)
         )
-        self.connection.commit()
+        self.commit()
+
+    def clear_outputs_for_task_instances(self, task_instance_ids):
+        """Clears output paths and error messages for several TaskInstances with one set-based UPDATE."""
+        with transaction(self.db_name):
+            for batch, placeholders in id_batches(task_instance_ids):
+                self.cursor.execute(
+                    f"""
+                    UPDATE TaskStageInstance
+                    SET Output_Artifact_Path = NULL,
+                        Error_Message = NULL
+                    WHERE TaskInstance_ID_FK IN ({placeholders})
+                    """,
+                    batch
+                )
+
+    def delete_for_task_instances(self, task_instance_ids):
+        """Hard deletes TaskStageInstance rows for several TaskInstances with one set-based DELETE."""
+        with transaction(self.db_name):
+            for batch, placeholders in id_batches(task_instance_ids):
+                self.cursor.execute(
+                    f"DELETE FROM TaskStageInstance WHERE TaskInstance_ID_FK IN ({placeholders})",
+                    batch
+                )
+
+    def delete_stage_instances(self, stage_instance_ids):
+        """Hard deletes specific TaskStageInstance rows (stages re-executed by a resume)."""
+        self.cursor.executemany(
+            "DELETE FROM TaskStageInstance WHERE TaskStageInstance_ID = ?",
+            [(stage_instance_id,) for stage_instance_id in stage_instance_ids]
+        )
+        self.commit()
 
-    def close_connection(self):
-        self.connection.close()
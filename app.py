@@ -1,6 +1,6 @@
 # ==========================================
 # File: app.py
-# Updated in iteration: 4
+# Updated in iteration: 5
 # Author: Karl Concha
 #
 # Purpose:
@@ -15,6 +15,25 @@
 # - Added flow import/export endpoints for reusable agent definitions.
 # - Import now redirects back to My Flows with success/error messaging.
 #
+# Iteration 5 Notes:
+# - Runs are queued on a background RunQueue; the viewer polls run status.
+# - Stage output is streamed to the viewer over Server-Sent Events (short,
+#   resumable windows; chunks are tagged with their stage order).
+# - Batch mode runs each uploaded file as its own child run; a flow stage
+#   named "reduce" then merges the child outputs on the parent run.
+# - Failed runs can be resumed from the failed stage (/resume_run/<id>).
+# - RUN_QUEUE_MODE selects thread workers or a single asyncio event loop.
+# - Flows can use a compact prompt mode; run views show per-stage prompt sizes.
+# - Pending schema migrations (dao/migrations.py) are applied at startup.
+# - Privacy cleanup runs on a background RunReaper thread, not per request.
+# - Runs left RUNNING by a restart are marked FAILED at startup (resumable).
+# - DbView and the flow list page through rows with keyset pagination.
+# - Runs and the runner page read flows from the flow definition cache.
+# - Uploads are copied to disk in chunks (never read whole into memory).
+# - Flows choose how CSV uploads reach Stage 0: full rows, summary or sample.
+# - Previews read only the head of each artifact (ArtifactStore); run
+#   downloads are zipped into a temp file instead of an in-memory buffer.
+#
 # #ChatGPT (OpenAI, 2025) – Assisted in refactoring Flask routing
 # to use modular DAO + Service layers following supervisor
 # feedback. Updated naming (Pipeline → Process) to match
@@ -23,7 +42,8 @@
 # Date: January 2026
 # ==========================================
 
-from flask import Flask, render_template, request, redirect, url_for, send_file, abort
+from flask import Flask, render_template, request, redirect, url_for, send_file, abort, jsonify, Response
+import codecs
 import json
 import io
 import os
@@ -39,9 +59,17 @@ from service.task_def_service import TaskDefService
 from service.task_stage_def_service import TaskStageService
 from service.process.agent_process_service import AgentProcessService
 from service.process.agent_runtime_service import AgentRuntime
+from service.process.artifact_store import ArtifactStore
+from service.process.run_queue_service import AsyncRunQueue, RunQueue
+from service.process.run_reaper_service import RunReaper
 from service.task_instance_service import TaskInstanceService
 from service.task_stage_instance_service import TaskStageInstanceService
 from service.flow.flow_exchange_service import FlowExchangeService
+from service.flow.prompt_compiler import PROMPT_MODE_FULL, PROMPT_MODES
+from task_logic.csv_table import CSV_INPUT_FULL, CSV_INPUT_MODES
+from service.integrations.model_client_ollama import get_shared_session
+from dao.db_connection import transaction
+from dao.migrations import migrate
 
 
 # ==========================================
@@ -49,6 +77,9 @@ from service.flow.flow_exchange_service import FlowExchangeService
 # ==========================================
 app = Flask(__name__)
 
+# Iteration 5: bring rainn.db up to the latest schema version (no-op when current).
+migrate()
+
 taskdef_service = TaskDefService()
 stage_service = TaskStageService()
 process_service = AgentProcessService()
@@ -59,11 +90,40 @@ task_instance = TaskInstanceService()
 task_stage_instance = TaskStageInstanceService()
 flow_exchange = FlowExchangeService()
 
+# Iteration 5: queued runs only live in memory, so runs left RUNNING by a previous
+# process can never finish. Fail them (and their unfinished stages) before the
+# queue starts, so they can be resumed or reaped like any other failed run.
+INTERRUPTED_STAGE_MESSAGE = "not run: the server restarted before this stage finished"
+with transaction():
+    interrupted_run_ids = task_instance.fail_interrupted_runs()
+    task_stage_instance.fail_unfinished_stages(interrupted_run_ids, INTERRUPTED_STAGE_MESSAGE)
+
+# Iteration 5: runs execute on background workers instead of the request thread.
+# RUN_QUEUE_MODE "asyncio" runs them on one event loop instead (needs httpx),
+# for many concurrent runs that mostly wait on the model server.
+RUN_QUEUE_MODE = "threads"
+RUN_QUEUE_WORKERS = 4
+ASYNC_MAX_RUNS = 256
+if RUN_QUEUE_MODE == "asyncio":
+    run_queue = AsyncRunQueue(max_runs=ASYNC_MAX_RUNS, sync_workers=RUN_QUEUE_WORKERS)
+else:
+    run_queue = RunQueue(max_workers=RUN_QUEUE_WORKERS)
+
+# Shared keep-alive connection pool for all Ollama calls (sized for the run workers)
+OLLAMA_POOL_SIZE = 16
+get_shared_session(pool_size=OLLAMA_POOL_SIZE)
+
 RUN_TTL_SECONDS = 15 * 60
 CLEANUP_INTERVAL_SECONDS = 60
 RECEIPT_RETENTION_SECONDS = 6 * 60 * 60
 RECEIPT_RETENTION_HOURS = RECEIPT_RETENTION_SECONDS // 3600
-_last_cleanup_at = 0
+CLEANUP_BATCH_SIZE = 100
+LIST_PAGE_SIZE = 50
+CLEANUP_FOLDER_DELETES_PER_SECOND = 20
+RUN_STREAM_POLL_SECONDS = 0.25
+RUN_STREAM_WINDOW_SECONDS = 20
+RUN_STREAM_RETRY_MS = 1000
+UPLOAD_CHUNK_BYTES = 1024 * 1024
 
 
 def _safe_run_folder(task_instance_id):
@@ -82,27 +142,15 @@ def _cleanup_task_instance(task_instance_id):
     task_instance.mark_deleted(task_instance_id)
 
 
-def _cleanup_expired_runs():
-    expired = task_instance.get_expired_task_instances()
-    for ti in expired:
-        _cleanup_task_instance(ti.TaskInstance_ID)
-
-def _purge_old_receipts():
-    old_receipts = task_instance.get_deleted_before(RECEIPT_RETENTION_SECONDS)
-    for ti in old_receipts:
-        task_stage_instance.delete_for_task_instance(ti.TaskInstance_ID)
-        task_instance.hard_delete(ti.TaskInstance_ID)
-
-
-@app.before_request
-def _privacy_cleanup_guard():
-    global _last_cleanup_at
-    now = time.time()
-    if now - _last_cleanup_at < CLEANUP_INTERVAL_SECONDS:
-        return
-    _last_cleanup_at = now
-    _cleanup_expired_runs()
-    _purge_old_receipts()
+# Iteration 5: expired runs and old receipts are cleaned up by a background
+# reaper thread on its own schedule, instead of inside a user request.
+run_reaper = RunReaper(
+    interval_seconds=CLEANUP_INTERVAL_SECONDS,
+    receipt_retention_seconds=RECEIPT_RETENTION_SECONDS,
+    batch_size=CLEANUP_BATCH_SIZE,
+    folder_deletes_per_second=CLEANUP_FOLDER_DELETES_PER_SECOND
+)
+run_reaper.start()
 
 
 # ==========================================
@@ -111,21 +159,26 @@ def _privacy_cleanup_guard():
 @app.route("/")
 def home_page():
     """
-    Displays all TaskDefs and their TaskStageDefs.
-    Stages grouped by TaskDef_ID for clarity.
+    Displays the Rainn landing page.
+    Iteration 5: no longer loads every TaskDef and TaskStageDef; the dashboard
+    layout (Iteration 4) does not list them.
     """
-    taskdefs = taskdef_service.list_taskdefs()
-    stages = stage_service.list_all_stages()
+    return render_template("index.html")
 
-    stages_by_agent = {}
-    for st in stages:
-        stages_by_agent.setdefault(st.TaskDef_ID_FK, []).append(st)
 
-    return render_template(
-        "index.html",
-        taskdefs=taskdefs,
-        stages_by_agent=stages_by_agent
-    )
+@app.template_global()
+def page_url(endpoint, **changes):
+    """
+    URL for endpoint keeping the current query string, with changes applied
+    (a None value removes the argument). Used by the list page "Older" links.
+    """
+    args = request.args.to_dict()
+    for key, value in changes.items():
+        if value is None:
+            args.pop(key, None)
+        else:
+            args[key] = value
+    return url_for(endpoint, **args)
 
 
 # ==========================================
@@ -136,14 +189,53 @@ def database_page():
     """
     Shows TaskDefs, TaskStages, and AgentProcesses for debugging.
     Iteration 3: Shows TaskInstances and TaskStageInstances.
+    Iteration 5: each table is one keyset page (newest first; "Older" links
+    pass the last ID shown) selecting only the displayed columns, with
+    optional filters (?taskdef_id, ?run_status, ?task_instance_id, ?stage_status).
     """
+    args = request.args
+    taskdefs, taskdefs_next = taskdef_service.list_taskdefs_page(
+        before_id=args.get("taskdefs_before", type=int),
+        limit=LIST_PAGE_SIZE
+    )
+    taskstages, taskstages_next = stage_service.list_stages_page(
+        ("TaskStageDef_ID", "TaskDef_ID_FK", "TaskStageDef_Type", "TaskStageDef_Description"),
+        before_id=args.get("stages_before", type=int),
+        limit=LIST_PAGE_SIZE,
+        taskdef_id=args.get("taskdef_id", type=int)
+    )
+    processes, processes_next = process_service.list_processes_page(
+        ("Process_ID", "Agent_Name", "Agent_Priming", "AI_Model", "Operation_Selected", "Created_At"),
+        before_id=args.get("processes_before", type=int),
+        limit=LIST_PAGE_SIZE
+    )
+    task_instances, task_instances_next = task_instance.list_task_instances_page(
+        ("TaskInstance_ID", "Process_ID_FK", "TaskDef_ID_FK", "Status", "Created_At",
+         "Expires_At", "Deleted_At", "Parent_TaskInstance_ID_FK"),
+        before_id=args.get("runs_before", type=int),
+        limit=LIST_PAGE_SIZE,
+        status=args.get("run_status") or None
+    )
+    task_stage_instances, task_stage_instances_next = task_stage_instance.list_stage_instances_page(
+        ("TaskStageInstance_ID", "TaskInstance_ID_FK", "Stage_Order", "Stage_Name", "Status",
+         "Started_At", "Ended_At", "Prompt_Tokens"),
+        before_id=args.get("stage_runs_before", type=int),
+        limit=LIST_PAGE_SIZE,
+        task_instance_id=args.get("task_instance_id", type=int),
+        status=args.get("stage_status") or None
+    )
     return render_template(
         "database_view.html",
-        taskdefs=taskdef_service.list_taskdefs(),
-        taskstages=stage_service.list_all_stages(),
-        processes=process_service.list_processes(),
-        task_instances=task_instance.list_task_instances(),
-        task_stage_instances=task_stage_instance.list_stage_instances()
+        taskdefs=taskdefs,
+        taskdefs_next=taskdefs_next,
+        taskstages=taskstages,
+        taskstages_next=taskstages_next,
+        processes=processes,
+        processes_next=processes_next,
+        task_instances=task_instances,
+        task_instances_next=task_instances_next,
+        task_stage_instances=task_stage_instances,
+        task_stage_instances_next=task_stage_instances_next
     )
 
 
@@ -154,16 +246,23 @@ def database_page():
 def test_agent_page():
     """
     Shows the Agent Processes available in a page.
+    Iteration 5: one keyset page of flows at a time (?before=<last Process_ID>),
+    and only the TaskDef names those flows use.
     """
-    taskdefs = taskdef_service.list_taskdefs()
-    taskdef_map = {t.TaskDef_ID: t for t in taskdefs}
+    processes, processes_next = process_service.list_processes_page(
+        ("Process_ID", "Agent_Name", "Agent_Priming", "AI_Model", "Operation_Selected", "Created_At"),
+        before_id=request.args.get("before", type=int),
+        limit=LIST_PAGE_SIZE
+    )
+    taskdef_names = taskdef_service.get_taskdef_names(p["Operation_Selected"] for p in processes)
     import_success = request.args.get("import_success")
     import_error = request.args.get("import_error")
     imported_process_id = request.args.get("process_id")
     return render_template(
         "agent_test_list.html",
-        processes=process_service.list_processes(),
-        taskdef_map=taskdef_map,
+        processes=processes,
+        processes_next=processes_next,
+        taskdef_names=taskdef_names,
         import_success=import_success,
         import_error=import_error,
         imported_process_id=imported_process_id
@@ -588,6 +687,118 @@ def agent_builder_page():
 # ==========================================
 # AGENT RUNTIME — RUN PROCESS (Iteration 3)
 # ==========================================
+def _artifact_output_type(artifact_name):
+    ext = os.path.splitext(artifact_name)[1].lower()
+    if ext == ".svg":
+        return "svg"
+    if ext == ".csv":
+        return "csv"
+    if ext == ".json":
+        return "json"
+    return "text"
+
+
+def _build_run_view(task_instance_id):
+    """
+    Builds the process viewer state for a run (queued, running, or finished).
+    """
+    view = {
+        "output_task_instance_id": task_instance_id,
+        "run_status": None,
+        "run_stages": [],
+        "stage_outputs": [],
+        "run_active": False,
+        "receipt": None,
+        "message": None,
+        "expires_in_minutes": None,
+        "batch_children": []
+    }
+
+    task_inst = task_instance.get_task_instance(task_instance_id)
+    if not task_inst:
+        view["output_task_instance_id"] = None
+        return view
+    view["run_status"] = task_inst.Status
+
+    stage_instances = task_stage_instance.get_stages_for_task_instance(task_instance_id)
+    view["run_stages"] = stage_instances
+    view["batch_children"] = _build_batch_children(task_instance_id)
+
+    # A run still on the queue is never expired; its TTL is refreshed on completion.
+    if task_inst.Status == "RUNNING" and not task_inst.Deleted_At:
+        return view
+
+    if not task_instance.is_active(task_inst):
+        if not task_inst.Deleted_At:
+            _cleanup_task_instance(task_instance_id)
+            task_inst = task_instance.get_task_instance(task_instance_id)
+        view["receipt"] = task_inst
+        view["message"] = "This run was automatically deleted for privacy after inactivity."
+        return view
+
+    view["run_active"] = True
+    task_instance.touch_task_instance(task_instance_id, RUN_TTL_SECONDS)
+    view["expires_in_minutes"] = RUN_TTL_SECONDS // 60
+
+    stage_outputs = []
+    for st in stage_instances:
+        if not st.Output_Artifact_Path:
+            continue
+        artifact_name = os.path.basename(st.Output_Artifact_Path)
+        out_type = _artifact_output_type(artifact_name)
+        preview_text = None
+        preview_truncated = False
+        if out_type in ("text", "csv", "json"):
+            try:
+                preview_text, preview_truncated = ArtifactStore.read_head(st.Output_Artifact_Path, 4000)
+            except Exception:
+                preview_text = None
+        stage_outputs.append({
+            "order": st.Stage_Order,
+            "name": st.Stage_Name,
+            "artifact_name": artifact_name,
+            "output_type": out_type,
+            "prompt_tokens": st.Prompt_Tokens,
+            "task_instance_id": task_instance_id,
+            "preview_text": preview_text,
+            "preview_truncated": preview_truncated
+        })
+    stage_outputs.sort(key=lambda x: x["order"])
+    view["stage_outputs"] = stage_outputs
+    return view
+
+
+def _build_batch_children(task_instance_id):
+    """
+    Lists the child runs of a batch run with the file each one processed.
+    Viewing the parent keeps its children alive for the same privacy TTL.
+    """
+    children = task_instance.list_child_task_instances(task_instance_id)
+    if not children:
+        return []
+
+    file_names = {}
+    manifest_path = os.path.join(_safe_run_folder(task_instance_id), "00_batch_manifest.json")
+    try:
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            for entry in json.load(f).get("children", []):
+                file_names[entry.get("task_instance_id")] = entry.get("file_name")
+    except Exception:
+        pass
+
+    batch_children = []
+    for child in children:
+        if child.Status != "RUNNING" and task_instance.is_active(child):
+            task_instance.touch_task_instance(child.TaskInstance_ID, RUN_TTL_SECONDS)
+        batch_children.append({
+            "task_instance_id": child.TaskInstance_ID,
+            "file_name": file_names.get(child.TaskInstance_ID) or f"Run #{child.TaskInstance_ID}",
+            "status": child.Status,
+            "deleted": bool(child.Deleted_At)
+        })
+    return batch_children
+
+
 @app.route("/agent_runner/<int:process_id>", methods=["GET", "POST"])
 def agent_runner_page(process_id):
     """
@@ -599,24 +810,21 @@ def agent_runner_page(process_id):
     - Executes stage 1..N sequentially (stop on first failure)
     - Writes per-stage artifacts and persists paths in TaskStageInstance
     - Marks TaskInstance COMPLETED/FAILED accordingly
+
+    Iteration 5 runtime behaviour:
+    - POST queues the run on the background RunQueue and redirects with ?run_id=<id>
+    - GET with run_id shows live status (polled) and then the stage artifacts
+    - batch_mode runs each file as a child run (see AgentRuntime.run_batch)
     """
-    process = process_service.get_process(process_id)
-    if not process:
+    flow = process_service.get_flow(process_id)
+    if not flow:
         return "Agent Process not found.", 404
 
-    taskdef = taskdef_service.get_taskdef_by_id(process.Operation_Selected)
-    stages = stage_service.get_stages_for_task(taskdef.TaskDef_ID)
+    # Iteration 5: read-only flow definition from the cache (no per-render queries).
+    process, taskdef, stages = flow.process, flow.taskdef, flow.stage_defs
 
     file_text = None
-    output_type = None
-    output_artifact = None
-    output_task_instance_id = None
-    output_artifact_name = None
-    stage_outputs = []
-    run_active = False
-    receipt = None
-    receipt_message = None
-    expires_in_minutes = None
+    run_view = {}
 
     if request.method == "POST":
         uploaded_files = request.files.getlist("uploaded_file")
@@ -631,8 +839,8 @@ def agent_runner_page(process_id):
                         continue
                     ext = os.path.splitext(uploaded.filename)[1]
                     tmp = tempfile.NamedTemporaryFile(delete=False, suffix=ext)
-                    tmp.write(uploaded.read())
-                    tmp.flush()
+                    # Iteration 5: chunked copy; large uploads are already spooled to disk by Werkzeug.
+                    uploaded.save(tmp, buffer_size=UPLOAD_CHUNK_BYTES)
                     tmp.close()
                     temp_files.append({
                         "path": tmp.name,
@@ -642,77 +850,27 @@ def agent_runner_page(process_id):
                 if not temp_files:
                     file_text = "No file uploaded"
                 else:
-                    result = agent_runtime.run_task(
+                    # The queue owns temp_files from here and removes them when the run ends.
+                    batch_mode = request.form.get("batch_mode") == "on" and len(temp_files) > 1
+                    submit = run_queue.submit_batch if batch_mode else run_queue.submit
+                    run_id = submit(
                         process_id=process_id,
                         taskdef_id=taskdef.TaskDef_ID,
-                        file_path=temp_files
-                    )  # Iteration 3 changes here to accommodate instances
-                    if isinstance(result, dict):
-                        file_text = result.get("output_text")
-                        output_type = result.get("output_type")
-                        output_artifact = result.get("output_artifact_path")
-                        output_task_instance_id = result.get("task_instance_id")
-                        if output_artifact:
-                            output_artifact_name = os.path.basename(output_artifact)
-                        if output_task_instance_id:
-                            task_inst = task_instance.get_task_instance(output_task_instance_id)
-                            if task_inst and task_instance.is_active(task_inst):
-                                run_active = True
-                                task_instance.touch_task_instance(output_task_instance_id, RUN_TTL_SECONDS)
-                                task_inst = task_instance.get_task_instance(output_task_instance_id)
-                                if task_inst and task_inst.Expires_At:
-                                    expires_in_minutes = RUN_TTL_SECONDS // 60
-                                stage_instances = task_stage_instance.get_stages_for_task_instance(output_task_instance_id)
-                                for st in stage_instances:
-                                    if not st.Output_Artifact_Path:
-                                        continue
-                                    artifact_name = os.path.basename(st.Output_Artifact_Path)
-                                    ext = os.path.splitext(artifact_name)[1].lower()
-                                    out_type = "text"
-                                    if ext == ".svg":
-                                        out_type = "svg"
-                                    elif ext == ".csv":
-                                        out_type = "csv"
-                                    elif ext == ".json":
-                                        out_type = "json"
-                                    preview_text = None
-                                    preview_truncated = False
-                                    if out_type in ("text", "csv", "json"):
-                                        try:
-                                            max_chars = 4000
-                                            with open(st.Output_Artifact_Path, "r", encoding="utf-8") as f:
-                                                preview_text = f.read(max_chars + 1)
-                                            if preview_text and len(preview_text) > max_chars:
-                                                preview_text = preview_text[:max_chars]
-                                                preview_truncated = True
-                                        except Exception:
-                                            preview_text = None
-                                    stage_outputs.append({
-                                        "order": st.Stage_Order,
-                                        "name": st.Stage_Name,
-                                        "artifact_name": artifact_name,
-                                        "output_type": out_type,
-                                        "task_instance_id": output_task_instance_id,
-                                        "preview_text": preview_text,
-                                        "preview_truncated": preview_truncated
-                                    })
-                                stage_outputs.sort(key=lambda x: x["order"])
-                            else:
-                                if task_inst and not task_inst.Deleted_At:
-                                    _cleanup_task_instance(output_task_instance_id)
-                                    task_inst = task_instance.get_task_instance(output_task_instance_id)
-                                receipt = task_inst
-                                receipt_message = "This run was automatically deleted for privacy after inactivity."
-                    else:
-                        file_text = result
+                        files=temp_files
+                    )
+                    return redirect(url_for("agent_runner_page", process_id=process_id, run_id=run_id))
             except Exception as e:
                 file_text = f"Error: {e}"
-            finally:
                 for f in temp_files:
                     try:
                         os.remove(f["path"])
                     except Exception:
                         pass
+    else:
+        run_id = request.args.get("run_id", type=int)
+        if run_id:
+            run_view = _build_run_view(run_id)
+        file_text = request.args.get("error")
 
     return render_template(
         "process_viewer.html",
@@ -720,19 +878,174 @@ def agent_runner_page(process_id):
         taskdef=taskdef,
         stages=stages,
         file_text=file_text,
-        output_type=output_type,
-        output_artifact=output_artifact,
-        output_task_instance_id=output_task_instance_id,
-        output_artifact_name=output_artifact_name,
-        stage_outputs=stage_outputs,
-        run_active=run_active,
-        receipt=receipt,
-        message=receipt_message,
-        expires_in_minutes=expires_in_minutes,
+        output_task_instance_id=run_view.get("output_task_instance_id"),
+        run_status=run_view.get("run_status"),
+        run_stages=run_view.get("run_stages") or [],
+        stage_outputs=run_view.get("stage_outputs") or [],
+        run_active=run_view.get("run_active", False),
+        receipt=run_view.get("receipt"),
+        message=run_view.get("message"),
+        expires_in_minutes=run_view.get("expires_in_minutes"),
+        batch_children=run_view.get("batch_children") or [],
         receipt_retention_hours=RECEIPT_RETENTION_HOURS
     )
 
 
+# ==========================================
+# RESUME FAILED RUN
+# ==========================================
+@app.route("/resume_run/<int:task_instance_id>", methods=["POST"])
+def resume_run(task_instance_id):
+    """
+    Re-queues a FAILED run from its failed stage; completed stage artifacts are reused.
+    """
+    task_inst = task_instance.get_task_instance(task_instance_id)
+    if not task_inst:
+        abort(404)
+
+    error = None
+    try:
+        run_queue.submit_resume(task_instance_id)
+    except Exception as e:
+        error = f"Error: {e}"
+    return redirect(url_for(
+        "agent_runner_page",
+        process_id=task_inst.Process_ID_FK,
+        run_id=task_instance_id,
+        error=error
+    ))
+
+
+# ==========================================
+# RUN STATUS (Polled by the process viewer)
+# ==========================================
+@app.route("/run_status/<int:task_instance_id>")
+def run_status(task_instance_id):
+    """
+    Returns TaskInstance + TaskStageInstance status as JSON for a queued run.
+    """
+    task_inst = task_instance.get_task_instance(task_instance_id)
+    if not task_inst:
+        abort(404)
+
+    stage_instances = task_stage_instance.get_stages_for_task_instance(task_instance_id)
+    return jsonify({
+        "task_instance_id": task_inst.TaskInstance_ID,
+        "status": task_inst.Status,
+        "queued": run_queue.is_queued(task_instance_id),
+        "stages": [
+            {
+                "order": st.Stage_Order,
+                "name": st.Stage_Name,
+                "status": st.Status,
+                "prompt_tokens": st.Prompt_Tokens,
+                "error": st.Error_Message
+            }
+            for st in stage_instances
+        ],
+        "children": [
+            {
+                "task_instance_id": child.TaskInstance_ID,
+                "status": child.Status
+            }
+            for child in task_instance.list_child_task_instances(task_instance_id)
+        ]
+    })
+
+
+# ==========================================
+# RUN OUTPUT STREAM (Server-Sent Events)
+# ==========================================
+@app.route("/run_stream/<int:task_instance_id>")
+def run_stream(task_instance_id):
+    """
+    Streams stage output chunks while a run is generating.
+    Tails artifacts/*.part files (written by StageExecutionEngine when streaming)
+    and ends with a "done" event once the TaskInstance leaves RUNNING.
+    Each response only lasts RUN_STREAM_WINDOW_SECONDS so it does not hold a
+    request worker for the whole run; the browser's EventSource reconnects and
+    the event id (per-artifact byte offsets) resumes the stream without repeats.
+    """
+    if not task_instance.get_task_instance(task_instance_id):
+        abort(404)
+
+    artifacts_dir = os.path.join(_safe_run_folder(task_instance_id), "artifacts")
+    offsets = _parse_stream_offsets(request.headers.get("Last-Event-ID"))
+
+    def _events():
+        readers = {}
+        deadline = time.monotonic() + RUN_STREAM_WINDOW_SECONDS
+        yield f"retry: {RUN_STREAM_RETRY_MS}\n\n"
+        while True:
+            task_inst = task_instance.get_task_instance(task_instance_id)
+            try:
+                names = sorted(n for n in os.listdir(artifacts_dir) if n.endswith(".part"))
+            except OSError:
+                names = []
+
+            for name in names:
+                path = os.path.join(artifacts_dir, name)
+                if name not in readers:
+                    readers[name] = (offsets.get(name, 0), codecs.getincrementaldecoder("utf-8")("replace"))
+                offset, decoder = readers[name]
+                try:
+                    if os.path.getsize(path) < offset:
+                        # The .part file was restarted (resumed run).
+                        offset, decoder = 0, codecs.getincrementaldecoder("utf-8")("replace")
+                    with open(path, "rb") as f:
+                        f.seek(offset)
+                        data = f.read()
+                except OSError:
+                    continue
+                readers[name] = (offset + len(data), decoder)
+                text = decoder.decode(data)
+                if text:
+                    # Bytes held back by the decoder (a split UTF-8 character) are re-read after a reconnect.
+                    offsets[name] = offset + len(data) - len(decoder.getstate()[0])
+                    payload = {
+                        "artifact": name[:-len(".part")],
+                        "stage_order": _stage_order_of(name),
+                        "text": text
+                    }
+                    event_id = json.dumps(offsets, separators=(",", ":"))
+                    yield f"id: {event_id}\nevent: chunk\ndata: {json.dumps(payload)}\n\n"
+
+            if not task_inst or task_inst.Status != "RUNNING":
+                status = task_inst.Status if task_inst else None
+                yield f"event: done\ndata: {json.dumps({'status': status})}\n\n"
+                return
+            if time.monotonic() >= deadline:
+                # End of this window: the client reconnects with the last event id.
+                return
+            time.sleep(RUN_STREAM_POLL_SECONDS)
+
+    return Response(
+        _events(),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+def _parse_stream_offsets(last_event_id):
+    """Reads the {artifact .part name: byte offset} map sent back as Last-Event-ID."""
+    try:
+        offsets = json.loads(last_event_id or "{}")
+    except ValueError:
+        return {}
+    if not isinstance(offsets, dict):
+        return {}
+    return {
+        str(name): value for name, value in offsets.items()
+        if isinstance(value, int) and value >= 0
+    }
+
+
+def _stage_order_of(artifact_name):
+    """Stage order from an artifact name such as "02_stage_summary_output.part"."""
+    prefix = artifact_name.split("_", 1)[0]
+    return int(prefix) if prefix.isdigit() else None
+
+
 # ==========================================
 # UPDATE AGENT PROCESS
 # ==========================================
@@ -751,6 +1064,12 @@ def update_process(process_id):
     if request.method == "POST":
         process.Agent_Name = request.form.get("agent_name")
         process.Operation_Selected = int(request.form.get("operation_selected"))
+        cache_ttl = (request.form.get("cache_ttl_seconds") or "").strip()
+        process.Cache_TTL_Seconds = int(cache_ttl) if cache_ttl.isdigit() and int(cache_ttl) > 0 else None
+        prompt_mode = request.form.get("prompt_mode")
+        process.Prompt_Mode = prompt_mode if prompt_mode in PROMPT_MODES else PROMPT_MODE_FULL
+        csv_input_mode = request.form.get("csv_input_mode")
+        process.Csv_Input_Mode = csv_input_mode if csv_input_mode in CSV_INPUT_MODES else CSV_INPUT_FULL
 
         process_service.update_process(process)
         return redirect(url_for("test_agent_page"))
@@ -781,6 +1100,9 @@ def delete_process(process_id):
 def download_run(task_instance_id):
     task_inst = task_instance.get_task_instance(task_instance_id)
     if not task_inst or not task_instance.is_active(task_inst):
+        # A run still on the queue is never expired; its TTL is refreshed on completion.
+        if task_inst and task_inst.Status == "RUNNING" and not task_inst.Deleted_At:
+            return "This run is still running; try again once it has finished.", 409
         if task_inst and not task_inst.Deleted_At:
             _cleanup_task_instance(task_instance_id)
             task_inst = task_instance.get_task_instance(task_instance_id)
@@ -803,7 +1125,8 @@ def download_run(task_instance_id):
             receipt_retention_hours=RECEIPT_RETENTION_HOURS
         ), 410
 
-    buffer = io.BytesIO()
+    # Iteration 5: zipped on disk (Flask closes and removes the temp file after sending).
+    buffer = tempfile.TemporaryFile()
     with zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_DEFLATED) as zf:
         for root, _, files in os.walk(run_folder):
             for file in files:
@@ -838,6 +1161,9 @@ def download_run(task_instance_id):
 @app.route("/delete_run/<int:task_instance_id>", methods=["POST"])
 def delete_run(task_instance_id):
     task_inst = task_instance.get_task_instance(task_instance_id)
+    # A queued or running run would keep writing to its folder after it is deleted.
+    if task_inst and task_inst.Status == "RUNNING" and not task_inst.Deleted_At:
+        return "This run is still running; delete it once it has finished.", 409
     if task_inst and not task_inst.Deleted_At:
         _cleanup_task_instance(task_instance_id)
         task_inst = task_instance.get_task_instance(task_instance_id)
@@ -859,6 +1185,9 @@ def artifact_file(task_instance_id, filename):
     """
     task_inst = task_instance.get_task_instance(task_instance_id)
     if not task_inst or not task_instance.is_active(task_inst):
+        # A run still on the queue is never expired; its TTL is refreshed on completion.
+        if task_inst and task_inst.Status == "RUNNING" and not task_inst.Deleted_At:
+            return "This run is still running; try again once it has finished.", 409
         if task_inst and not task_inst.Deleted_At:
             _cleanup_task_instance(task_instance_id)
             task_inst = task_instance.get_task_instance(task_instance_id)
@@ -1,6 +1,6 @@
 # ==========================================
 # File: init_db.py
-# Updated in iteration: 4
+# Updated in iteration: 5
 # Author: Karl Concha
 #
 # Purpose:
@@ -15,110 +15,50 @@
 # traceability and stop-on-failure runtime behaviour.
 # Conversation Topic: "DB Schema for TaskInstance and TaskStageInstance"
 # Date: January 2026
+#
+# Iteration 5: non-destructive. Tables and later schema changes come from the
+# versioned migrations (dao/migrations.py); existing runs and flows are kept
+# and the demo data is only seeded into an empty database.
+# "python init_db.py --reset" still drops everything and starts over.
 # ==========================================
 
+import argparse
 import sqlite3
 
+from dao.migrations import LATEST_VERSION, migrate
+
 
-def init_db():
+def init_db(reset=False):
     conn = sqlite3.connect("rainn.db")
     cursor = conn.cursor()
 
     # Recommended for SQLite: enforce FK constraints (OFF by default in SQLite).
     cursor.execute("PRAGMA foreign_keys = ON;")
 
-    # ------------------------------------------
-    # DROP OLD TABLES
-    # Drop children first (tables with foreign keys) to avoid FK drop errors.
-    # ------------------------------------------
-    cursor.execute("DROP TABLE IF EXISTS TaskStageInstance;")
-    cursor.execute("DROP TABLE IF EXISTS TaskInstance;")
-    cursor.execute("DROP TABLE IF EXISTS TaskStageDef;")
-    cursor.execute("DROP TABLE IF EXISTS AgentProcess;")
-    cursor.execute("DROP TABLE IF EXISTS TaskDef;")
+    if reset:
+        # ------------------------------------------
+        # DROP OLD TABLES (--reset only)
+        # Drop children first (tables with foreign keys) to avoid FK drop errors.
+        # ------------------------------------------
+        cursor.execute("DROP TABLE IF EXISTS TaskStageInstance;")
+        cursor.execute("DROP TABLE IF EXISTS TaskInstance;")
+        cursor.execute("DROP TABLE IF EXISTS TaskStageDef;")
+        cursor.execute("DROP TABLE IF EXISTS AgentProcess;")
+        cursor.execute("DROP TABLE IF EXISTS TaskDef;")
+        cursor.execute("PRAGMA user_version = 0;")
+        conn.commit()
 
     # ------------------------------------------
-    # CORE TEMPLATE TABLES (Iteration 1/2)
+    # CREATE / UPGRADE SCHEMA (versioned migrations)
     # ------------------------------------------
+    applied = migrate("rainn.db")
 
-    # TaskDef Table
-    cursor.execute("""
-        CREATE TABLE TaskDef (
-            TaskDef_ID INTEGER PRIMARY KEY AUTOINCREMENT,
-            TaskDef_Name TEXT NOT NULL UNIQUE,
-            TaskDef_Description TEXT
-        );
-    """)
-
-    # TaskStageDef Table
-    cursor.execute("""
-        CREATE TABLE TaskStageDef (
-            TaskStageDef_ID INTEGER PRIMARY KEY AUTOINCREMENT,
-            TaskDef_ID_FK INTEGER NOT NULL,
-            TaskStageDef_Type TEXT NOT NULL,
-            TaskStageDef_Description TEXT,
-            FOREIGN KEY (TaskDef_ID_FK) REFERENCES TaskDef(TaskDef_ID)
-        );
-    """)
-
-    # AgentProcess Table (Iteration 2)
-    # Represents a saved "configured agent" with model + priming + selected template.
-    cursor.execute("""
-        CREATE TABLE AgentProcess (
-            Process_ID INTEGER PRIMARY KEY AUTOINCREMENT,
-            User_ID INTEGER,
-            Agent_Name TEXT,
-            Agent_Priming TEXT DEFAULT NULL,
-            AI_Model TEXT,
-            Operation_Selected INTEGER NOT NULL,
-            Created_At DATETIME DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (Operation_Selected) REFERENCES TaskDef(TaskDef_ID)
-        );
-    """)
-
-    # ------------------------------------------
-    # EXECUTION TRACEABILITY TABLES (Iteration 3)
-    # ------------------------------------------
-
-    # TaskInstance Table (NEW Iteration 3)
-    # One row per execution run:
-    # "User ran AgentProcess Y using TaskDef Z at time T"
-    cursor.execute("""
-        CREATE TABLE TaskInstance (
-            TaskInstance_ID INTEGER PRIMARY KEY AUTOINCREMENT,
-            Process_ID_FK INTEGER NOT NULL,
-            TaskDef_ID_FK INTEGER NOT NULL,
-            Status TEXT CHECK(Status IN ('RUNNING', 'COMPLETED', 'FAILED')) NOT NULL,
-            Run_Folder TEXT NOT NULL DEFAULT '',
-            Last_Accessed_At DATETIME,
-            Expires_At DATETIME,
-            Deleted_At DATETIME,
-            Downloaded_At DATETIME,
-            Created_At DATETIME DEFAULT CURRENT_TIMESTAMP,
-            Updated_At DATETIME DEFAULT CURRENT_TIMESTAMP,
-
-            FOREIGN KEY (Process_ID_FK) REFERENCES AgentProcess(Process_ID),
-            FOREIGN KEY (TaskDef_ID_FK) REFERENCES TaskDef(TaskDef_ID)
-        );
-    """)
-
-    # TaskStageInstance Table (NEW Iteration 3)
-    # One row per stage execution within a TaskInstance.
-    cursor.execute("""
-        CREATE TABLE TaskStageInstance (
-            TaskStageInstance_ID INTEGER PRIMARY KEY AUTOINCREMENT,
-            TaskInstance_ID_FK INTEGER NOT NULL,
-            Stage_Order INTEGER NOT NULL,
-            Stage_Name TEXT NOT NULL,
-            Status TEXT CHECK(Status IN ('PENDING', 'RUNNING', 'COMPLETED', 'FAILED')) NOT NULL,
-            Output_Artifact_Path TEXT,
-            Started_At DATETIME,
-            Ended_At DATETIME,
-            Error_Message TEXT,
-
-            FOREIGN KEY (TaskInstance_ID_FK) REFERENCES TaskInstance(TaskInstance_ID)
-        );
-    """)
+    cursor.execute("SELECT COUNT(*) FROM TaskDef")
+    if cursor.fetchone()[0]:
+        conn.close()
+        print(f"Rainn DB up to date (schema version {LATEST_VERSION}, "
+              f"applied: {', '.join(map(str, applied)) or 'none'}); existing data kept.")
+        return
 
     # ------------------------------------------
     # SEED DATA (DEV / DEMO)
@@ -179,6 +119,13 @@ def init_db():
         (invoice_text_only_id, "output", "Provide a refined compliance summary with clear next steps."),
     ])
 
+    # Iteration 5: graph and output both only need risk_flags, so they can run in parallel.
+    cursor.execute("""
+        UPDATE TaskStageDef
+        SET TaskStageDef_Depends_On = 'risk_flags'
+        WHERE TaskDef_ID_FK = ? AND TaskStageDef_Type IN ('graph', 'output')
+    """, (invoice_visual_text_id,))
+
     # Seed Agent Processes (pre-defined configured agents)
     cursor.executemany("""
         INSERT INTO AgentProcess (User_ID, Agent_Name, Agent_Priming, AI_Model, Operation_Selected)
@@ -209,8 +156,10 @@ def init_db():
 
     conn.commit()
     conn.close()
-    print("Rainn DB initialised (Iteration 3 schema: AgentProcess + Instance traceability).")
+    print(f"Rainn DB initialised (schema version {LATEST_VERSION}, demo flows seeded).")
 
 
 if __name__ == "__main__":
-    init_db()
+    parser = argparse.ArgumentParser(description="Create or upgrade the Rainn database.")
+    parser.add_argument("--reset", action="store_true", help="Drop all tables (and their data) first")
+    init_db(reset=parser.parse_args().reset)
@@ -1,17 +1,31 @@
 # ==========================================
 # File: agent_process.py
 # Created in iteration: 2
+# Updated in iteration: 5
 # Author: Karl Concha
 
 # Notes:
 # agent_process is the created 'flow' the user builds.
 # Instances will be applied in later iterations.
+# Iteration 5: Cache_TTL_Seconds opts a flow into the model response cache.
+# Iteration 5: Prompt_Mode ("full" | "compact") controls whether every stage
+# prompt repeats the original input (see PromptCompiler).
+# Iteration 5: Csv_Input_Mode ("full" | "summary" | "sample") sets what Stage 0
+# passes on for CSV uploads (see task_logic/csv_table.py).
+# Iteration 5: __slots__ (no per-instance __dict__; DAOs map rows via dao/row_mapper.py).
 # ==========================================
 
 class AgentProcess:
 
+    # Constructor argument order (used by dao/row_mapper.py).
+    __slots__ = (
+        "Process_ID", "User_ID", "Agent_Name", "Agent_Priming", "AI_Model",
+        "Operation_Selected", "Created_At", "Cache_TTL_Seconds", "Prompt_Mode", "Csv_Input_Mode"
+    )
+
     def __init__(self, Process_ID, User_ID, Agent_Name, Agent_Priming, AI_Model,
-                 Operation_Selected, Created_At):
+                 Operation_Selected, Created_At, Cache_TTL_Seconds=None, Prompt_Mode="full",
+                 Csv_Input_Mode="full"):
         
         self.Process_ID = Process_ID
         self.User_ID = User_ID
@@ -19,4 +33,7 @@ class AgentProcess:
         self.Agent_Priming = Agent_Priming
         self.AI_Model = AI_Model
         self.Operation_Selected = Operation_Selected
-        self.Created_At = Created_At
\ No newline at end of file
+        self.Created_At = Created_At
+        self.Cache_TTL_Seconds = Cache_TTL_Seconds
+        self.Prompt_Mode = Prompt_Mode or "full"
+        self.Csv_Input_Mode = Csv_Input_Mode or "full"
@@ -1,13 +1,20 @@
 # ==========================================
 # File: task_def.py
 # Created in iteration: 1
+# Updated in iteration: 5
 # Author: Karl Concha
+#
+# Notes:
+# Iteration 5: __slots__ (no per-instance __dict__; DAOs map rows via dao/row_mapper.py).
 # ==========================================
 
 
 class TaskDef:
     """ Represents a Task Definition entity within the Rainn system. """
 
+    # Constructor argument order (used by dao/row_mapper.py).
+    __slots__ = ("TaskDef_ID", "TaskDef_Name", "TaskDef_Description")
+
     def __init__(self, TaskDef_ID, TaskDef_Name, TaskDef_Description):
         """ Initializes TaskDef attributes. """
         self.TaskDef_ID = TaskDef_ID
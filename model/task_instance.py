@@ -1,17 +1,26 @@
 # ==========================================
 # File: task_instance.py
-# Updated in iteration: 4
+# Updated in iteration: 5
 # Author: Karl Concha
 #
 # Notes:
 # Implemented in iteration 3 with slight changes of its attributes
 # to fit the db schema
+# Iteration 5: Parent_TaskInstance_ID_FK links per-file runs to their batch run.
+# Iteration 5: __slots__ (no per-instance __dict__; DAOs map rows via dao/row_mapper.py).
 # ==========================================
 
 
 class TaskInstance:
     """ Represents an instance of a task derived from a Task Definition. """
 
+    # Constructor argument order (used by dao/row_mapper.py).
+    __slots__ = (
+        "TaskInstance_ID", "Process_ID_FK", "TaskDef_ID_FK", "Status", "Run_Folder",
+        "Last_Accessed_At", "Expires_At", "Deleted_At", "Downloaded_At",
+        "Created_At", "Updated_At", "Parent_TaskInstance_ID_FK"
+    )
+
     def __init__(
         self,
         TaskInstance_ID,
@@ -24,7 +33,8 @@ class TaskInstance:
         Deleted_At,
         Downloaded_At,
         Created_At,
-        Updated_At
+        Updated_At,
+        Parent_TaskInstance_ID_FK=None
     ):
         """ Initializes TaskInstance attributes. """
         self.TaskInstance_ID = TaskInstance_ID
@@ -38,3 +48,4 @@ class TaskInstance:
         self.Downloaded_At = Downloaded_At
         self.Created_At = Created_At
         self.Updated_At = Updated_At
+        self.Parent_TaskInstance_ID_FK = Parent_TaskInstance_ID_FK
@@ -1,19 +1,39 @@
 # ==========================================
 # File: task_stage_def.py
 # Created in iteration: 1
+# Updated in iteration: 5
 # Author: Karl Concha
+#
+# Notes:
+# Iteration 5 adds TaskStageDef_Depends_On (comma-separated names of earlier
+# stages this stage consumes; empty = previous non-visual stage).
+# Iteration 5 adds TaskStageDef_Chunk_Tokens (map-reduce over input chunks of at
+# most this many estimated tokens; empty = whole input in one call).
+# Iteration 5 adds TaskStageDef_Include_Input (in compact prompt mode, also send
+# this stage the original Stage 0 input).
+# Iteration 5: __slots__ (no per-instance __dict__; DAOs map rows via dao/row_mapper.py).
 # ==========================================
 
 
 class TaskStageDef:
     """ Represents a stage or step definition linked to a Task Definition. """
 
-    def __init__(self, TaskStageDef_ID, TaskDef_ID_FK, TaskStageDef_Type, TaskStageDef_Description):
+    # Constructor argument order (used by dao/row_mapper.py).
+    __slots__ = (
+        "TaskStageDef_ID", "TaskDef_ID_FK", "TaskStageDef_Type", "TaskStageDef_Description",
+        "TaskStageDef_Depends_On", "TaskStageDef_Chunk_Tokens", "TaskStageDef_Include_Input"
+    )
+
+    def __init__(self, TaskStageDef_ID, TaskDef_ID_FK, TaskStageDef_Type, TaskStageDef_Description,
+                 TaskStageDef_Depends_On=None, TaskStageDef_Chunk_Tokens=None, TaskStageDef_Include_Input=0):
         """ Initializes TaskStageDef attributes. """
         self.TaskStageDef_ID = TaskStageDef_ID
         self.TaskDef_ID_FK = TaskDef_ID_FK
         self.TaskStageDef_Type = TaskStageDef_Type
         self.TaskStageDef_Description = TaskStageDef_Description
+        self.TaskStageDef_Depends_On = TaskStageDef_Depends_On
+        self.TaskStageDef_Chunk_Tokens = TaskStageDef_Chunk_Tokens
+        self.TaskStageDef_Include_Input = TaskStageDef_Include_Input
 
     def to_dict(self):
         """ Converts TaskStageDef instance to dictionary format. """
@@ -21,5 +41,8 @@ class TaskStageDef:
             "TaskStageDef_ID": self.TaskStageDef_ID,
             "TaskDef_ID_FK": self.TaskDef_ID_FK,
             "TaskStageDef_Type": self.TaskStageDef_Type,
-            "TaskStageDef_Description": self.TaskStageDef_Description
+            "TaskStageDef_Description": self.TaskStageDef_Description,
+            "TaskStageDef_Depends_On": self.TaskStageDef_Depends_On,
+            "TaskStageDef_Chunk_Tokens": self.TaskStageDef_Chunk_Tokens,
+            "TaskStageDef_Include_Input": self.TaskStageDef_Include_Input
         }
@@ -1,18 +1,27 @@
 # ==========================================
 # File: task__stage_instance.py
-# Updated in iteration: 3
+# Updated in iteration: 5
 # Author: Karl Concha
 #
 # Notes:
 # Implemented in iteration 3 with slight changes of its attributes
 # to fit the db schema
+# Iteration 5: Prompt_Tokens (estimated tokens sent to the model for the stage)
+# Iteration 5: __slots__ (no per-instance __dict__; DAOs map rows via dao/row_mapper.py).
 # ==========================================
 
 
 class TaskStageInstance:
     """ Represents an instance of a stage associated with a specific task instance. """
 
-    def __init__(self, TaskStageInstance_ID, TaskInstance_ID_FK, Stage_Order, Stage_Name, Status, Output_Artifact_Path, Started_At, Ended_At, Error_Message):
+    # Constructor argument order (used by dao/row_mapper.py).
+    __slots__ = (
+        "TaskStageInstance_ID", "TaskInstance_ID_FK", "Stage_Order", "Stage_Name", "Status",
+        "Output_Artifact_Path", "Started_At", "Ended_At", "Error_Message", "Prompt_Tokens"
+    )
+
+    def __init__(self, TaskStageInstance_ID, TaskInstance_ID_FK, Stage_Order, Stage_Name, Status, Output_Artifact_Path, Started_At, Ended_At, Error_Message,
+                 Prompt_Tokens=None):
         """ Initializes TaskStageInstance attributes. """
         self.TaskStageInstance_ID = TaskStageInstance_ID
         self.TaskInstance_ID_FK = TaskInstance_ID_FK
@@ -23,3 +32,4 @@ class TaskStageInstance:
         self.Started_At = Started_At
         self.Ended_At = Ended_At
         self.Error_Message = Error_Message
+        self.Prompt_Tokens = Prompt_Tokens
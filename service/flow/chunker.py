@@ -0,0 +1,85 @@
+# ==========================================
+# File: chunker.py
+# Added in iteration: 5
+# Author: Karl Concha
+#
+# Token-aware chunking of stage input for map-reduce stages.
+# - estimate_tokens: cheap token estimate (no tokenizer dependency)
+# - split: packs text into chunks of at most max_tokens, cutting on the
+#   largest natural boundary available: file headers from Stage 0, PDF page
+#   breaks (form feed), paragraphs, lines, sentences, then words
+#
+# Used by StageExecutionEngine for stages with TaskStageDef_Chunk_Tokens set.
+# ==========================================
+
+import re
+
+
+# Roughly 4 characters per token for English prose across common local models.
+CHARS_PER_TOKEN = 4
+
+# Smallest chunk size a stage may be configured with (keeps map calls meaningful).
+MIN_CHUNK_TOKENS = 256
+
+# Boundaries tried in order, largest unit first. Each pattern keeps its separator
+# attached to the preceding piece so joined chunks reproduce the original text.
+_BOUNDARY_PATTERNS = [
+    re.compile(r"(?=^=== FILE \d+: )", re.MULTILINE),  # Stage 0 file headers
+    re.compile(r"(?<=\f)"),                            # PDF page breaks
+    re.compile(r"(?<=\n\n)"),                          # paragraphs
+    re.compile(r"(?<=\n)"),                            # lines
+    re.compile(r"(?<=[.!?] )"),                        # sentences
+    re.compile(r"(?<= )"),                             # words
+]
+
+
+class InputChunker:
+    """Splits stage input into model-sized chunks on natural boundaries."""
+
+    @staticmethod
+    def estimate_tokens(text):
+        """Approximate token count for text (ceil of characters / CHARS_PER_TOKEN)."""
+        return (len(text or "") + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+    @staticmethod
+    def split(text, max_tokens):
+        """
+        Returns a list of chunks, each estimated at no more than max_tokens
+        (a single unbreakable run of characters is hard-split as a last resort).
+        Text that already fits is returned as one chunk.
+        """
+        text = (text or "").strip()
+        if not text:
+            return []
+        max_chars = max(1, int(max_tokens)) * CHARS_PER_TOKEN
+        chunks = [c.strip() for c in InputChunker._split(text, max_chars, 0)]
+        return [c for c in chunks if c]
+
+    @staticmethod
+    def _split(text, max_chars, level):
+        if len(text) <= max_chars:
+            return [text]
+        if level >= len(_BOUNDARY_PATTERNS):
+            return [text[i:i + max_chars] for i in range(0, len(text), max_chars)]
+
+        pieces = [p for p in _BOUNDARY_PATTERNS[level].split(text) if p]
+        if len(pieces) <= 1:
+            return InputChunker._split(text, max_chars, level + 1)
+
+        # Greedily pack pieces; a piece that is too large on its own is split further.
+        chunks = []
+        current = ""
+        for piece in pieces:
+            if len(piece) > max_chars:
+                if current:
+                    chunks.append(current)
+                    current = ""
+                chunks.extend(InputChunker._split(piece, max_chars, level + 1))
+            elif len(current) + len(piece) > max_chars:
+                chunks.append(current)
+                current = piece
+            else:
+                current += piece
+        if current:
+            chunks.append(current)
+        return chunks
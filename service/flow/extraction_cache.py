@@ -0,0 +1,206 @@
+# ==========================================
+# File: extraction_cache.py
+# Added in iteration: 5
+# Author: Karl Concha
+#
+# Purpose:
+# Disk-backed cache of Stage 0 text, so re-uploading the same invoice or
+# contract does not re-run PDF/CSV extraction.
+# - Key: SHA-256 of (READER_VERSION, file extension, SHA-256 of the uploaded
+#   bytes), plus the CSV input mode when a .csv is summarised or sampled;
+#   bumping READER_VERSION in file_reader.py retires every entry
+# - Value: the file's normalised text, one file per entry under
+#   extraction_cache/ (a hit is a file read instead of a parse)
+# - Same privacy expiry as runs: an entry expires ttl_seconds after it was
+#   last used (TaskInstanceService.DEFAULT_TTL_SECONDS by default) and is
+#   purged by the RunReaper cycle; expired entries are never served
+# - Size-bounded: least recently used entries are evicted first
+#
+# Notes:
+# - Last use is the entry file's modification time, so the cache needs no
+#   index and survives restarts.
+# - Failed extractions (unsupported type, no text) are not cached.
+# - Stage 0 streams entries in and out (writer / open), so neither a hit nor
+#   a miss holds the whole file's text in memory.
+# ==========================================
+
+import hashlib
+import os
+import tempfile
+import threading
+import time
+
+from service.task_instance_service import DEFAULT_TTL_SECONDS
+from task_logic.file_reader import READER_VERSION
+
+
+DEFAULT_CACHE_DIR = "extraction_cache"
+DEFAULT_MAX_ENTRIES = 1000
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+# Bytes read at a time while hashing an upload.
+HASH_CHUNK_BYTES = 1024 * 1024
+
+
+def make_extraction_key(file_path, variant=None):
+    """
+    Builds the content address of an uploaded file (reads it once, in chunks).
+    variant tells apart different extractions of the same file (CSV input mode).
+    """
+    content_hash = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_CHUNK_BYTES), b""):
+            content_hash.update(block)
+    extension = os.path.splitext(file_path)[1].lower()
+    key_parts = [str(READER_VERSION), extension, content_hash.hexdigest()]
+    if variant:
+        key_parts.append(variant)
+    key_source = "\x1f".join(key_parts)
+    return hashlib.sha256(key_source.encode("utf-8")).hexdigest()
+
+
+class ExtractionCache:
+    """Directory of normalised Stage 0 texts with sliding expiry and LRU eviction."""
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, ttl_seconds=DEFAULT_TTL_SECONDS,
+                 max_entries=DEFAULT_MAX_ENTRIES, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def open(self, key):
+        """
+        Opens the cached text for key for reading (and renews its expiry).
+        Returns None if it is missing or expired.
+        """
+        path = self._path(key)
+        with self._lock:
+            try:
+                if os.path.getmtime(path) + self.ttl_seconds <= time.time():
+                    self._remove(path)
+                    return None
+                f = open(path, "r", encoding="utf-8")
+                os.utime(path)
+            except FileNotFoundError:
+                return None
+        return f
+
+    def get(self, key):
+        """Returns the cached text for key (and renews its expiry), or None if missing/expired."""
+        f = self.open(key)
+        if f is None:
+            return None
+        with f:
+            return f.read()
+
+    def writer(self, key):
+        """Starts a streamed entry for key (see ExtractionCacheWriter)."""
+        return ExtractionCacheWriter(self, key)
+
+    def put(self, key, text):
+        """Stores text for key and evicts expired / least recently used entries."""
+        entry = self.writer(key)
+        try:
+            entry.write(text)
+        except Exception:
+            entry.discard()
+            raise
+        entry.commit()
+
+    def purge_expired(self):
+        """Deletes expired entries. Returns the number removed."""
+        with self._lock:
+            return self._evict(time.time())
+
+    def clear(self):
+        """Deletes every cached text."""
+        with self._lock:
+            for entry in self._entries():
+                if entry.name.endswith(".txt"):
+                    self._remove(entry.path)
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.txt")
+
+    def _entries(self):
+        with os.scandir(self.cache_dir) as it:
+            return list(it)
+
+    @staticmethod
+    def _remove(path):
+        """Deletes an entry file; False if it is already gone or still open elsewhere (Windows)."""
+        try:
+            os.remove(path)
+            return True
+        except OSError:
+            return False
+
+    def _evict(self, now):
+        """Removes expired entries, then LRU entries until both bounds are met. Returns the number removed."""
+        live = []
+        removed = 0
+        for entry in self._entries():
+            stat = entry.stat()
+            if stat.st_mtime + self.ttl_seconds <= now:
+                # Also drops .tmp files left behind by a crash mid-write.
+                if self._remove(entry.path) and entry.name.endswith(".txt"):
+                    removed += 1
+            elif entry.name.endswith(".txt"):
+                live.append((stat.st_mtime, stat.st_size, entry.path))
+
+        count = len(live)
+        total_bytes = sum(size for _, size, _ in live)
+        for _, size, path in sorted(live):
+            if count <= self.max_entries and total_bytes <= self.max_bytes:
+                break
+            if self._remove(path):
+                removed += 1
+            count -= 1
+            total_bytes -= size
+        return removed
+
+
+class ExtractionCacheWriter:
+    """
+    One cache entry written in pieces under a temporary name, so readers never see
+    a partial entry: commit() publishes it, discard() drops it.
+    """
+
+    def __init__(self, cache, key):
+        self.cache = cache
+        self.key = key
+        fd, self.tmp_path = tempfile.mkstemp(dir=cache.cache_dir, suffix=".tmp")
+        self._file = os.fdopen(fd, "w", encoding="utf-8")
+
+    def write(self, text):
+        self._file.write(text)
+
+    def commit(self):
+        self._file.close()
+        if os.path.getsize(self.tmp_path) > self.cache.max_bytes:
+            os.remove(self.tmp_path)
+            return
+        with self.cache._lock:
+            os.replace(self.tmp_path, self.cache._path(self.key))
+            self.cache._evict(time.time())
+
+    def discard(self):
+        self._file.close()
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+
+_shared_cache = None
+_shared_cache_lock = threading.Lock()
+
+
+def get_extraction_cache():
+    """Returns the process-wide ExtractionCache (created on first use)."""
+    global _shared_cache
+    with _shared_cache_lock:
+        if _shared_cache is None:
+            _shared_cache = ExtractionCache()
+        return _shared_cache
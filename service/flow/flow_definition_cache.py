@@ -0,0 +1,146 @@
+# ==========================================
+# File: flow_definition_cache.py
+# Added in iteration: 5
+# Author: Karl Concha
+#
+# Purpose:
+# In-memory cache of flow definitions (AgentProcess + its TaskDef + its
+# ordered TaskStageDefs), keyed by Process_ID.
+# - Run start-up and the runner page read the flow with one dict lookup
+#   instead of three queries per run / render
+# - Entries are invalidated by the services that change flows
+#   (AgentProcessService, TaskDefService, TaskStageService), so flow import
+#   and the builder/update/delete routes are covered too
+# - Versioned: every invalidation bumps a counter, and a flow loaded while an
+#   invalidation happened is returned but not cached (no stale re-insert)
+# - Bounded LRU (max_entries)
+# - Each cached flow also keeps its compiled flow plan (flow_plan.py), so the
+#   stage DAG and prompt templates are built once per cached version
+#
+# Notes:
+# - Cached objects are shared between requests and worker threads; treat
+#   them as read-only (copy before changing, as run_batch does for reduce).
+# - The cache is per process, like RunQueue; changes made to rainn.db by
+#   another process are not seen until the entry is invalidated or evicted.
+# - Loads go straight to the DAOs so the services can import this module.
+# ==========================================
+
+import threading
+from collections import OrderedDict
+
+from dao.agent_process_dao import AgentProcessDAO
+from dao.task_def_dao import TaskDefDAO
+from dao.task_stage_def_dao import TaskStageDefDAO
+from service.flow.flow_plan import FlowPlan
+
+
+DEFAULT_MAX_ENTRIES = 512
+
+
+class FlowDefinition:
+    """ Read-only snapshot of one flow as it is run. """
+
+    __slots__ = ("process", "taskdef", "stage_defs", "version", "_plans")
+
+    def __init__(self, process, taskdef, stage_defs, version):
+        self.process = process
+        self.taskdef = taskdef
+        self.stage_defs = tuple(stage_defs)
+        self.version = version
+        self._plans = {}
+
+    def plan(self, exclude_type=None):
+        """
+        The compiled FlowPlan of this flow's stages, leaving out stages of type
+        exclude_type. Compiled on first use, then shared by every run of this version.
+        """
+        plan = self._plans.get(exclude_type)
+        if plan is None:
+            stage_defs = self.stage_defs
+            if exclude_type:
+                stage_defs = [
+                    s for s in stage_defs
+                    if (getattr(s, "TaskStageDef_Type", "") or "").strip().lower() != exclude_type
+                ]
+            # Compiling twice in a race is harmless: both plans are identical.
+            plan = self._plans[exclude_type] = FlowPlan.compile(stage_defs, self.taskdef)
+        return plan
+
+
+class FlowDefinitionCache:
+    """ Thread-safe, versioned LRU cache of FlowDefinitions keyed by Process_ID. """
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES):
+        self.max_entries = max(1, max_entries)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._version = 0
+        self.process_dao = AgentProcessDAO()
+        self.taskdef_dao = TaskDefDAO()
+        self.stage_dao = TaskStageDefDAO()
+
+    def get(self, process_id):
+        """ Returns the FlowDefinition for process_id, or None if the process does not exist. """
+        with self._lock:
+            flow = self._entries.get(process_id)
+            if flow is not None:
+                self._entries.move_to_end(process_id)
+                self.hits += 1
+                return flow
+            self.misses += 1
+            version = self._version
+
+        flow = self._load(process_id, version)
+        if flow is None:
+            return None
+
+        with self._lock:
+            if self._version == version:
+                self._entries[process_id] = flow
+                self._entries.move_to_end(process_id)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return flow
+
+    def invalidate(self, process_id=None):
+        """ Drops one flow (or every flow when process_id is None). """
+        with self._lock:
+            self._version += 1
+            if process_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(process_id, None)
+
+    def invalidate_taskdef(self, taskdef_id):
+        """ Drops every flow built on taskdef_id (its TaskDef or stages changed). """
+        with self._lock:
+            self._version += 1
+            stale = [
+                process_id for process_id, flow in self._entries.items()
+                if flow.process.Operation_Selected == taskdef_id
+            ]
+            for process_id in stale:
+                del self._entries[process_id]
+
+    def _load(self, process_id, version):
+        process = self.process_dao.get_AgentProcess_by_id(process_id)
+        if process is None:
+            return None
+        taskdef = self.taskdef_dao.get_TaskDef_by_id(process.Operation_Selected)
+        stage_defs = self.stage_dao.get_TaskStageDefs_for_task(process.Operation_Selected) if taskdef else []
+        return FlowDefinition(process, taskdef, stage_defs, version)
+
+
+_shared_cache = None
+_shared_cache_lock = threading.Lock()
+
+
+def get_flow_cache():
+    """ Returns the process-wide FlowDefinitionCache (created on first use). """
+    global _shared_cache
+    with _shared_cache_lock:
+        if _shared_cache is None:
+            _shared_cache = FlowDefinitionCache()
+        return _shared_cache
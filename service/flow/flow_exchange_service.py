@@ -1,6 +1,7 @@
 # ==========================================
 # File: flow_exchange_service.py
 # Added in iteration: 4
+# Updated in iteration: 5
 # Author: Karl Concha
 #
 # Purpose:
@@ -9,7 +10,10 @@
 
 from datetime import datetime
 
+from service.flow.chunker import MIN_CHUNK_TOKENS
+from service.flow.prompt_compiler import PROMPT_MODES
 from service.process.agent_process_service import AgentProcessService
+from task_logic.csv_table import CSV_INPUT_MODES
 from service.task_def_service import TaskDefService
 from service.task_stage_def_service import TaskStageService
 
@@ -42,12 +46,11 @@ class FlowExchangeService:
             "task_title": taskdef.TaskDef_Name,
             "task_description": taskdef.TaskDef_Description,
             "primer_text": process.Agent_Priming or "",
+            "cache_ttl_seconds": process.Cache_TTL_Seconds,
+            "prompt_mode": process.Prompt_Mode,
+            "csv_input_mode": process.Csv_Input_Mode,
             "stages": [
-                {
-                    "order": idx + 1,
-                    "name": s.TaskStageDef_Type,
-                    "description": s.TaskStageDef_Description
-                }
+                self._export_stage(idx + 1, s)
                 for idx, s in enumerate(stages_sorted)
                 if (s.TaskStageDef_Type or "").strip().lower() != "input"
             ]
@@ -72,6 +75,15 @@ class FlowExchangeService:
         for key in required:
             if key not in flow or flow[key] in (None, ""):
                 return False, f"Missing required field: flow.{key}"
+        cache_ttl = flow.get("cache_ttl_seconds")
+        if cache_ttl is not None and (not isinstance(cache_ttl, int) or cache_ttl < 0):
+            return False, "cache_ttl_seconds must be a non-negative integer."
+        prompt_mode = flow.get("prompt_mode")
+        if prompt_mode is not None and prompt_mode not in PROMPT_MODES:
+            return False, f"prompt_mode must be one of: {', '.join(PROMPT_MODES)}."
+        csv_input_mode = flow.get("csv_input_mode")
+        if csv_input_mode is not None and csv_input_mode not in CSV_INPUT_MODES:
+            return False, f"csv_input_mode must be one of: {', '.join(CSV_INPUT_MODES)}."
         stages = flow.get("stages")
         if not isinstance(stages, list) or not stages:
             return False, "Stages must be a non-empty array."
@@ -80,6 +92,38 @@ class FlowExchangeService:
                 return False, "Each stage must be an object."
             if not s.get("name") or not s.get("description"):
                 return False, "Each stage must include name and description."
+            depends_on = s.get("depends_on")
+            if depends_on is not None and (
+                not isinstance(depends_on, list)
+                or not all(isinstance(d, str) for d in depends_on)
+            ):
+                return False, "Stage depends_on must be an array of stage names."
+            chunk_tokens = s.get("chunk_tokens")
+            if chunk_tokens is not None and (
+                not isinstance(chunk_tokens, int)
+                or isinstance(chunk_tokens, bool)
+                or chunk_tokens < MIN_CHUNK_TOKENS
+            ):
+                return False, f"Stage chunk_tokens must be an integer of at least {MIN_CHUNK_TOKENS}."
+            if not isinstance(s.get("include_input", False), bool):
+                return False, "Stage include_input must be true or false."
+
+        # Stages are created in "order" order; depends_on may only name earlier stages
+        # (or "input"), the same rule FlowPlan applies when a run is planned.
+        try:
+            ordered_stages = sorted(stages, key=lambda st: st.get("order", 0))
+        except TypeError:
+            return False, "Stage order values must be numbers."
+        known_names = {"input"}
+        for s in ordered_stages:
+            stage_name = str(s["name"]).strip().lower()
+            if stage_name == "input":
+                continue
+            for dep_name in s.get("depends_on") or []:
+                dep_name = dep_name.strip().lower()
+                if dep_name and dep_name not in known_names:
+                    return False, f"Stage '{s['name']}' depends on unknown or later stage '{dep_name}'."
+            known_names.add(stage_name)
         return True, ""
 
     def import_flow(self, payload, user_id=1):
@@ -107,7 +151,14 @@ class FlowExchangeService:
             if stage_name.lower() == "input":
                 continue
             if stage_name and stage_desc:
-                self.stage_service.create_stage(taskdef_id, stage_name, stage_desc)
+                self.stage_service.create_stage(
+                    taskdef_id,
+                    stage_name,
+                    stage_desc,
+                    depends_on=s.get("depends_on"),
+                    chunk_tokens=s.get("chunk_tokens"),
+                    include_input=s.get("include_input", False)
+                )
 
         if not has_output:
             self.stage_service.create_stage(
@@ -121,10 +172,29 @@ class FlowExchangeService:
             agent_name=agent_name,
             agent_priming=flow.get("primer_text") or "",
             taskdef_id=taskdef_id,
-            ai_model=flow.get("ai_model") or ""
+            ai_model=flow.get("ai_model") or "",
+            cache_ttl_seconds=flow.get("cache_ttl_seconds") or None,
+            prompt_mode=flow.get("prompt_mode") or "full",
+            csv_input_mode=flow.get("csv_input_mode") or "full"
         )
         return getattr(created, "Process_ID", created)
 
+    @staticmethod
+    def _export_stage(order, stage):
+        exported = {
+            "order": order,
+            "name": stage.TaskStageDef_Type,
+            "description": stage.TaskStageDef_Description
+        }
+        depends_raw = (stage.TaskStageDef_Depends_On or "").strip()
+        if depends_raw:
+            exported["depends_on"] = [d.strip() for d in depends_raw.split(",") if d.strip()]
+        if stage.TaskStageDef_Chunk_Tokens:
+            exported["chunk_tokens"] = stage.TaskStageDef_Chunk_Tokens
+        if stage.TaskStageDef_Include_Input:
+            exported["include_input"] = True
+        return exported
+
     @staticmethod
     def _unique_name(base_name, existing_names):
         base_name = (base_name or "").strip() or "Imported Flow"
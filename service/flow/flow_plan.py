@@ -0,0 +1,214 @@
+# ==========================================
+# File: flow_plan.py
+# Added in iteration: 5
+# Author: Karl Concha
+#
+# Purpose:
+# Compiled ("executable") form of a flow's stage list. Everything about a
+# stage that does not depend on the run is worked out once here instead of
+# for every stage of every run:
+# - the stage DAG (input stages skipped, TaskStageDef_Depends_On resolved)
+# - the desired output type (keyword scan of type + description)
+# - the output rules and the rest of the stage prompt, as a template with
+#   the master prompt and the stage input left as placeholders
+# - the artifact file name stem (NN_stage_<type>)
+# - the master prompt template (agent metadata + workflow plan text)
+# A run then only fills in the templates.
+#
+# Notes:
+# - Flows run through the flow definition cache compile their plan once per
+#   cached version (FlowDefinition.plan); other callers compile on the fly.
+# - Plans are shared between runs and threads; treat them as read-only.
+# - Prompts and artifact names are the same as the Iteration 3 per-stage
+#   building produced.
+#
+# Used by StageExecutionEngine / AsyncStageExecutionEngine and agent_runtime_service.py
+# ==========================================
+
+from service.flow.prompt_compiler import PromptCompiler
+
+
+# Keywords (in type or description) that fix a stage's output type, checked in order.
+_OUTPUT_TYPE_KEYWORDS = (
+    ("svg", ("graph", "visual", "chart", "diagram", "visualize", "plot", "infographic")),
+    ("csv", ("csv", "table", "spreadsheet", "tabular", "rows", "columns", "export")),
+    ("json", ("json", "structured", "schema", "key-value", "object", "array", "fields")),
+)
+
+_FINAL_STAGE_RULES = """
+[OUTPUT RULES FOR FINAL STAGE]
+- This is the final stage. Do not mention stages, pipelines, or scripts.
+- Do not ask to proceed or request confirmation.
+- Provide the final response only.
+- Do not include code, pseudocode, or implementation steps.
+""".strip()
+
+_GRAPH_RULES = """
+[OUTPUT RULES FOR GRAPH]
+- Return ONLY JSON with keys: title, labels, values, x_label, y_label.
+- "labels" must be a list of strings and "values" must be a list of numbers.
+- Do not include prose, markdown, or code fences.
+""".strip()
+
+_TABLE_RULES = """
+[OUTPUT RULES FOR TABLE]
+- Return ONLY CSV text (no prose, no markdown).
+- First line must be the header row.
+""".strip()
+
+_STRUCTURED_RULES = """
+[OUTPUT RULES FOR STRUCTURED]
+- Return ONLY valid JSON.
+- Do not wrap in code fences or add commentary.
+""".strip()
+
+_PRIORITY_RULES = """
+[PRIORITY RULES]
+- The system primer sets global rules, tone, and formatting.
+- Stage instructions define the task for this step.
+- If there is a conflict, follow the system primer.
+""".strip()
+
+
+class StagePromptTemplate:
+    """ A stage prompt with everything except the master prompt and the stage input laid out. """
+
+    __slots__ = ("goal", "_head", "_tail")
+
+    def __init__(self, stage_type, stage_description, output_rules):
+        self.goal = (stage_description or "").strip()
+        self._head = f"\n\n[CURRENT STAGE]\nType: {(stage_type or '').strip()}\nGoal: "
+        self._tail = f"""
+
+[PRIORITY]
+{_PRIORITY_RULES}
+
+[INSTRUCTIONS]
+Perform ONLY this stage. Output must be suitable as input to the next stage.
+{output_rules}"""
+
+    def render(self, master_prompt, input_text, goal=None):
+        """ goal replaces the stage description (chunk map / merge steps). """
+        goal = self.goal if goal is None else goal.strip()
+        return "".join((
+            (master_prompt or "").strip(),
+            self._head,
+            goal,
+            "\n\n[CURRENT INPUT]\n",
+            (input_text or "").strip(),
+            self._tail
+        )).strip()
+
+
+class FlowPlan:
+    """ The compiled stage DAG and prompt templates of one flow. """
+
+    __slots__ = ("nodes", "names", "master")
+
+    def __init__(self, nodes, master):
+        self.nodes = tuple(nodes)
+        # stage order -> stage name (order 0 is the Stage 0 input)
+        self.names = {0: "input"}
+        self.names.update({node["order"]: node["stage_type"] for node in self.nodes})
+        self.master = master
+
+    @staticmethod
+    def compile(stage_defs, taskdef=None):
+        """
+        Builds the plan for stage_defs (in TaskStageDef_ID order, see _plan_nodes).
+        taskdef only feeds the master prompt template (agent name / description).
+        """
+        return FlowPlan(
+            FlowPlan._plan_nodes(stage_defs),
+            PromptCompiler.compile_master_template(taskdef, stage_defs)
+        )
+
+    @staticmethod
+    def _plan_nodes(stage_defs):
+        """
+        Builds the executable stage DAG.
+
+        - Stages are ordered deterministically by TaskStageDef_ID; "input" stages are skipped.
+        - TaskStageDef_Depends_On lists earlier stage names (comma-separated);
+          "input" refers to the Stage 0 artifact.
+        - Without explicit dependencies a stage consumes the most recent earlier stage that
+          is not visual (the Iteration 3 chaining rule), so chart stages branch off the
+          main chain and can run alongside the stages after them.
+        """
+        sorted_stages = sorted(stage_defs or [], key=lambda s: getattr(s, "TaskStageDef_ID", 0))
+
+        nodes = []
+        order_by_name = {"input": 0}
+        last_textual_order = 0
+        order = 0
+        for stage in sorted_stages:
+            stage_type_raw = (getattr(stage, "TaskStageDef_Type", "") or "").strip()
+            if stage_type_raw.lower() == "input":
+                continue
+            order += 1
+            stage_desc = (getattr(stage, "TaskStageDef_Description", "") or "").strip()
+
+            depends_raw = (getattr(stage, "TaskStageDef_Depends_On", None) or "").strip()
+            if depends_raw:
+                depends_on = []
+                for dep_name in depends_raw.split(","):
+                    dep_name = dep_name.strip().lower()
+                    if not dep_name:
+                        continue
+                    if dep_name not in order_by_name:
+                        raise Exception(
+                            f"Stage '{stage_type_raw}' depends on unknown or later stage '{dep_name}'."
+                        )
+                    if order_by_name[dep_name] not in depends_on:
+                        depends_on.append(order_by_name[dep_name])
+            else:
+                depends_on = [last_textual_order]
+
+            output_type = FlowPlan.desired_output_type(stage_type_raw, stage_desc)
+            safe_stage_type = stage_type_raw.replace(" ", "_").lower() or "stage"
+            nodes.append({
+                "order": order,
+                "stage": stage,
+                "stage_type": stage_type_raw,
+                "stage_desc": stage_desc,
+                "depends_on": tuple(depends_on or [0]),
+                "chunk_tokens": getattr(stage, "TaskStageDef_Chunk_Tokens", None),
+                "include_input": bool(getattr(stage, "TaskStageDef_Include_Input", 0)),
+                "output_type": output_type,
+                "artifact_stem": f"{order:02d}_stage_{safe_stage_type}",
+                "prompt": StagePromptTemplate(
+                    stage_type_raw,
+                    stage_desc,
+                    FlowPlan.output_rules(stage_type_raw, stage_desc)
+                )
+            })
+
+            order_by_name[stage_type_raw.lower()] = order
+            if output_type != "svg":
+                last_textual_order = order
+
+        return nodes
+
+    @staticmethod
+    def desired_output_type(stage_type, stage_description):
+        """ Output type fixed by the stage's type/description keywords (None = infer from output). """
+        haystack = f"{(stage_type or '').lower()} {(stage_description or '').lower()}"
+        for output_type, keywords in _OUTPUT_TYPE_KEYWORDS:
+            if any(keyword in haystack for keyword in keywords):
+                return output_type
+        return None
+
+    @staticmethod
+    def output_rules(stage_type, stage_description):
+        """ The [OUTPUT RULES ...] block appended to the stage's prompt ("" = none). """
+        stage_type_l = (stage_type or "").lower()
+        stage_desc_l = (stage_description or "").lower()
+        if stage_type_l == "output":
+            return _FINAL_STAGE_RULES
+        if "graph" in stage_type_l or "graph" in stage_desc_l or "visual" in stage_type_l or "visual" in stage_desc_l:
+            return _GRAPH_RULES
+        if "csv" in stage_type_l or "csv" in stage_desc_l or "table" in stage_desc_l:
+            return _TABLE_RULES
+        if "json" in stage_type_l or "json" in stage_desc_l or "structured" in stage_desc_l:
+            return _STRUCTURED_RULES
+        return ""
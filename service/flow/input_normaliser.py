@@ -1,11 +1,21 @@
 # ==========================================
 # File: input_normaliser.py
-# Updated in iteration: 4
+# Updated in iteration: 5
 # Author: Karl Concha
 #
 # - Read uploaded file (.txt / .pdf / .csv)
 # - NORMALISE extracted content to plain text for AI model to read
 # - Write initial artifact: 00_input_original.txt
+# - Iteration 5: the artifact is written while PDFs are still being extracted
+#   (page by page) instead of after every file has been read
+# - Iteration 5: .txt / .csv uploads are streamed the same way (blocks / rows),
+#   so reading and writing the upload does not hold it in memory. The
+#   normalised text is still returned as one string (it goes into the stage
+#   prompts), so a run's memory does grow with the extracted text size.
+# - Iteration 5: with an extraction cache (extraction_cache.py), files that
+#   were uploaded before are not read again
+# - Iteration 5: csv_mode (the flow's Csv_Input_Mode) can turn .csv uploads
+#   into column summaries / sampled rows (task_logic/csv_table.py)
 # 
 # #ChatGPT (OpenAI, 2025) – Assisted in structuring the Stage 0 input
 # normalisation process, defining the plain-text contract, and enforcing
@@ -16,6 +26,10 @@
 # ==========================================
 
 import os
+import shutil
+
+from service.flow.extraction_cache import make_extraction_key
+from task_logic.csv_table import CSV_INPUT_FULL
 from task_logic.file_reader import FileReader
 
 
@@ -29,58 +43,112 @@ class Stage0InputNormaliser:
     """
 
     @staticmethod
-    def run(file_path, run_folder, original_filename):
+    def run(file_path, run_folder, original_filename, extraction_cache=None, csv_mode=CSV_INPUT_FULL):
         """
         Reads and normalises an uploaded file and writes 00_input_original.txt.
         """
 
         return Stage0InputNormaliser.run_multi(
             files=[{"path": file_path, "name": original_filename}],
-            run_folder=run_folder
+            run_folder=run_folder,
+            extraction_cache=extraction_cache,
+            csv_mode=csv_mode
         )
 
     @staticmethod
-    def run_multi(files, run_folder):
+    def run_multi(files, run_folder, extraction_cache=None, csv_mode=CSV_INPUT_FULL):
         """
         Reads and normalises multiple uploaded files and writes 00_input_original.txt.
         Each file is separated with a clear header for traceability.
+        Files are read, normalised and written piece by piece (FileReader.iter_file),
+        so the upload is never held in memory while the artifact is written. The
+        returned text is the whole artifact read back as one string, so it is as
+        large as the extracted text.
+        extraction_cache (ExtractionCache) serves the text of files seen before and
+        stores the text of new ones.
+        csv_mode ("full" | "summary" | "sample") selects what a .csv contributes
+        (see FileReader.iter_csv_table).
         """
         if not files:
             raise Exception("No files provided for input normalisation.")
 
-        combined_parts = []
-
-        for idx, item in enumerate(files, start=1):
-            file_path = item.get("path")
-            file_name = item.get("name") or f"file_{idx}"
-
-            # 1) Read file using FileReader (handles pdf/txt/csv)
-            plain_text = FileReader.read_file(file_path)
-            if plain_text is None:
-                raise Exception("FileReader returned no content.")
-
-            # 2) Normalisation pass (stable formatting for subsequent stages)
-            plain_text = (
-                plain_text
-                .replace("\r\n", "\n")
-                .replace("\r", "\n")
-                .strip()
-            )
-
-            # If FileReader can’t handle the type, it returns a debug text
-            if plain_text == "[Unsupported file type]":
-                raise Exception(f"Unsupported file type: {file_name}")
-
-            if len(plain_text) == 0:
-                raise Exception(f"No text content extracted from file: {file_name}")
-
-            combined_parts.append(f"=== FILE {idx}: {file_name} ===\n{plain_text}")
-
-        combined_text = "\n\n".join(combined_parts).strip()
-
-        # 3) Write stage-0 artifact
         artifact_path = os.path.join(run_folder, "00_input_original.txt")
+
         with open(artifact_path, "w", encoding="utf-8") as f:
-            f.write(combined_text)
+            for idx, item in enumerate(files, start=1):
+                file_path = item.get("path")
+                file_name = item.get("name") or f"file_{idx}"
+
+                header = f"=== FILE {idx}: {file_name} ===\n"
+                if idx > 1:
+                    header = "\n\n" + header
+
+                variant = csv_mode if csv_mode != CSV_INPUT_FULL and file_path.endswith(".csv") else None
+                cache_key = make_extraction_key(file_path, variant) if extraction_cache else None
+                cached = extraction_cache.open(cache_key) if cache_key else None
+                if cached is not None:
+                    # Seen before: the cached text is already normalised (and not empty).
+                    with cached:
+                        f.write(header)
+                        shutil.copyfileobj(cached, f)
+                    continue
+
+                cache_entry = extraction_cache.writer(cache_key) if cache_key else None
+                try:
+                    # 1) Read file (handles pdf/txt/csv), 2) normalise, 3) write to the stage-0 artifact
+                    has_content = False
+                    pieces = Stage0InputNormaliser._read(file_path, file_name, csv_mode)
+                    for piece in Stage0InputNormaliser._normalise(pieces):
+                        if not has_content:
+                            f.write(header)
+                            has_content = True
+                        f.write(piece)
+                        if cache_entry:
+                            cache_entry.write(piece)
+
+                    if not has_content:
+                        raise Exception(f"No text content extracted from file: {file_name}")
+                except Exception:
+                    if cache_entry:
+                        cache_entry.discard()
+                    raise
+
+                if cache_entry:
+                    cache_entry.commit()
+
+        # Callers get the text as one string (read back once from the artifact);
+        # the prompts need all of it, so this part is not bounded.
+        with open(artifact_path, "r", encoding="utf-8") as f:
+            return f.read(), artifact_path
+
+    @staticmethod
+    def _read(file_path, file_name, csv_mode=CSV_INPUT_FULL):
+        """ The file's text as an iterable of pieces (pages, text blocks, CSV rows or a CSV summary). """
+        pieces = FileReader.iter_file(file_path, csv_mode)
+        if pieces is None:
+            raise Exception(f"Unsupported file type: {file_name}")
+        return pieces
 
-        return combined_text, artifact_path
+    @staticmethod
+    def _normalise(pieces):
+        """
+        Normalisation pass (stable formatting for subsequent stages): CRLF/CR -> LF and
+        surrounding whitespace stripped, applied to text that arrives in pieces.
+        Leading whitespace is dropped; trailing whitespace is held back until more
+        text follows it. Pieces must not split a CRLF pair (see FileReader.iter_file).
+        """
+        started = False
+        held_whitespace = ""
+        for piece in pieces:
+            piece = piece.replace("\r\n", "\n").replace("\r", "\n")
+            if not started:
+                piece = piece.lstrip()
+                if not piece:
+                    continue
+                started = True
+            body = piece.rstrip()
+            if not body:
+                held_whitespace += piece
+                continue
+            yield held_whitespace + body
+            held_whitespace = piece[len(body):]
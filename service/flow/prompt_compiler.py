@@ -1,6 +1,6 @@
 # ==========================================
 # File: prompt_compiler.py
-# Updated in iteration: 4
+# Updated in iteration: 5
 # Author: Karl Concha
 #
 # Build a “master prompt” that describes:
@@ -9,6 +9,17 @@
 # - workflow plan (stages)
 # - current input (stage-0 plain text)
 #
+# Iteration 5: in flows with chunked (map-reduce) stages, input larger than the
+# smallest chunk size is left out of [INPUT] so the master prompt does not push
+# chunk calls back over the context limit (stages still get their input, or a
+# chunk of it, under [CURRENT INPUT]).
+# Iteration 5: prompt_mode "compact" replaces [INPUT] with a short digest (size,
+# file names, opening lines); stages then see the original text only when they
+# depend on "input" or opt in with TaskStageDef_Include_Input.
+# Iteration 5: the input-independent part (agent metadata, workflow plan) is
+# compiled once into a MasterPromptTemplate; flows from the flow definition
+# cache keep theirs in the compiled flow plan (flow_plan.py).
+#
 # #ChatGPT (OpenAI, 2025) – Assisted in designing a structured master
 # prompt composition strategy combining agent priming, workflow stages,
 # and normalised input text to improve consistency across stages.
@@ -18,15 +29,85 @@
 # Used in agent_runtime_service.py
 # ==========================================
 
+import re
+
+from service.flow.chunker import InputChunker
+
+
+PROMPT_MODE_FULL = "full"
+PROMPT_MODE_COMPACT = "compact"
+PROMPT_MODES = (PROMPT_MODE_FULL, PROMPT_MODE_COMPACT)
+
+# Characters of the input kept as an excerpt in the compact digest.
+DIGEST_EXCERPT_CHARS = 300
+
+_FILE_HEADER = re.compile(r"^=== FILE \d+: (.+?) ===\s*$", re.MULTILINE)
+
+
+class MasterPromptTemplate:
+    """
+    The master prompt of one flow with everything except [INPUT] laid out
+    (see PromptCompiler.compile_master_template).
+    """
+
+    __slots__ = ("_head", "_tail", "chunk_limit")
+
+    def __init__(self, agent_name, agent_desc, stage_plan, chunk_limit=None):
+        self._head = f"""
+[AGENT TEMPLATE]
+Name: {agent_name}
+Description: {agent_desc}
+
+[WORKFLOW PLAN]
+{stage_plan}
+
+[INPUT]
+""".lstrip()
+        self._tail = """
+
+[OUTPUT RULES]
+- Follow the workflow plan step-by-step.
+- Keep outputs clear and structured.
+- Do not invent facts not present in the input.
+""".rstrip()
+        # Smallest TaskStageDef_Chunk_Tokens in the flow (None = no chunked stages).
+        self.chunk_limit = chunk_limit
+
+    def render(self, input_text, prompt_mode=PROMPT_MODE_FULL):
+        """
+        prompt_mode "full" embeds the Stage 0 text under [INPUT]; "compact" embeds
+        only a digest of it (see PromptCompiler.input_digest).
+        """
+        input_text = (input_text or "").strip()
+
+        # Chunked stages must not receive the full input through the master prompt.
+        if prompt_mode == PROMPT_MODE_COMPACT:
+            input_text = PromptCompiler.input_digest(input_text)
+        elif self.chunk_limit and InputChunker.estimate_tokens(input_text) > self.chunk_limit:
+            input_text = (
+                f"(Omitted here: about {InputChunker.estimate_tokens(input_text)} tokens. Each stage "
+                "receives its input, or one chunk of it, under [CURRENT INPUT].)"
+            )
+
+        return f"{self._head}{input_text}{self._tail}"
+
 
 class PromptCompiler:
     """Helper for producing the master prompt that is used to guide stage prompts."""
 
     @staticmethod
-    def compile_master_prompt(agent_priming, taskdef, stage_defs, input_text):
-        agent_priming = (agent_priming or "").strip()
-        input_text = (input_text or "").strip()
+    def compile_master_prompt(agent_priming, taskdef, stage_defs, input_text, prompt_mode=PROMPT_MODE_FULL):
+        """
+        prompt_mode "full" embeds the Stage 0 text under [INPUT]; "compact" embeds
+        only a digest of it (see input_digest).
+        Flows run from the flow definition cache reuse a compiled template instead
+        (FlowPlan.master, see flow_plan.py).
+        """
+        return PromptCompiler.compile_master_template(taskdef, stage_defs).render(input_text, prompt_mode)
 
+    @staticmethod
+    def compile_master_template(taskdef, stage_defs):
+        """Builds the input-independent part of a flow's master prompt."""
         # Build a readable workflow plan for the model.
         # Note: StageExecutionEngine will skip stages where type == "input".
         plain_lines = []
@@ -45,24 +126,35 @@ class PromptCompiler:
 
         stage_plan = "\n".join(plain_lines).strip() or "No stages defined"
 
+        chunk_limits = [
+            stage.TaskStageDef_Chunk_Tokens for stage in stage_defs or []
+            if getattr(stage, "TaskStageDef_Chunk_Tokens", None)
+        ]
+
         agent_name = (getattr(taskdef, "TaskDef_Name", None) or "[Unnamed Agent]").strip()
         agent_desc = (getattr(taskdef, "TaskDef_Description", None) or "").strip()
 
-        master_prompt = f"""
-[AGENT TEMPLATE]
-Name: {agent_name}
-Description: {agent_desc}
-
-[WORKFLOW PLAN]
-{stage_plan}
+        return MasterPromptTemplate(agent_name, agent_desc, stage_plan, min(chunk_limits, default=None))
 
-[INPUT]
-{input_text}
+    @staticmethod
+    def input_digest(input_text, excerpt_chars=DIGEST_EXCERPT_CHARS):
+        """
+        Short stand-in for the Stage 0 text: its size, the uploaded file names and
+        the opening lines. Keeps the shared prompt small in compact mode; input that
+        is already shorter than its digest is returned unchanged.
+        """
+        input_text = (input_text or "").strip()
+        if not input_text:
+            return ""
 
-[OUTPUT RULES]
-- Follow the workflow plan step-by-step.
-- Keep outputs clear and structured.
-- Do not invent facts not present in the input.
-""".strip()
+        lines = [f"(Digest only: the full input is about {InputChunker.estimate_tokens(input_text)} tokens.)"]
+        file_names = _FILE_HEADER.findall(input_text)
+        if file_names:
+            lines.append("Files: " + ", ".join(file_names))
 
-        return master_prompt
+        body = _FILE_HEADER.sub("", input_text).strip()
+        excerpt = " ".join(body[:excerpt_chars].split())
+        if excerpt:
+            lines.append(f"Opening: {excerpt}{'…' if len(body) > excerpt_chars else ''}")
+        digest = "\n".join(lines)
+        return digest if len(digest) < len(input_text) else input_text
@@ -1,13 +1,16 @@
 # ==========================================
 # File: model_client_ollama.py
-# Updated in iteration: 4
+# Updated in iteration: 5
 # Author: Karl Concha
 #
 # Lightweight client for calling a locally hosted Ollama instance.
 #
 # Notes:
-# - Uses the /api/generate endpoint with stream=False
+# - Uses the /api/chat endpoint with stream=False (generate)
+# - generate_stream uses stream=True and yields content chunks as they arrive
 # - Raises exceptions for HTTP/network errors so the runtime can mark stages FAILED
+# - All clients share one process-wide requests.Session (pooled keep-alive
+#   connections); connection resets are retried with exponential backoff
 #
 # #ChatGPT (OpenAI, 2025) – Assisted in structuring a minimal Ollama model
 # client abstraction with explicit error propagation to support safe
@@ -18,7 +21,43 @@
 # Used by StageExecutionEngine to generate stage output within agent_runtime_service
 # ==========================================
 
+import json
+import threading
+import time
+
 import requests
+from requests.adapters import HTTPAdapter
+
+
+DEFAULT_POOL_SIZE = 16
+DEFAULT_MAX_RETRIES = 3
+DEFAULT_BACKOFF_SECONDS = 0.5
+
+_shared_session = None
+_shared_session_lock = threading.Lock()
+
+
+def get_shared_session(pool_size=DEFAULT_POOL_SIZE):
+    """
+    Returns the process-wide requests.Session used for Ollama calls.
+    pool_size only applies when the session is first created.
+    """
+    global _shared_session
+    with _shared_session_lock:
+        if _shared_session is None:
+            session = requests.Session()
+            # Retries are handled by the client so only connection resets are retried
+            # (a read timeout on a long generation must not be repeated).
+            adapter = HTTPAdapter(
+                pool_connections=pool_size,
+                pool_maxsize=pool_size,
+                max_retries=0
+            )
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            session.headers.update({"Connection": "keep-alive"})
+            _shared_session = session
+        return _shared_session
 
 
 class OllamaModelClient:
@@ -26,9 +65,19 @@ class OllamaModelClient:
     Minimal Ollama HTTP client for localhost.
     """
 
-    def __init__(self, host="http://localhost:11434", timeout_seconds=300):
+    def __init__(
+        self,
+        host="http://localhost:11434",
+        timeout_seconds=300,
+        session=None,
+        max_retries=DEFAULT_MAX_RETRIES,
+        backoff_seconds=DEFAULT_BACKOFF_SECONDS
+    ):
         self.host = host.rstrip("/")
         self.timeout_seconds = timeout_seconds
+        self.session = session or get_shared_session()
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
 
     def generate(self, model_name, prompt, system_prompt=None):
         """
@@ -36,22 +85,9 @@ class OllamaModelClient:
         If system_prompt is provided, it is sent as a top-level system instruction.
         """
 
-        messages = []
-        if system_prompt:
-            messages.append({"role": "system", "content": system_prompt})
-        messages.append({"role": "user", "content": prompt})
-
-        payload = {
-            "model": model_name,
-            "messages": messages,
-            "stream": False
-        } #The packet of data to send to ollama 
+        payload = self._build_payload(model_name, prompt, system_prompt, stream=False)
 
-        r = requests.post(
-            f"{self.host}/api/chat",
-            json=payload, #specifying the payload to be json
-            timeout=self.timeout_seconds
-        )
+        r = self._post(payload) #specifying the payload to be json
 
         # If Ollama returns 4xx/5xx this will raise, and the runtime will mark stage FAILED.
         r.raise_for_status()
@@ -65,3 +101,65 @@ class OllamaModelClient:
             raise Exception("Ollama returned an empty response.")
 
         return response_text
+
+    def generate_stream(self, model_name, prompt, system_prompt=None):
+        """
+        Generate a response from Ollama as a stream of content chunks.
+        Ollama sends one JSON object per line; each carries a slice of message.content.
+        """
+
+        payload = self._build_payload(model_name, prompt, system_prompt, stream=True)
+
+        with self._post(payload, stream=True) as r:
+            r.raise_for_status()
+
+            for line in r.iter_lines():
+                if not line:
+                    continue
+                data = json.loads(line)
+                if data.get("error"):
+                    raise Exception(f"Ollama error: {data['error']}")
+
+                message = data.get("message") or {}
+                chunk = message.get("content") or ""
+                if chunk:
+                    yield chunk
+
+                if data.get("done"):
+                    break
+
+    def _post(self, payload, stream=False):
+        """
+        POSTs to /api/chat on the shared session.
+        Connection errors (refused/reset before a response arrives) are retried with
+        exponential backoff; timeouts and HTTP errors are raised straight away.
+        """
+        attempt = 0
+        while True:
+            try:
+                return self.session.post(
+                    f"{self.host}/api/chat",
+                    json=payload,
+                    timeout=self.timeout_seconds,
+                    stream=stream
+                )
+            except requests.exceptions.ConnectTimeout:
+                raise
+            except requests.exceptions.ConnectionError:
+                if attempt >= self.max_retries:
+                    raise
+                time.sleep(self.backoff_seconds * (2 ** attempt))
+                attempt += 1
+
+    @staticmethod
+    def _build_payload(model_name, prompt, system_prompt, stream):
+        messages = []
+        if system_prompt:
+            messages.append({"role": "system", "content": system_prompt})
+        messages.append({"role": "user", "content": prompt})
+
+        return {
+            "model": model_name,
+            "messages": messages,
+            "stream": stream
+        } #The packet of data to send to ollama
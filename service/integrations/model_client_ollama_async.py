@@ -0,0 +1,157 @@
+# ==========================================
+# File: model_client_ollama_async.py
+# Added in iteration: 5
+# Author: Karl Concha
+#
+# asyncio counterpart of OllamaModelClient, used by AsyncStageExecutionEngine.
+#
+# Notes:
+# - Same /api/chat payloads, error handling and retry/backoff rules as the
+#   sync client, but calls are awaited so one event loop can keep many stage
+#   calls in flight while the model server is generating
+# - Built on httpx (optional dependency: only needed for the asyncio run mode)
+# - One pooled httpx.AsyncClient is shared per event loop
+# ==========================================
+
+import asyncio
+import json
+import weakref
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+from service.integrations.model_client_ollama import (
+    DEFAULT_BACKOFF_SECONDS,
+    DEFAULT_MAX_RETRIES,
+    OllamaModelClient
+)
+
+
+DEFAULT_MAX_CONNECTIONS = 256
+
+_shared_clients = weakref.WeakKeyDictionary()
+
+
+def get_shared_async_client(max_connections=DEFAULT_MAX_CONNECTIONS):
+    """
+    Returns the httpx.AsyncClient shared by every async Ollama call on the running loop.
+    max_connections only applies when the client is first created for that loop.
+    """
+    if httpx is None:
+        raise Exception("The asyncio engine requires httpx (pip install httpx).")
+
+    loop = asyncio.get_running_loop()
+    client = _shared_clients.get(loop)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections
+            )
+        )
+        _shared_clients[loop] = client
+    return client
+
+
+class AsyncOllamaModelClient:
+    """
+    Minimal async Ollama HTTP client for localhost.
+    """
+
+    def __init__(
+        self,
+        host="http://localhost:11434",
+        timeout_seconds=300,
+        client=None,
+        max_retries=DEFAULT_MAX_RETRIES,
+        backoff_seconds=DEFAULT_BACKOFF_SECONDS
+    ):
+        if httpx is None:
+            raise Exception("The asyncio engine requires httpx (pip install httpx).")
+        self.host = host.rstrip("/")
+        self.timeout_seconds = timeout_seconds
+        self.client = client
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+
+    async def generate(self, model_name, prompt, system_prompt=None):
+        """
+        Generate a single response from Ollama (non-streaming).
+        If system_prompt is provided, it is sent as a top-level system instruction.
+        """
+
+        payload = OllamaModelClient._build_payload(model_name, prompt, system_prompt, stream=False)
+
+        r = await self._post(payload)
+        try:
+            # If Ollama returns 4xx/5xx this will raise, and the engine will mark the stage FAILED.
+            r.raise_for_status()
+            await r.aread()
+            data = r.json() if r.content else {}
+        finally:
+            await r.aclose()
+
+        message = data.get("message") or {}
+        response_text = (message.get("content") or "").strip()
+
+        if not response_text:
+            # Empty responses are treated as failed stages.
+            raise Exception("Ollama returned an empty response.")
+
+        return response_text
+
+    async def generate_stream(self, model_name, prompt, system_prompt=None):
+        """
+        Generate a response from Ollama as an async stream of content chunks.
+        Ollama sends one JSON object per line; each carries a slice of message.content.
+        """
+
+        payload = OllamaModelClient._build_payload(model_name, prompt, system_prompt, stream=True)
+
+        r = await self._post(payload)
+        try:
+            r.raise_for_status()
+
+            async for line in r.aiter_lines():
+                if not line:
+                    continue
+                data = json.loads(line)
+                if data.get("error"):
+                    raise Exception(f"Ollama error: {data['error']}")
+
+                message = data.get("message") or {}
+                chunk = message.get("content") or ""
+                if chunk:
+                    yield chunk
+
+                if data.get("done"):
+                    break
+        finally:
+            await r.aclose()
+
+    async def _post(self, payload):
+        """
+        Sends POST /api/chat and returns the (unread) streaming response.
+        Connection errors are retried with exponential backoff; timeouts and HTTP
+        errors are raised straight away (same rules as OllamaModelClient._post).
+        """
+        client = self.client or get_shared_async_client()
+        attempt = 0
+        while True:
+            try:
+                request = client.build_request(
+                    "POST",
+                    f"{self.host}/api/chat",
+                    json=payload,
+                    timeout=self.timeout_seconds
+                )
+                return await client.send(request, stream=True)
+            except httpx.TimeoutException:
+                raise
+            except (httpx.ConnectError, httpx.RemoteProtocolError):
+                if attempt >= self.max_retries:
+                    raise
+                await asyncio.sleep(self.backoff_seconds * (2 ** attempt))
+                attempt += 1
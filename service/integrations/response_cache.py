@@ -0,0 +1,244 @@
+# ==========================================
+# File: response_cache.py
+# Added in iteration: 5
+# Author: Karl Concha
+#
+# Purpose:
+# Opt-in, content-addressed cache for stage model calls.
+# - Key: SHA-256 of (model name, system prompt, SHA-256 of the stage prompt)
+# - Stored in its own SQLite file (response_cache.db), separate from rainn.db
+# - Entries expire after the flow's TTL (AgentProcess.Cache_TTL_Seconds),
+#   capped at the run privacy TTL (clamp_cache_ttl)
+# - Size-bounded: least recently used entries are evicted first
+# - AsyncCachedModelClient wraps the asyncio client (cache I/O runs off the loop)
+# - Expired entries are also purged by the RunReaper (run_reaper_service.py),
+#   so they do not outlive their TTL when a flow stops writing
+#
+# Notes:
+# - Cached responses contain model output derived from user input, so a
+#   flow only uses the cache when its TTL is set (privacy-first default).
+# - Streamed calls are served from the cache but not stored in it, so a
+#   streamed response is not held in memory on top of its .part artifact.
+# ==========================================
+
+import asyncio
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+from service.task_instance_service import DEFAULT_TTL_SECONDS
+
+
+DEFAULT_CACHE_DB = "response_cache.db"
+DEFAULT_MAX_ENTRIES = 5000
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+# Cached model output is derived from user input, so it is kept no longer than a run.
+MAX_CACHE_TTL_SECONDS = DEFAULT_TTL_SECONDS
+
+
+def clamp_cache_ttl(ttl_seconds):
+    """Returns a flow's cache TTL capped at MAX_CACHE_TTL_SECONDS (None when caching is off)."""
+    if not ttl_seconds or ttl_seconds <= 0:
+        return None
+    return min(int(ttl_seconds), MAX_CACHE_TTL_SECONDS)
+
+
+def make_cache_key(model_name, system_prompt, prompt):
+    """Builds the content address for a model call."""
+    prompt_hash = hashlib.sha256((prompt or "").encode("utf-8")).hexdigest()
+    key_source = "\x1f".join([model_name or "", system_prompt or "", prompt_hash])
+    return hashlib.sha256(key_source.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """SQLite-backed LRU cache of model responses with per-entry expiry."""
+
+    def __init__(self, db_name=DEFAULT_CACHE_DB, max_entries=DEFAULT_MAX_ENTRIES, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.connection = sqlite3.connect(db_name, check_same_thread=False)
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS ResponseCache (
+                Cache_Key TEXT PRIMARY KEY,
+                Model_Name TEXT,
+                Response_Text TEXT NOT NULL,
+                Size_Bytes INTEGER NOT NULL,
+                Created_At REAL NOT NULL,
+                Last_Used_At REAL NOT NULL,
+                Expires_At REAL NOT NULL
+            )
+        """)
+        self.connection.execute(
+            "CREATE INDEX IF NOT EXISTS idx_responsecache_last_used ON ResponseCache (Last_Used_At)"
+        )
+        self.connection.commit()
+
+    def get(self, key):
+        """Returns the cached response for key, or None if missing/expired."""
+        now = time.time()
+        with self._lock:
+            row = self.connection.execute(
+                "SELECT Response_Text FROM ResponseCache WHERE Cache_Key = ? AND Expires_At > ?",
+                (key, now)
+            ).fetchone()
+            if not row:
+                return None
+            self.connection.execute(
+                "UPDATE ResponseCache SET Last_Used_At = ? WHERE Cache_Key = ?",
+                (now, key)
+            )
+            self.connection.commit()
+            return row[0]
+
+    def put(self, key, model_name, response_text, ttl_seconds):
+        """Stores a response and evicts expired / least recently used entries."""
+        now = time.time()
+        size_bytes = len(response_text.encode("utf-8"))
+        if size_bytes > self.max_bytes:
+            return
+        with self._lock:
+            self.connection.execute(
+                """
+                INSERT OR REPLACE INTO ResponseCache
+                    (Cache_Key, Model_Name, Response_Text, Size_Bytes, Created_At, Last_Used_At, Expires_At)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                """,
+                (key, model_name, response_text, size_bytes, now, now, now + ttl_seconds)
+            )
+            self._evict(now)
+            self.connection.commit()
+
+    def purge_expired(self):
+        """Deletes expired entries. Returns the number removed."""
+        with self._lock:
+            cursor = self.connection.execute(
+                "DELETE FROM ResponseCache WHERE Expires_At <= ?",
+                (time.time(),)
+            )
+            self.connection.commit()
+            return cursor.rowcount
+
+    def clear(self):
+        """Deletes every cached response."""
+        with self._lock:
+            self.connection.execute("DELETE FROM ResponseCache")
+            self.connection.commit()
+
+    def _evict(self, now):
+        self.connection.execute("DELETE FROM ResponseCache WHERE Expires_At <= ?", (now,))
+        count, total_bytes = self.connection.execute(
+            "SELECT COUNT(*), COALESCE(SUM(Size_Bytes), 0) FROM ResponseCache"
+        ).fetchone()
+        if count <= self.max_entries and total_bytes <= self.max_bytes:
+            return
+
+        # Walk from least recently used until both bounds are met.
+        remove_keys = []
+        rows = self.connection.execute(
+            "SELECT Cache_Key, Size_Bytes FROM ResponseCache ORDER BY Last_Used_At ASC"
+        )
+        for cache_key, row_bytes in rows:
+            if count <= self.max_entries and total_bytes <= self.max_bytes:
+                break
+            remove_keys.append((cache_key,))
+            count -= 1
+            total_bytes -= row_bytes
+        self.connection.executemany("DELETE FROM ResponseCache WHERE Cache_Key = ?", remove_keys)
+
+
+_shared_cache = None
+_shared_cache_lock = threading.Lock()
+
+
+def get_response_cache():
+    """Returns the process-wide ResponseCache (created on first use)."""
+    global _shared_cache
+    with _shared_cache_lock:
+        if _shared_cache is None:
+            _shared_cache = ResponseCache()
+        return _shared_cache
+
+
+def get_existing_response_cache():
+    """
+    Returns the process-wide ResponseCache if a flow has used it (in this process
+    or, via response_cache.db on disk, a previous one); otherwise None.
+    Used for cleanup, so flows that never opt in never create the cache.
+    """
+    global _shared_cache
+    with _shared_cache_lock:
+        if _shared_cache is None and os.path.isfile(DEFAULT_CACHE_DB):
+            _shared_cache = ResponseCache()
+        return _shared_cache
+
+
+class CachedModelClient:
+    """
+    Wraps a model client so identical stage calls are served from ResponseCache.
+    Exposes the same generate / generate_stream interface as OllamaModelClient;
+    generate_stream reads the cache but does not write to it.
+    """
+
+    def __init__(self, model_client, cache, ttl_seconds):
+        self.model_client = model_client
+        self.cache = cache
+        self.ttl_seconds = ttl_seconds
+
+    def generate(self, model_name, prompt, system_prompt=None):
+        key = make_cache_key(model_name, system_prompt, prompt)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+
+        response_text = self.model_client.generate(model_name, prompt, system_prompt=system_prompt)
+        if response_text:
+            self.cache.put(key, model_name, response_text, self.ttl_seconds)
+        return response_text
+
+    def generate_stream(self, model_name, prompt, system_prompt=None):
+        key = make_cache_key(model_name, system_prompt, prompt)
+        cached = self.cache.get(key)
+        if cached is not None:
+            yield cached
+            return
+
+        # Not stored: the engine already writes the stream to its .part artifact.
+        yield from self.model_client.generate_stream(model_name, prompt, system_prompt=system_prompt)
+
+
+class AsyncCachedModelClient:
+    """
+    asyncio counterpart of CachedModelClient (wraps AsyncOllamaModelClient).
+    SQLite lookups run in a worker thread so the event loop is never blocked.
+    """
+
+    def __init__(self, model_client, cache, ttl_seconds):
+        self.model_client = model_client
+        self.cache = cache
+        self.ttl_seconds = ttl_seconds
+
+    async def generate(self, model_name, prompt, system_prompt=None):
+        key = make_cache_key(model_name, system_prompt, prompt)
+        cached = await asyncio.to_thread(self.cache.get, key)
+        if cached is not None:
+            return cached
+
+        response_text = await self.model_client.generate(model_name, prompt, system_prompt=system_prompt)
+        if response_text:
+            await asyncio.to_thread(self.cache.put, key, model_name, response_text, self.ttl_seconds)
+        return response_text
+
+    async def generate_stream(self, model_name, prompt, system_prompt=None):
+        key = make_cache_key(model_name, system_prompt, prompt)
+        cached = await asyncio.to_thread(self.cache.get, key)
+        if cached is not None:
+            yield cached
+            return
+
+        # Not stored: the engine already writes the stream to its .part artifact.
+        async for chunk in self.model_client.generate_stream(model_name, prompt, system_prompt=system_prompt):
+            yield chunk
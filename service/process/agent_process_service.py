@@ -1,14 +1,23 @@
 # ==========================================
 # File: agent_process_service.py
 # Created in iteration: 2
+# Updated in iteration: 5
 # Author: Karl Concha
 #
 # #ChatGPT (OpenAI, 2025) – Assisted in renaming service layer to match
 # AgentProcess architecture and ensuring business logic separation
 # according to FYP Bible guidelines.
+#
+# Iteration 5: get_flow serves runs from the flow definition cache;
+# create/update/delete invalidate the cached entry.
+# Iteration 5: create_process takes the flow's csv_input_mode.
+# Iteration 5: cache TTLs are capped at the run privacy TTL on create/update.
 # ==========================================
 
-from dao.agent_process_dao import AgentProcessDAO
+from dao.agent_process_dao import AGENT_PROCESS_COLUMNS, AgentProcessDAO
+from dao.db_connection import DEFAULT_PAGE_SIZE
+from service.flow.flow_definition_cache import get_flow_cache
+from service.integrations.response_cache import clamp_cache_ttl
 from model.agent_process import AgentProcess
 
 
@@ -18,7 +27,8 @@ class AgentProcessService:
     def __init__(self):
         self.dao = AgentProcessDAO()
 
-    def create_process(self, user_id, agent_name, agent_priming, taskdef_id, ai_model):
+    def create_process(self, user_id, agent_name, agent_priming, taskdef_id, ai_model, cache_ttl_seconds=None,
+                       prompt_mode="full", csv_input_mode="full"):
         """ Creates a new agent process entry in the database. """
         new_process = AgentProcess(
             Process_ID=None,
@@ -27,22 +37,39 @@ class AgentProcessService:
             Agent_Priming=agent_priming,
             Operation_Selected=taskdef_id,
             AI_Model=ai_model,
-            Created_At=None
+            Created_At=None,
+            Cache_TTL_Seconds=clamp_cache_ttl(cache_ttl_seconds),
+            Prompt_Mode=prompt_mode,
+            Csv_Input_Mode=csv_input_mode
         )
-        return self.dao.add_AgentProcess(new_process)
+        created = self.dao.add_AgentProcess(new_process)
+        get_flow_cache().invalidate(created.Process_ID)
+        return created
 
     def get_process(self, process_id):
         """ Retrieves a process by ID. """
         return self.dao.get_AgentProcess_by_id(process_id)
 
+    def get_flow(self, process_id):
+        """ Returns the cached FlowDefinition (process, taskdef, stage_defs) or None. Read-only. """
+        return get_flow_cache().get(process_id)
+
     def list_processes(self):
         """ Returns all stored agent processes (newest first). """
         return self.dao.get_all_AgentProcesses()
 
+    def list_processes_page(self, columns=AGENT_PROCESS_COLUMNS, before_id=None, limit=DEFAULT_PAGE_SIZE):
+        """ Returns one page of agent processes (newest first) and the before_id of the next page. """
+        return self.dao.get_AgentProcess_page(columns, before_id, limit)
+
     def update_process(self, agent_process):
         """ Full update handler. """
+        agent_process.Cache_TTL_Seconds = clamp_cache_ttl(agent_process.Cache_TTL_Seconds)
         self.dao.update_AgentProcess(agent_process)
+        get_flow_cache().invalidate(agent_process.Process_ID)
 
     def delete_process(self, process_id):
         """ Deletes a process record. """
-        return self.dao.delete_AgentProcess(process_id)
+        deleted = self.dao.delete_AgentProcess(process_id)
+        get_flow_cache().invalidate(process_id)
+        return deleted
@@ -1,6 +1,6 @@
 # ==========================================
 # File: agent_runtime_service.py
-# Updated in iteration: 4
+# Updated in iteration: 5
 # Author: Karl Concha
 #
 # Central runtime orchestrator for executing an AgentProcess.
@@ -23,12 +23,38 @@
 # Notes:
 # - DB logic is done via Service/DAO layers (TaskInstanceService, TaskStageInstanceService)
 # - Stage execution is delegated to StageExecutionEngine
+# - start_task creates the TaskInstance up front so a run can be queued
+#   (see run_queue_service.py) and executed later by run_task
+# - run_batch fans a multi-file upload out into one child TaskInstance per
+#   file, then runs the flow's optional "reduce" stage over their outputs
+# - resume_task restarts a FAILED run from its failed stage, reusing the
+#   artifacts of the stages that already completed
+# - run_task_async is the asyncio variant of run_task (AsyncStageExecutionEngine);
+#   blocking DB / file steps run in worker threads via asyncio.to_thread
+# - The flow's Prompt_Mode is applied to the master prompt and the stage engine
+# - Related DB writes (new run + run folder, batch children + manifest) are
+#   grouped into one transaction each (dao/db_connection.py)
+# - The flow (process, TaskDef, stages) comes from the flow definition cache
+#   (flow_definition_cache.py) instead of three queries per run
+# - Runs use the flow's compiled plan (flow_plan.py): the stage DAG, prompt
+#   templates and master prompt template are built once per flow version
+# - Stage 0 reuses the extracted text of files uploaded before (extraction_cache.py)
+# - The final output is read through ArtifactStore (artifact_store.py)
+# - The flow's Csv_Input_Mode decides whether Stage 0 passes CSV uploads on in
+#   full or as column summaries / sampled rows (task_logic/csv_table.py)
 # ==========================================
 
+import asyncio
+import copy
+import json
 import os
+from concurrent.futures import ThreadPoolExecutor
 
+from dao.db_connection import transaction
 from service.flow.input_normaliser import Stage0InputNormaliser
+from service.process.artifact_store import ArtifactStore
 from service.process.stage_execution_engine import StageExecutionEngine
+from service.process.async_stage_execution_engine import AsyncStageExecutionEngine
 
 from service.task_instance_service import TaskInstanceService
 from service.task_stage_instance_service import TaskStageInstanceService
@@ -36,8 +62,33 @@ from service.process.agent_process_service import AgentProcessService
 from service.task_def_service import TaskDefService
 from service.task_stage_def_service import TaskStageService
 
-from service.flow.prompt_compiler import PromptCompiler
+from service.flow.extraction_cache import get_extraction_cache
+from service.flow.flow_definition_cache import FlowDefinition
+from service.flow.flow_plan import FlowPlan
+from service.flow.prompt_compiler import PROMPT_MODE_FULL
 from service.integrations.model_client_ollama import OllamaModelClient
+from service.integrations.model_client_ollama_async import AsyncOllamaModelClient
+from service.integrations.response_cache import (
+    AsyncCachedModelClient,
+    CachedModelClient,
+    clamp_cache_ttl,
+    get_response_cache
+)
+from task_logic.csv_table import CSV_INPUT_FULL
+
+
+# Stage output is streamed to <artifact>.part while generating (see /run_stream/<id>).
+STREAM_STAGE_OUTPUT = True
+
+# Stage 0 serves re-uploaded files from the extraction cache (same privacy TTL as runs).
+USE_EXTRACTION_CACHE = True
+
+# Upper bound on independent stages (DAG branches) running at once within one run.
+MAX_STAGE_CONCURRENCY = 2
+
+# Batch mode: per-file child runs executing at once, and the merge stage type.
+BATCH_CONCURRENCY = 4
+REDUCE_STAGE_TYPE = "reduce"
 
 
 class AgentRuntime:
@@ -51,18 +102,15 @@ class AgentRuntime:
     """
 
     @staticmethod
-    def run_task(process_id, taskdef_id, file_path, original_filename=None):
+    def start_task(process_id, taskdef_id, parent_task_instance_id=None):
         """
-        Executes Stage 0 (Input Normalisation) and then executes stages 1..N.
+        Creates the TaskInstance (RUNNING) and its run folder without executing anything.
+        Returns the new TaskInstance_ID so callers can hand it back before the run starts.
         """
 
         task_instance_service = TaskInstanceService()
-        task_stage_instance_service = TaskStageInstanceService()
-
-        task_instance_id = None
-        stage0_id = None
 
-        try:
+        with transaction():
             # ------------------------------------------
             # 1) Create TaskInstance (RUNNING)
             # ------------------------------------------
@@ -70,7 +118,8 @@ class AgentRuntime:
                 process_id_fk=process_id,
                 taskdef_id_fk=taskdef_id,
                 status="RUNNING",
-                run_folder=""
+                run_folder="",
+                parent_task_instance_id_fk=parent_task_instance_id
             )
 
             # ------------------------------------------
@@ -80,133 +129,442 @@ class AgentRuntime:
             os.makedirs(run_folder, exist_ok=True)
             task_instance_service.update_run_folder(task_instance_id, run_folder)
 
+        return task_instance_id
+
+    @staticmethod
+    def run_task(process_id, taskdef_id, file_path, original_filename=None, task_instance_id=None,
+                 skip_reduce=False):
+        """
+        Executes Stage 0 (Input Normalisation) and then executes stages 1..N.
+        If task_instance_id is provided (queued run), the existing TaskInstance is used.
+        skip_reduce leaves out "reduce" stages (batch children; the parent runs them).
+        """
+
+        task_instance_service = TaskInstanceService()
+
+        try:
+            # ------------------------------------------
+            # 1-2) Create TaskInstance + run folder (unless already queued)
+            # ------------------------------------------
+            if task_instance_id is None:
+                task_instance_id = AgentRuntime.start_task(process_id, taskdef_id)
+
+            run_folder = os.path.join("agent_runs", str(task_instance_id))
+            os.makedirs(run_folder, exist_ok=True)
+
             artifacts_dir = os.path.join(run_folder, "artifacts")
             os.makedirs(artifacts_dir, exist_ok=True)
 
             # ------------------------------------------
-            # 3) Create Stage 0 TaskStageInstance (RUNNING)
+            # 3-5) Stage 0: normalise the upload to 00_input_original.txt
             # ------------------------------------------
-            stage0_id = task_stage_instance_service.create_stage_instance(
-                task_instance_id_fk=task_instance_id,
-                stage_order=0,
-                stage_name="input",
-                status="RUNNING",
-                output_artifact_path=None
+            plain_text, stage0_artifact_path = AgentRuntime._run_stage0(
+                task_instance_id,
+                process_id,
+                taskdef_id,
+                run_folder,
+                file_path,
+                original_filename
             )
 
             # ------------------------------------------
-            # 4) Execute Stage 0 (Input Normalisation) / Input stage
-            #    Output: 00_input_original.txt
+            # 6-10) Execute stages 1..N and write the output descriptor
             # ------------------------------------------
-            if isinstance(file_path, list):
-                files = file_path
-                plain_text, stage0_artifact_path = Stage0InputNormaliser.run_multi(
-                    files=files,
-                    run_folder=run_folder
-                )
-            else:
-                plain_text, stage0_artifact_path = Stage0InputNormaliser.run(
-                    file_path=file_path,
-                    run_folder=run_folder,
-                    original_filename=original_filename
-                )
+            result = AgentRuntime._execute_stages(
+                task_instance_id=task_instance_id,
+                process_id=process_id,
+                taskdef_id=taskdef_id,
+                run_folder=run_folder,
+                artifacts_dir=artifacts_dir,
+                plain_text=plain_text,
+                stage0_artifact_path=stage0_artifact_path,
+                skip_reduce=skip_reduce
+            )
 
-            # ------------------------------------------
-            # 5) Mark Stage 0 COMPLETED (store artifact path) (traceback purposes)
-            # ------------------------------------------
-            task_stage_instance_service.mark_stage_completed(stage0_id, stage0_artifact_path)
+            task_instance_service.update_status(task_instance_id, "COMPLETED")
+            return result
 
-            # ------------------------------------------
-            # 6) Load process + template + stage definitions
-            # ------------------------------------------
-            process_service = AgentProcessService()
-            taskdef_service = TaskDefService()
-            stage_service = TaskStageService()
+        except Exception as e:
+            # Mark TaskInstance failed if it exists
+            if task_instance_id is not None:
+                try:
+                    task_instance_service.update_status(task_instance_id, "FAILED")
+                except Exception:
+                    pass
+
+            return {
+                "task_instance_id": task_instance_id,
+                "output_text": f"Error: {e}",
+                "output_type": "text",
+                "output_artifact_path": None
+            }
 
-            process = process_service.get_process(process_id) #The agent process
-            taskdef = taskdef_service.get_taskdef_by_id(taskdef_id)
-            stage_defs = stage_service.get_stages_for_task(taskdef_id)
+    @staticmethod
+    async def run_task_async(process_id, taskdef_id, file_path, original_filename=None,
+                             task_instance_id=None, skip_reduce=False):
+        """
+        asyncio variant of run_task with the same TaskInstance / TaskStageInstance and
+        artifact semantics. Model calls are awaited on the running event loop, so many
+        runs can share one loop (see AsyncRunQueue).
+        """
 
-            agent_priming = process.Agent_Priming if process else ""
-            model_name = process.AI_Model if process else "mock-model"
+        task_instance_service = TaskInstanceService()
 
-            # ------------------------------------------
-            # 7) Compile and persist the “master prompt”
-            #    This is useful for reporting/debugging.
-            # ------------------------------------------
-            master_prompt = PromptCompiler.compile_master_prompt(
-                agent_priming=agent_priming,
-                taskdef=taskdef,
-                stage_defs=stage_defs,
-                input_text=plain_text
-            )
+        try:
+            if task_instance_id is None:
+                task_instance_id = await asyncio.to_thread(AgentRuntime.start_task, process_id, taskdef_id)
 
-            master_prompt_path = os.path.join(run_folder, "00_master_prompt.txt")
-            with open(master_prompt_path, "w", encoding="utf-8") as f:
-                f.write(master_prompt)
+            run_folder = os.path.join("agent_runs", str(task_instance_id))
+            artifacts_dir = os.path.join(run_folder, "artifacts")
+            os.makedirs(artifacts_dir, exist_ok=True)
 
-            # ------------------------------------------
-            # 8) Execute stages 1..N sequentially
-            #    Stops on first failure (exception is raised).
-            # ------------------------------------------
-            model_client = OllamaModelClient()
+            # Stage 0 (file parsing, PDF extraction) is blocking work.
+            plain_text, stage0_artifact_path = await asyncio.to_thread(
+                AgentRuntime._run_stage0,
+                task_instance_id,
+                process_id,
+                taskdef_id,
+                run_folder,
+                file_path,
+                original_filename
+            )
 
-            final_output_path, final_output_type = StageExecutionEngine.execute(
+            task_stage_instance_service = TaskStageInstanceService()
+            prepared = await asyncio.to_thread(
+                AgentRuntime._prepare_stages,
+                task_stage_instance_service, process_id, taskdef_id, run_folder,
+                plain_text, skip_reduce
+            )
+
+            final_output_path, final_output_type = await AsyncStageExecutionEngine.execute(
                 task_instance_id=task_instance_id,
                 run_folder=run_folder,
                 artifacts_dir=artifacts_dir,
-                stage_defs=stage_defs,
-                master_prompt=master_prompt,
-                model_client=model_client,
-                model_name=model_name,
+                stage_defs=None,
+                master_prompt=prepared["master_prompt"],
+                model_client=AgentRuntime._build_async_model_client(prepared["process"]),
+                model_name=prepared["model_name"],
                 task_stage_instance_service=task_stage_instance_service,
                 stage0_artifact_path=stage0_artifact_path,
-                system_prompt=agent_priming
+                system_prompt=prepared["agent_priming"],
+                stream_output=STREAM_STAGE_OUTPUT,
+                max_concurrency=MAX_STAGE_CONCURRENCY,
+                completed_results=prepared["completed_results"],
+                prompt_mode=prepared["prompt_mode"],
+                flow_plan=prepared["flow_plan"]
+            )
+
+            result = await asyncio.to_thread(
+                AgentRuntime._finish_stages,
+                task_instance_id, run_folder, plain_text, stage0_artifact_path,
+                final_output_path, final_output_type
+            )
+
+            await asyncio.to_thread(task_instance_service.update_status, task_instance_id, "COMPLETED")
+            return result
+
+        except Exception as e:
+            if task_instance_id is not None:
+                try:
+                    await asyncio.to_thread(task_instance_service.update_status, task_instance_id, "FAILED")
+                except Exception:
+                    pass
+
+            return {
+                "task_instance_id": task_instance_id,
+                "output_text": f"Error: {e}",
+                "output_type": "text",
+                "output_artifact_path": None
+            }
+
+    @staticmethod
+    def start_resume(task_instance_id):
+        """
+        Checks that a FAILED run can be resumed and marks it RUNNING again.
+        Raises an Exception with a user-facing reason when it cannot be resumed.
+        """
+
+        task_instance_service = TaskInstanceService()
+        task_stage_instance_service = TaskStageInstanceService()
+
+        task_inst = task_instance_service.get_task_instance(task_instance_id)
+        if not task_inst or not task_instance_service.is_active(task_inst):
+            raise Exception("This run has been deleted and can no longer be resumed.")
+        if task_inst.Status != "FAILED":
+            raise Exception("Only failed runs can be resumed.")
+        if task_instance_service.list_child_task_instances(task_instance_id):
+            raise Exception("Batch runs are resumed per file: open a failed file run and resume it.")
+
+        # Uploaded files are not kept, so the Stage 0 artifact is the only way back in.
+        stage0 = AgentRuntime._find_input_stage(
+            task_stage_instance_service.get_stages_for_task_instance(task_instance_id)
+        )
+        if not stage0:
+            raise Exception("The input stage did not complete; upload the file again to start a new run.")
+
+        task_instance_service.update_status(task_instance_id, "RUNNING")
+        return task_inst
+
+    @staticmethod
+    def resume_task(task_instance_id, started=False):
+        """
+        Resumes a FAILED run from its failed stage.
+        Stage 0 and every completed stage whose inputs are unchanged are reused from disk
+        (see StageExecutionEngine.reusable_results); only the failed stage and the stages
+        that depend on it are executed again.
+        started=True means start_resume already ran (queued resume, see RunQueue.submit_resume).
+        """
+
+        task_instance_service = TaskInstanceService()
+        task_stage_instance_service = TaskStageInstanceService()
+
+        try:
+            if started:
+                task_inst = task_instance_service.get_task_instance(task_instance_id)
+            else:
+                task_inst = AgentRuntime.start_resume(task_instance_id)
+
+            run_folder = os.path.join("agent_runs", str(task_instance_id))
+            artifacts_dir = os.path.join(run_folder, "artifacts")
+            os.makedirs(artifacts_dir, exist_ok=True)
+
+            stage_instances = task_stage_instance_service.get_stages_for_task_instance(task_instance_id)
+            stage0 = AgentRuntime._find_input_stage(stage_instances)
+            if not stage0:
+                raise Exception("The input stage did not complete; upload the file again to start a new run.")
+            if stage0.Status != "COMPLETED":
+                # Runs from before Stage 0 kept its status could record it as FAILED.
+                task_stage_instance_service.mark_stage_completed(
+                    stage0.TaskStageInstance_ID,
+                    stage0.Output_Artifact_Path
+                )
+
+            with open(stage0.Output_Artifact_Path, "r", encoding="utf-8") as f:
+                plain_text = f.read()
+
+            # Partial output from the failed attempt must not be replayed by /run_stream.
+            for name in os.listdir(artifacts_dir):
+                if name.endswith(".part"):
+                    os.remove(os.path.join(artifacts_dir, name))
+
+            result = AgentRuntime._execute_stages(
+                task_instance_id=task_instance_id,
+                process_id=task_inst.Process_ID_FK,
+                taskdef_id=task_inst.TaskDef_ID_FK,
+                run_folder=run_folder,
+                artifacts_dir=artifacts_dir,
+                plain_text=plain_text,
+                stage0_artifact_path=stage0.Output_Artifact_Path,
+                skip_reduce=task_inst.Parent_TaskInstance_ID_FK is not None,
+                resume_stage_instances=stage_instances
             )
 
+            task_instance_service.update_status(task_instance_id, "COMPLETED")
+            return result
+
+        except Exception as e:
+            try:
+                task_inst = task_instance_service.get_task_instance(task_instance_id)
+                if task_inst and task_inst.Status == "RUNNING":
+                    task_instance_service.update_status(task_instance_id, "FAILED")
+            except Exception:
+                pass
+
+            return {
+                "task_instance_id": task_instance_id,
+                "output_text": f"Error: {e}",
+                "output_type": "text",
+                "output_artifact_path": None
+            }
+
+    @staticmethod
+    def run_batch(process_id, taskdef_id, files, task_instance_id=None, max_concurrency=BATCH_CONCURRENCY):
+        """
+        Batch mode: runs the flow once per file instead of over one combined input.
+
+        - The parent TaskInstance records the batch; Stage 0 ("batch") writes
+          00_batch_manifest.json listing the child run per file.
+        - Each file runs through run_task as a child TaskInstance, up to
+          max_concurrency at once.
+        - If the flow has a "reduce" stage, it runs on the parent over the
+          children's final outputs (00_input_original.txt in the parent folder).
+        """
+
+        task_instance_service = TaskInstanceService()
+        task_stage_instance_service = TaskStageInstanceService()
+
+        manifest_stage_id = None
+        children = []
+
+        try:
+            if not files:
+                raise Exception("No files provided for batch run.")
+
+            if task_instance_id is None:
+                task_instance_id = AgentRuntime.start_task(process_id, taskdef_id)
+
+            run_folder = os.path.join("agent_runs", str(task_instance_id))
+            artifacts_dir = os.path.join(run_folder, "artifacts")
+            os.makedirs(artifacts_dir, exist_ok=True)
+
             # ------------------------------------------
-            # 9) Read final output artifact (if any)
+            # 1) Stage 0: create one child TaskInstance per file + manifest
             # ------------------------------------------
-            if final_output_path:
-                with open(final_output_path, "r", encoding="utf-8") as f:
-                    output_text = f.read()
-                output_type = final_output_type or "text"
-            else:
-                # If there are no executable stages (e.g., only input stage), return stage-0 text
-                output_text = plain_text
-                output_type = "text"
-                final_output_path = stage0_artifact_path
+            manifest_stage_id = task_stage_instance_service.create_stage_instance(
+                task_instance_id_fk=task_instance_id,
+                stage_order=0,
+                stage_name="batch",
+                status="RUNNING",
+                output_artifact_path=None
+            )
+
+            with transaction():
+                for idx, item in enumerate(files, start=1):
+                    child_id = AgentRuntime.start_task(
+                        process_id,
+                        taskdef_id,
+                        parent_task_instance_id=task_instance_id
+                    )
+                    children.append({
+                        "task_instance_id": child_id,
+                        "file_name": item.get("name") or f"file_{idx}",
+                        "file": item
+                    })
+
+                manifest_path = os.path.join(run_folder, "00_batch_manifest.json")
+                with open(manifest_path, "w", encoding="utf-8") as f:
+                    json.dump({
+                        "task_instance_id": task_instance_id,
+                        "children": [
+                            {"task_instance_id": c["task_instance_id"], "file_name": c["file_name"]}
+                            for c in children
+                        ]
+                    }, f, indent=2)
+                task_stage_instance_service.mark_stage_completed(manifest_stage_id, manifest_path)
+            manifest_stage_id = None
 
             # ------------------------------------------
-            # 10) Write output descriptor (type + path) for UI/debugging
+            # 2) Map: run every file as its own child run
             # ------------------------------------------
-            output_descriptor = {
-                "task_instance_id": task_instance_id,
-                "output_type": output_type,
-                "output_path": final_output_path
-            }
-            descriptor_path = os.path.join(run_folder, "output_descriptor.json")
-            with open(descriptor_path, "w", encoding="utf-8") as f:
-                import json
-                json.dump(output_descriptor, f, indent=2)
+            def run_child(c):
+                try:
+                    return AgentRuntime.run_task(
+                        process_id=process_id,
+                        taskdef_id=taskdef_id,
+                        file_path=[c["file"]],
+                        task_instance_id=c["task_instance_id"],
+                        skip_reduce=True
+                    )
+                finally:
+                    # A child's TTL counts from its own completion, not from its creation.
+                    try:
+                        task_instance_service.touch_task_instance(c["task_instance_id"])
+                    except Exception:
+                        pass
 
-            task_instance_service.update_status(task_instance_id, "COMPLETED")
+            with ThreadPoolExecutor(max_workers=max(1, max_concurrency)) as pool:
+                futures = [pool.submit(run_child, c) for c in children]
+                results = [f.result() for f in futures]
+
+            # Child TTLs are refreshed again at the end of the batch, like the parent's.
+            with transaction():
+                for c in children:
+                    try:
+                        task_instance_service.touch_task_instance(c["task_instance_id"])
+                    except Exception:
+                        pass
+
+            completed = [
+                (c, r) for c, r in zip(children, results)
+                if r.get("output_artifact_path")
+            ]
+            failed_count = len(children) - len(completed)
+
+            # ------------------------------------------
+            # 3) Reduce (optional): merge child outputs on the parent run
+            # ------------------------------------------
+            flow = AgentRuntime._load_flow(process_id, taskdef_id)
+            process = flow.process
+            reduce_defs = []
+            for s in flow.stage_defs:
+                if AgentRuntime._is_reduce_stage(s):
+                    # In a batch the reduce stage always consumes the merged child outputs.
+                    reduce_def = copy.copy(s)
+                    reduce_def.TaskStageDef_Depends_On = None
+                    reduce_defs.append(reduce_def)
+
+            final_output_path = manifest_path
+            final_output_type = "json"
+            if reduce_defs and completed:
+                combined_text = "\n\n".join(
+                    f"=== FILE {idx}: {c['file_name']} ===\n{(r.get('output_text') or '').strip()}"
+                    for idx, (c, r) in enumerate(completed, start=1)
+                )
+                reduce_input_path = os.path.join(run_folder, "00_input_original.txt")
+                with open(reduce_input_path, "w", encoding="utf-8") as f:
+                    f.write(combined_text)
+
+                agent_priming = process.Agent_Priming if process else ""
+                prompt_mode = process.Prompt_Mode if process else PROMPT_MODE_FULL
+                reduce_plan = FlowPlan.compile(reduce_defs, flow.taskdef)
+                master_prompt = reduce_plan.master.render(combined_text, prompt_mode)
+                with open(os.path.join(run_folder, "00_master_prompt.txt"), "w", encoding="utf-8") as f:
+                    f.write(master_prompt)
+
+                final_output_path, final_output_type = StageExecutionEngine.execute(
+                    task_instance_id=task_instance_id,
+                    run_folder=run_folder,
+                    artifacts_dir=artifacts_dir,
+                    stage_defs=reduce_defs,
+                    master_prompt=master_prompt,
+                    model_client=AgentRuntime._build_model_client(process),
+                    model_name=process.AI_Model if process else "mock-model",
+                    task_stage_instance_service=task_stage_instance_service,
+                    stage0_artifact_path=reduce_input_path,
+                    system_prompt=agent_priming,
+                    stream_output=STREAM_STAGE_OUTPUT,
+                    max_concurrency=MAX_STAGE_CONCURRENCY,
+                    prompt_mode=prompt_mode,
+                    flow_plan=reduce_plan
+                )
+
+            with open(os.path.join(run_folder, "output_descriptor.json"), "w", encoding="utf-8") as f:
+                json.dump({
+                    "task_instance_id": task_instance_id,
+                    "output_type": final_output_type,
+                    "output_path": final_output_path,
+                    "child_task_instance_ids": [c["task_instance_id"] for c in children]
+                }, f, indent=2)
+
+            # A batch is only COMPLETED when every file succeeded.
+            task_instance_service.update_status(
+                task_instance_id,
+                "FAILED" if failed_count else "COMPLETED"
+            )
             return {
                 "task_instance_id": task_instance_id,
-                "output_text": output_text,
-                "output_type": output_type,
-                "output_artifact_path": final_output_path
+                "output_text": f"{len(completed)} of {len(children)} files completed.",
+                "output_type": final_output_type,
+                "output_artifact_path": final_output_path,
+                "child_task_instance_ids": [c["task_instance_id"] for c in children]
             }
 
         except Exception as e:
-            # Mark Stage 0 failed if it exists (or if failure happened during stage-0 path)
-            if stage0_id is not None:
+            if manifest_stage_id is not None:
                 try:
-                    task_stage_instance_service.mark_stage_failed(stage0_id, str(e))
+                    task_stage_instance_service.mark_stage_failed(manifest_stage_id, str(e))
+                except Exception:
+                    pass
+
+            # Children that never started must not stay RUNNING (cleanup skips RUNNING rows).
+            for c in children:
+                try:
+                    child = task_instance_service.get_task_instance(c["task_instance_id"])
+                    if child and child.Status == "RUNNING":
+                        task_instance_service.update_status(c["task_instance_id"], "FAILED")
                 except Exception:
                     pass
 
-            # Mark TaskInstance failed if it exists
             if task_instance_id is not None:
                 try:
                     task_instance_service.update_status(task_instance_id, "FAILED")
@@ -217,5 +575,241 @@ class AgentRuntime:
                 "task_instance_id": task_instance_id,
                 "output_text": f"Error: {e}",
                 "output_type": "text",
-                "output_artifact_path": None
+                "output_artifact_path": None,
+                "child_task_instance_ids": [c["task_instance_id"] for c in children]
             }
+
+    @staticmethod
+    def _run_stage0(task_instance_id, process_id, taskdef_id, run_folder, file_path, original_filename=None):
+        """
+        Stage 0 (Input Normalisation): creates the "input" TaskStageInstance, writes
+        00_input_original.txt and returns (plain_text, artifact path).
+        CSV uploads are read as the flow's Csv_Input_Mode asks (full / summary / sample).
+        Only Stage 0's own failures mark it FAILED; it stays COMPLETED if a later stage fails.
+        """
+        task_stage_instance_service = TaskStageInstanceService()
+        extraction_cache = get_extraction_cache() if USE_EXTRACTION_CACHE else None
+        process = AgentRuntime._load_flow(process_id, taskdef_id).process
+        csv_mode = process.Csv_Input_Mode if process else CSV_INPUT_FULL
+
+        # ------------------------------------------
+        # 3) Create Stage 0 TaskStageInstance (RUNNING)
+        # ------------------------------------------
+        stage0_id = task_stage_instance_service.create_stage_instance(
+            task_instance_id_fk=task_instance_id,
+            stage_order=0,
+            stage_name="input",
+            status="RUNNING",
+            output_artifact_path=None
+        )
+
+        try:
+            # ------------------------------------------
+            # 4) Execute Stage 0 (Input Normalisation) / Input stage
+            #    Output: 00_input_original.txt
+            # ------------------------------------------
+            if isinstance(file_path, list):
+                files = file_path
+                plain_text, stage0_artifact_path = Stage0InputNormaliser.run_multi(
+                    files=files,
+                    run_folder=run_folder,
+                    extraction_cache=extraction_cache,
+                    csv_mode=csv_mode
+                )
+            else:
+                plain_text, stage0_artifact_path = Stage0InputNormaliser.run(
+                    file_path=file_path,
+                    run_folder=run_folder,
+                    original_filename=original_filename,
+                    extraction_cache=extraction_cache,
+                    csv_mode=csv_mode
+                )
+
+            # ------------------------------------------
+            # 5) Mark Stage 0 COMPLETED (store artifact path) (traceback purposes)
+            # ------------------------------------------
+            task_stage_instance_service.mark_stage_completed(stage0_id, stage0_artifact_path)
+        except Exception as e:
+            try:
+                task_stage_instance_service.mark_stage_failed(stage0_id, str(e))
+            except Exception:
+                pass
+            raise
+
+        return plain_text, stage0_artifact_path
+
+    @staticmethod
+    def _execute_stages(task_instance_id, process_id, taskdef_id, run_folder, artifacts_dir,
+                        plain_text, stage0_artifact_path, skip_reduce=False, resume_stage_instances=None):
+        """
+        Steps 6-10 of a run, shared by run_task and resume_task: compiles the master prompt,
+        executes stages 1..N and writes output_descriptor.json. Raises on stage failure.
+        resume_stage_instances (the earlier attempt's TaskStageInstances) enables stage reuse.
+        """
+        task_stage_instance_service = TaskStageInstanceService()
+
+        prepared = AgentRuntime._prepare_stages(
+            task_stage_instance_service, process_id, taskdef_id, run_folder,
+            plain_text, skip_reduce, resume_stage_instances
+        )
+
+        # ------------------------------------------
+        # 8) Execute stages 1..N (dependency order, independent branches in parallel)
+        #    Stops on first failure (exception is raised).
+        # ------------------------------------------
+        final_output_path, final_output_type = StageExecutionEngine.execute(
+            task_instance_id=task_instance_id,
+            run_folder=run_folder,
+            artifacts_dir=artifacts_dir,
+            stage_defs=None,
+            master_prompt=prepared["master_prompt"],
+            model_client=AgentRuntime._build_model_client(prepared["process"]),
+            model_name=prepared["model_name"],
+            task_stage_instance_service=task_stage_instance_service,
+            stage0_artifact_path=stage0_artifact_path,
+            system_prompt=prepared["agent_priming"],
+            stream_output=STREAM_STAGE_OUTPUT,
+            max_concurrency=MAX_STAGE_CONCURRENCY,
+            completed_results=prepared["completed_results"],
+            prompt_mode=prepared["prompt_mode"],
+            flow_plan=prepared["flow_plan"]
+        )
+
+        return AgentRuntime._finish_stages(
+            task_instance_id, run_folder, plain_text, stage0_artifact_path,
+            final_output_path, final_output_type
+        )
+
+    @staticmethod
+    def _prepare_stages(task_stage_instance_service, process_id, taskdef_id, run_folder,
+                        plain_text, skip_reduce=False, resume_stage_instances=None):
+        """
+        Steps 6-7: loads the flow, works out reusable stages for a resume and writes the
+        master prompt. Returns the inputs the (sync or asyncio) stage engine needs.
+        """
+        # ------------------------------------------
+        # 6) Load process + template + stage definitions
+        # ------------------------------------------
+        flow = AgentRuntime._load_flow(process_id, taskdef_id)
+        process = flow.process
+        flow_plan = flow.plan(exclude_type=REDUCE_STAGE_TYPE if skip_reduce else None)
+
+        completed_results = None
+        if resume_stage_instances is not None:
+            # Reuse what the earlier attempt finished; drop the rows of stages that run
+            # again so each stage order keeps a single TaskStageInstance.
+            completed_results = StageExecutionEngine.reusable_results(
+                None, resume_stage_instances, flow_plan
+            )
+            rerun_ids = [
+                st.TaskStageInstance_ID for st in resume_stage_instances
+                if st.Stage_Order != 0 and st.Stage_Order not in completed_results
+            ]
+            if rerun_ids:
+                task_stage_instance_service.delete_stage_instances(rerun_ids)
+
+        agent_priming = process.Agent_Priming if process else ""
+        model_name = process.AI_Model if process else "mock-model"
+        prompt_mode = process.Prompt_Mode if process else PROMPT_MODE_FULL
+
+        # ------------------------------------------
+        # 7) Compile and persist the “master prompt”
+        #    This is useful for reporting/debugging.
+        # ------------------------------------------
+        master_prompt = flow_plan.master.render(plain_text, prompt_mode)
+
+        master_prompt_path = os.path.join(run_folder, "00_master_prompt.txt")
+        with open(master_prompt_path, "w", encoding="utf-8") as f:
+            f.write(master_prompt)
+
+        return {
+            "process": process,
+            "flow_plan": flow_plan,
+            "master_prompt": master_prompt,
+            "agent_priming": agent_priming,
+            "model_name": model_name,
+            "prompt_mode": prompt_mode,
+            "completed_results": completed_results
+        }
+
+    @staticmethod
+    def _finish_stages(task_instance_id, run_folder, plain_text, stage0_artifact_path,
+                       final_output_path, final_output_type):
+        """Steps 9-10: reads the final output and writes output_descriptor.json."""
+        # ------------------------------------------
+        # 9) Read final output artifact (if any)
+        # ------------------------------------------
+        if final_output_path:
+            output_text = ArtifactStore.read_text(final_output_path)
+            output_type = final_output_type or "text"
+        else:
+            # If there are no executable stages (e.g., only input stage), return stage-0 text
+            output_text = plain_text
+            output_type = "text"
+            final_output_path = stage0_artifact_path
+
+        # ------------------------------------------
+        # 10) Write output descriptor (type + path) for UI/debugging
+        # ------------------------------------------
+        output_descriptor = {
+            "task_instance_id": task_instance_id,
+            "output_type": output_type,
+            "output_path": final_output_path
+        }
+        descriptor_path = os.path.join(run_folder, "output_descriptor.json")
+        with open(descriptor_path, "w", encoding="utf-8") as f:
+            json.dump(output_descriptor, f, indent=2)
+
+        return {
+            "task_instance_id": task_instance_id,
+            "output_text": output_text,
+            "output_type": output_type,
+            "output_artifact_path": final_output_path
+        }
+
+    @staticmethod
+    def _load_flow(process_id, taskdef_id):
+        """
+        Returns the FlowDefinition for a run. Served from the flow definition
+        cache; read from the DB (and not cached) if the run's TaskDef is not the
+        flow's current one. The returned flow is shared: do not modify it.
+        """
+        flow = AgentProcessService().get_flow(process_id)
+        if flow is not None and flow.taskdef is not None and flow.taskdef.TaskDef_ID == taskdef_id:
+            return flow
+
+        process = flow.process if flow is not None else None
+        taskdef = TaskDefService().get_taskdef_by_id(taskdef_id)
+        stage_defs = TaskStageService().get_stages_for_task(taskdef_id)
+        return FlowDefinition(process, taskdef, stage_defs, version=None)
+
+    @staticmethod
+    def _build_model_client(process):
+        model_client = OllamaModelClient()
+        cache_ttl = clamp_cache_ttl(process.Cache_TTL_Seconds) if process else None
+        if cache_ttl:
+            # Opt-in per flow: identical stage prompts are served from the response cache.
+            model_client = CachedModelClient(model_client, get_response_cache(), cache_ttl)
+        return model_client
+
+    @staticmethod
+    def _build_async_model_client(process):
+        model_client = AsyncOllamaModelClient()
+        cache_ttl = clamp_cache_ttl(process.Cache_TTL_Seconds) if process else None
+        if cache_ttl:
+            model_client = AsyncCachedModelClient(model_client, get_response_cache(), cache_ttl)
+        return model_client
+
+    @staticmethod
+    def _find_input_stage(stage_instances):
+        """Returns the Stage 0 ("input") instance if its artifact is still on disk."""
+        for st in stage_instances or []:
+            if st.Stage_Order == 0 and st.Stage_Name == "input":
+                if st.Output_Artifact_Path and os.path.isfile(st.Output_Artifact_Path):
+                    return st
+        return None
+
+    @staticmethod
+    def _is_reduce_stage(stage_def):
+        stage_type = (getattr(stage_def, "TaskStageDef_Type", "") or "").strip().lower()
+        return stage_type == REDUCE_STAGE_TYPE
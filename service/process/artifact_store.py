@@ -0,0 +1,95 @@
+# ==========================================
+# File: artifact_store.py
+# Added in iteration: 5
+# Author: Karl Concha
+#
+# Read access to run artifacts (stage outputs, Stage 0 input) shared by the
+# stage engines, the runtime and the web layer.
+# - open_view: a memoryview of an artifact's bytes. Artifacts of
+#   MMAP_MIN_BYTES or more are memory-mapped (no copy); smaller ones are read
+#   into memory in one call (one copy, cheaper than setting up a mapping)
+# - read_text: the artifact as one string, decoded straight from the view
+#   (optionally stripped before decoding, so the surrounding whitespace is
+#   never copied)
+# - read_head: the first max_chars characters, for previews
+# Text is returned the way a text-mode read returns it (universal newlines).
+#
+# Notes:
+# - Prompts and the model client work on str, so stage inputs are still
+#   materialised once; the view avoids the intermediate bytes copy and the
+#   extra copies made by strip().
+# - Views must not outlive their open_view block.
+#
+# Used in stage_execution_engine.py, agent_runtime_service.py and app.py
+# ==========================================
+
+import mmap
+import os
+from contextlib import contextmanager
+
+
+# Artifacts at least this large are memory-mapped; smaller ones are read in one call.
+MMAP_MIN_BYTES = 1024 * 1024
+
+# Bytes decoded per character when reading a preview head (UTF-8 is at most 4 bytes per character).
+_MAX_UTF8_BYTES = 4
+
+# ASCII whitespace, which bytes.strip() removes; str.strip() then handles the rest of Unicode.
+_ASCII_WHITESPACE = b" \t\n\r\x0b\x0c"
+
+
+class ArtifactStore:
+    """ Reads artifact files without repeated full-file copies. """
+
+    @staticmethod
+    @contextmanager
+    def open_view(path):
+        """
+        Yields a read-only memoryview of the artifact's bytes: memory-mapped when the
+        artifact is MMAP_MIN_BYTES or more, otherwise a view over one read() copy.
+        """
+        with open(path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            if size < MMAP_MIN_BYTES:
+                yield memoryview(f.read())
+                return
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            view = memoryview(mapped)
+            try:
+                yield view
+            finally:
+                view.release()
+                mapped.close()
+
+    @staticmethod
+    def read_text(path, strip=False):
+        """ The artifact decoded as UTF-8 (strip=True drops surrounding whitespace first). """
+        with ArtifactStore.open_view(path) as view:
+            start, end = 0, len(view)
+            if strip:
+                start, end = ArtifactStore._strip_bounds(view)
+            text = str(view[start:end], "utf-8")
+        if "\r" in text:
+            text = text.replace("\r\n", "\n").replace("\r", "\n")
+        return text.strip() if strip else text
+
+    @staticmethod
+    def read_head(path, max_chars):
+        """ Returns (first max_chars characters, True if the artifact is longer). """
+        with ArtifactStore.open_view(path) as view:
+            head = str(view[:(max_chars + 1) * _MAX_UTF8_BYTES], "utf-8", errors="ignore")
+        if "\r" in head:
+            head = head.replace("\r\n", "\n").replace("\r", "\n")
+        if len(head) > max_chars:
+            return head[:max_chars], True
+        return head, False
+
+    @staticmethod
+    def _strip_bounds(view):
+        """ [start, end) of view without leading / trailing ASCII whitespace. """
+        start, end = 0, len(view)
+        while start < end and view[start] in _ASCII_WHITESPACE:
+            start += 1
+        while end > start and view[end - 1] in _ASCII_WHITESPACE:
+            end -= 1
+        return start, end
@@ -0,0 +1,273 @@
+# ==========================================
+# File: async_stage_execution_engine.py
+# Added in iteration: 5
+# Author: Karl Concha
+#
+# asyncio variant of StageExecutionEngine for high-concurrency runs.
+# - Same compiled flow plan (flow_plan.py), prompts, artifacts,
+#   output types and TaskStageInstance lifecycle as the sync engine
+# - Model calls are awaited (AsyncOllamaModelClient), so many stages and
+#   runs share one event loop instead of holding a thread each
+# - DB bookkeeping and artifact post-processing (chart rendering) run in
+#   worker threads via asyncio.to_thread
+# - Chunked stages map over input chunks concurrently on the loop (the
+#   remaining chunk calls are cancelled when one fails)
+# - Same prompt_mode handling and Prompt_Tokens reporting as the sync engine
+# - Same handling of stages left unscheduled by a failure (marked FAILED)
+#
+# Notes:
+# - Streamed chunks are appended to the .part artifact directly on the loop;
+#   these are small local writes, same as the sync engine's per-chunk flush.
+#
+# Used in agent_runtime_service.py (run_task_async)
+# ==========================================
+
+import asyncio
+import os
+
+from service.flow.chunker import InputChunker
+from service.flow.flow_plan import FlowPlan
+from service.flow.prompt_compiler import PROMPT_MODE_FULL
+from service.process.stage_execution_engine import (
+    DEFAULT_MAP_CONCURRENCY,
+    DEFAULT_MAX_STAGE_CONCURRENCY,
+    PartialArtifactWriter,
+    StageExecutionEngine
+)
+
+
+class AsyncStageExecutionEngine:
+    """ Executes workflow stages on an asyncio event loop using an async model client. """
+
+    @staticmethod
+    async def execute(
+        task_instance_id,
+        run_folder,
+        artifacts_dir,
+        stage_defs,
+        master_prompt,
+        model_client,
+        model_name,
+        task_stage_instance_service,
+        stage0_artifact_path,
+        system_prompt=None,
+        stream_output=False,
+        max_concurrency=DEFAULT_MAX_STAGE_CONCURRENCY,
+        completed_results=None,
+        prompt_mode=PROMPT_MODE_FULL,
+        flow_plan=None
+    ):
+        """
+        Awaitable equivalent of StageExecutionEngine.execute; returns (final artifact path, type).
+        model_client must provide async generate (and optionally async generate_stream).
+        """
+
+        os.makedirs(artifacts_dir, exist_ok=True)
+
+        flow_plan = flow_plan or FlowPlan.compile(stage_defs)
+        plan = flow_plan.nodes
+        names = flow_plan.names
+
+        # order -> (artifact path, output type); order 0 is the Stage 0 input artifact
+        results = {0: (stage0_artifact_path, "text")}
+        results.update(completed_results or {})
+        pending = {node["order"]: node for node in plan if node["order"] not in results}
+        running = {}
+        first_error = None
+
+        stage_instance_ids = await asyncio.to_thread(
+            task_stage_instance_service.create_pending_stage_instances,
+            task_instance_id,
+            [(order, pending[order]["stage_type"]) for order in sorted(pending)]
+        )
+
+        # SQLite has a single writer, so stage bookkeeping is serialised across stages.
+        db_lock = asyncio.Lock()
+
+        while pending or running:
+            if first_error is None:
+                for order in sorted(pending):
+                    if len(running) >= max(1, max_concurrency):
+                        break
+                    node = pending[order]
+                    if not all(dep in results for dep in node["depends_on"]):
+                        continue
+                    del pending[order]
+                    task = asyncio.create_task(AsyncStageExecutionEngine._execute_stage(
+                        node,
+                        stage_instance_ids[order],
+                        StageExecutionEngine._stage_inputs(node, names, results, prompt_mode),
+                        task_instance_id,
+                        artifacts_dir,
+                        master_prompt,
+                        model_client,
+                        model_name,
+                        task_stage_instance_service,
+                        system_prompt,
+                        stream_output,
+                        db_lock
+                    ))
+                    running[task] = order
+
+            if not running:
+                break
+
+            done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                order = running.pop(task)
+                try:
+                    results[order] = task.result()
+                except Exception as e:
+                    # Stop scheduling new stages; in-flight stages are allowed to finish.
+                    if first_error is None:
+                        first_error = e
+
+        if first_error is not None:
+            await asyncio.to_thread(
+                StageExecutionEngine._fail_unscheduled,
+                task_stage_instance_service,
+                stage_instance_ids,
+                pending
+            )
+            raise first_error
+
+        return StageExecutionEngine._select_final_output(plan, results)
+
+    @staticmethod
+    async def _execute_stage(
+        node,
+        stage_instance_id,
+        inputs,
+        task_instance_id,
+        artifacts_dir,
+        master_prompt,
+        model_client,
+        model_name,
+        task_stage_instance_service,
+        system_prompt,
+        stream_output,
+        db_lock
+    ):
+        """
+        Runs a single stage (see StageExecutionEngine._execute_stage).
+        Returns (artifact path, output type).
+        """
+        prompt_tokens = None
+
+        async with db_lock:
+            await asyncio.to_thread(task_stage_instance_service.mark_stage_running, stage_instance_id)
+
+        try:
+            input_text = await asyncio.to_thread(StageExecutionEngine._read_inputs, inputs)
+
+            map_tokens = 0
+            if StageExecutionEngine._needs_chunking(node, input_text):
+                stage_prompt, map_tokens = await AsyncStageExecutionEngine._map_reduce_prompt(
+                    node,
+                    input_text,
+                    artifacts_dir,
+                    master_prompt,
+                    model_client,
+                    model_name,
+                    system_prompt
+                )
+            else:
+                stage_prompt = node["prompt"].render(master_prompt, input_text)
+
+            prompt_tokens = StageExecutionEngine._prompt_tokens(system_prompt, stage_prompt, map_tokens)
+
+            if stream_output and hasattr(model_client, "generate_stream"):
+                partial_path = StageExecutionEngine._partial_path(artifacts_dir, node)
+                writer = PartialArtifactWriter(partial_path)
+                try:
+                    async for chunk in model_client.generate_stream(
+                        model_name,
+                        stage_prompt,
+                        system_prompt=system_prompt
+                    ):
+                        writer.write(chunk)
+                except BaseException:
+                    writer.discard()
+                    raise
+                head_text = writer.finish()
+                output_text = None
+            else:
+                output_text = await model_client.generate(
+                    model_name,
+                    stage_prompt,
+                    system_prompt=system_prompt
+                )
+                if output_text is None:
+                    raise Exception("Model client returned no output.")
+                head_text = output_text
+
+            out_path, output_type = await asyncio.to_thread(
+                StageExecutionEngine._write_artifact,
+                artifacts_dir, node, head_text, output_text
+            )
+
+            async with db_lock:
+                await asyncio.to_thread(
+                    task_stage_instance_service.mark_stage_completed, stage_instance_id, out_path, prompt_tokens
+                )
+            return out_path, output_type
+
+        except BaseException as e:
+            # Mark failed (also on cancellation) then re-raise so the runtime fails the task
+            try:
+                async with db_lock:
+                    await asyncio.to_thread(
+                        task_stage_instance_service.mark_stage_failed, stage_instance_id, str(e), prompt_tokens
+                    )
+            except Exception:
+                pass
+            raise
+
+    @staticmethod
+    async def _map_reduce_prompt(node, input_text, artifacts_dir, master_prompt, model_client, model_name,
+                                 system_prompt, max_concurrency=DEFAULT_MAP_CONCURRENCY):
+        """
+        Map step for a chunked stage (see StageExecutionEngine._map_reduce_prompt).
+        Returns the prompt for the final merge call and the map/merge prompt tokens sent.
+        """
+        chunk_tokens = node["chunk_tokens"]
+        chunks = InputChunker.split(input_text, chunk_tokens)
+        slots = asyncio.Semaphore(max(1, max_concurrency))
+        sent_tokens = 0
+
+        async def generate(prompt):
+            async with slots:
+                text = await model_client.generate(model_name, prompt, system_prompt=system_prompt)
+            if not text:
+                raise Exception("Model client returned no output.")
+            return text
+
+        prompts = StageExecutionEngine._map_prompts(node, master_prompt, chunks)
+        sent_tokens += sum(StageExecutionEngine._prompt_tokens(system_prompt, p) for p in prompts)
+        partials = await AsyncStageExecutionEngine._gather_or_cancel(generate(prompt) for prompt in prompts)
+        await asyncio.to_thread(StageExecutionEngine._write_chunk_outputs, artifacts_dir, node, partials)
+
+        groups = StageExecutionEngine._merge_groups(partials, chunk_tokens)
+        while 1 < len(groups) < len(partials):
+            prompts = [StageExecutionEngine._merge_prompt(node, master_prompt, group) for group in groups]
+            sent_tokens += sum(StageExecutionEngine._prompt_tokens(system_prompt, p) for p in prompts)
+            partials = await AsyncStageExecutionEngine._gather_or_cancel(generate(prompt) for prompt in prompts)
+            groups = StageExecutionEngine._merge_groups(partials, chunk_tokens)
+
+        StageExecutionEngine._check_final_merge(node, partials)
+        return StageExecutionEngine._merge_prompt(node, master_prompt, partials), sent_tokens
+
+    @staticmethod
+    async def _gather_or_cancel(coroutines):
+        """
+        Awaits the coroutines concurrently and returns their results in order.
+        On the first failure the remaining ones are cancelled (not left running).
+        """
+        tasks = [asyncio.ensure_future(coroutine) for coroutine in coroutines]
+        try:
+            return list(await asyncio.gather(*tasks))
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
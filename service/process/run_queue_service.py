@@ -0,0 +1,217 @@
+# ==========================================
+# File: run_queue_service.py
+# Added in iteration: 5
+# Author: Karl Concha
+#
+# Background run queue for AgentRuntime.
+# - submit() creates the TaskInstance straight away and returns its ID
+# - submit_batch() does the same for a batch run (one child run per file)
+# - submit_resume() marks a FAILED run RUNNING again and resumes it in the background
+# - The multi-stage run itself executes on a bounded worker pool
+# - Progress is read back from TaskInstance / TaskStageInstance (no in-memory results)
+# - AsyncRunQueue runs queued runs on one asyncio event loop instead
+#   (AgentRuntime.run_task_async), for many concurrent runs that mostly wait
+#   on the model server
+#
+# Notes:
+# - Uploaded temp files are owned by the queue once submitted and are
+#   removed by the worker when the run finishes.
+# - Run expiry is refreshed when a run finishes so the privacy TTL counts
+#   from completion rather than from submission.
+# ==========================================
+
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from service.process.agent_runtime_service import AgentRuntime
+from service.task_instance_service import TaskInstanceService
+
+
+DEFAULT_MAX_WORKERS = 4
+DEFAULT_MAX_ASYNC_RUNS = 256
+DEFAULT_SYNC_WORKERS = 4
+
+
+class RunQueue:
+    """Runs AgentRuntime.run_task on a pool of background workers."""
+
+    def __init__(self, max_workers=DEFAULT_MAX_WORKERS):
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers,
+            thread_name_prefix="rainn-run"
+        )
+        self._lock = threading.Lock()
+        self._futures = {}
+
+    def submit(self, process_id, taskdef_id, files):
+        """
+        Queues a run and returns its TaskInstance_ID immediately.
+        files is the same list of {"path", "name"} dicts accepted by AgentRuntime.run_task.
+        """
+        return self._submit(process_id, taskdef_id, files, lambda task_instance_id: AgentRuntime.run_task(
+            process_id=process_id,
+            taskdef_id=taskdef_id,
+            file_path=files,
+            task_instance_id=task_instance_id
+        ))
+
+    def submit_batch(self, process_id, taskdef_id, files):
+        """
+        Queues a batch run (AgentRuntime.run_batch) and returns the parent TaskInstance_ID.
+        """
+        return self._submit(process_id, taskdef_id, files, lambda task_instance_id: AgentRuntime.run_batch(
+            process_id=process_id,
+            taskdef_id=taskdef_id,
+            files=files,
+            task_instance_id=task_instance_id
+        ))
+
+    def submit_resume(self, task_instance_id):
+        """
+        Queues AgentRuntime.resume_task for a FAILED run.
+        Raises (without queueing anything) if the run cannot be resumed.
+        """
+        AgentRuntime.start_resume(task_instance_id)
+        return self._enqueue(task_instance_id, [], lambda task_instance_id: AgentRuntime.resume_task(
+            task_instance_id,
+            started=True
+        ))
+
+    def is_queued(self, task_instance_id):
+        """Returns True while a run is waiting for, or running on, a worker."""
+        with self._lock:
+            future = self._futures.get(task_instance_id)
+        return future is not None and not future.done()
+
+    def pending_count(self):
+        """Returns the number of runs that have not finished yet."""
+        with self._lock:
+            return sum(1 for f in self._futures.values() if not f.done())
+
+    def shutdown(self, wait=True):
+        """Stops accepting runs and optionally waits for in-flight runs."""
+        self._executor.shutdown(wait=wait)
+
+    def _submit(self, process_id, taskdef_id, files, run):
+        try:
+            task_instance_id = AgentRuntime.start_task(process_id, taskdef_id)
+        except Exception:
+            self._remove_files(files)
+            raise
+        return self._enqueue(task_instance_id, files, run)
+
+    def _enqueue(self, task_instance_id, files, run):
+        future = self._executor.submit(self._run, run, files, task_instance_id)
+        self._track(task_instance_id, future)
+        return task_instance_id
+
+    def _track(self, task_instance_id, future):
+        """
+        Records a submitted run. The entry is removed by a done callback, which
+        runs straight away if the run already finished before it was recorded.
+        """
+        with self._lock:
+            self._futures[task_instance_id] = future
+        future.add_done_callback(lambda f: self._forget(task_instance_id, f))
+
+    def _forget(self, task_instance_id, future):
+        with self._lock:
+            # A resume may have queued a newer future under the same ID.
+            if self._futures.get(task_instance_id) is future:
+                del self._futures[task_instance_id]
+
+    def _run(self, run, files, task_instance_id):
+        try:
+            return run(task_instance_id)
+        finally:
+            self._finish(files, task_instance_id)
+
+    def _finish(self, files, task_instance_id):
+        self._remove_files(files)
+        try:
+            TaskInstanceService().touch_task_instance(task_instance_id)
+        except Exception:
+            pass
+
+    @staticmethod
+    def _remove_files(files):
+        for f in files or []:
+            try:
+                os.remove(f["path"])
+            except Exception:
+                pass
+
+
+class AsyncRunQueue(RunQueue):
+    """
+    Same interface as RunQueue, but runs execute as coroutines on one event loop
+    (a single background thread) with at most max_runs in flight.
+    Batch runs and resumes use the sync runtime on their own pool of
+    sync_workers threads, so they never occupy the loop's default executor
+    (which the coroutine runs use for DB and file work).
+    """
+
+    def __init__(self, max_runs=DEFAULT_MAX_ASYNC_RUNS, sync_workers=DEFAULT_SYNC_WORKERS):
+        self.max_workers = max_runs
+        self._sync_executor = ThreadPoolExecutor(
+            max_workers=sync_workers,
+            thread_name_prefix="rainn-sync-run"
+        )
+        self._loop = asyncio.new_event_loop()
+        self._slots = asyncio.Semaphore(max_runs)
+        self._thread = threading.Thread(
+            target=self._loop.run_forever,
+            name="rainn-async-runs",
+            daemon=True
+        )
+        self._thread.start()
+        self._lock = threading.Lock()
+        self._futures = {}
+
+    def submit(self, process_id, taskdef_id, files):
+        """
+        Queues an asyncio run and returns its TaskInstance_ID immediately.
+        """
+        async def run(task_instance_id):
+            return await AgentRuntime.run_task_async(
+                process_id=process_id,
+                taskdef_id=taskdef_id,
+                file_path=files,
+                task_instance_id=task_instance_id
+            )
+
+        return self._submit(process_id, taskdef_id, files, run)
+
+    def shutdown(self, wait=True):
+        """Stops the event loop; with wait=True, in-flight runs finish first."""
+        if wait:
+            with self._lock:
+                futures = list(self._futures.values())
+            for future in futures:
+                try:
+                    future.result()
+                except Exception:
+                    pass
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._sync_executor.shutdown(wait=wait)
+
+    def _enqueue(self, task_instance_id, files, run):
+        future = asyncio.run_coroutine_threadsafe(
+            self._run_async(run, files, task_instance_id),
+            self._loop
+        )
+        self._track(task_instance_id, future)
+        return task_instance_id
+
+    async def _run_async(self, run, files, task_instance_id):
+        try:
+            async with self._slots:
+                if asyncio.iscoroutinefunction(run):
+                    return await run(task_instance_id)
+                return await self._loop.run_in_executor(self._sync_executor, run, task_instance_id)
+        finally:
+            await asyncio.to_thread(self._finish, files, task_instance_id)
@@ -0,0 +1,171 @@
+# ==========================================
+# File: run_reaper_service.py
+# Added in iteration: 5
+# Author: Karl Concha
+#
+# Background privacy cleanup for finished runs (previously done inside
+# the first request after each cleanup interval).
+# - A daemon thread wakes every interval_seconds, independent of traffic
+# - Expired runs are handled batch_size at a time: one transaction re-checks
+#   their expiry, marks the still-expired runs deleted and clears their stage
+#   outputs (set-based statements, so the write lock is held once per batch
+#   instead of once per run); only then are those runs' folders removed
+# - Folder deletion is rate-limited (folder_deletes_per_second) so a large
+#   backlog does not saturate the disk while runs are executing
+# - Receipts (deleted runs) older than the retention period are purged by
+#   cutoff, batch_size at a time, in one transaction per batch
+# - Expired Stage 0 extraction cache entries are removed (same TTL as runs)
+# - Expired model response cache entries are removed (per-flow TTL), if the
+#   response cache exists
+#
+# Notes:
+# - Rows are marked deleted before their folders are removed, so a run that
+#   was touched after it was selected keeps its folder. A folder left behind
+#   by a crash or stop is removed when its receipt is purged.
+# - A failing cycle is retried on the next interval; the thread keeps going.
+# - User-triggered deletes (the run routes in app.py) stay synchronous.
+# ==========================================
+
+import os
+import shutil
+import threading
+
+from dao.db_connection import transaction
+from service.flow.extraction_cache import get_extraction_cache
+from service.integrations.response_cache import get_existing_response_cache
+from service.task_instance_service import TaskInstanceService
+from service.task_stage_instance_service import TaskStageInstanceService
+
+
+DEFAULT_INTERVAL_SECONDS = 60
+DEFAULT_RECEIPT_RETENTION_SECONDS = 6 * 60 * 60
+DEFAULT_BATCH_SIZE = 100
+DEFAULT_FOLDER_DELETES_PER_SECOND = 20
+RUNS_ROOT = "agent_runs"
+
+
+class RunReaper:
+    """Deletes expired runs and purges old receipts on a background thread."""
+
+    def __init__(
+        self,
+        interval_seconds=DEFAULT_INTERVAL_SECONDS,
+        receipt_retention_seconds=DEFAULT_RECEIPT_RETENTION_SECONDS,
+        batch_size=DEFAULT_BATCH_SIZE,
+        folder_deletes_per_second=DEFAULT_FOLDER_DELETES_PER_SECOND,
+        runs_root=RUNS_ROOT
+    ):
+        self.interval_seconds = interval_seconds
+        self.receipt_retention_seconds = receipt_retention_seconds
+        self.batch_size = max(1, batch_size)
+        self.folder_deletes_per_second = folder_deletes_per_second
+        self.runs_root = runs_root
+        self.last_error = None
+        self.task_instance_service = TaskInstanceService()
+        self.task_stage_instance_service = TaskStageInstanceService()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Starts the reaper thread (no-op if it is already running)."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="rainn-reaper", daemon=True)
+        self._thread.start()
+
+    def stop(self, wait=True):
+        """Stops the reaper after the current folder delete or batch."""
+        self._stop.set()
+        if wait and self._thread is not None:
+            self._thread.join()
+
+    def run_once(self):
+        """
+        One cleanup cycle. Returns (runs deleted, receipts purged, extraction cache
+        entries purged, response cache entries purged).
+        """
+        return (
+            self.reap_expired_runs(),
+            self.purge_old_receipts(),
+            get_extraction_cache().purge_expired(),
+            self.purge_response_cache()
+        )
+
+    @staticmethod
+    def purge_response_cache():
+        """Deletes expired model responses. Returns the number purged (0 if the cache was never created)."""
+        response_cache = get_existing_response_cache()
+        if response_cache is None:
+            return 0
+        return response_cache.purge_expired()
+
+    def reap_expired_runs(self):
+        """Deletes every expired run, batch_size at a time. Returns the number deleted."""
+        total = 0
+        while not self._stop.is_set():
+            ids = self.task_instance_service.get_expired_task_instance_ids(limit=self.batch_size)
+            if not ids:
+                break
+
+            # Expiry is re-checked under the write lock: a run viewed, downloaded or
+            # resumed since it was selected is not deleted.
+            with transaction():
+                deleted_ids = self.task_instance_service.mark_expired_deleted(ids)
+                self.task_stage_instance_service.clear_outputs_for_task_instances(deleted_ids)
+            total += len(deleted_ids)
+
+            for task_instance_id in deleted_ids:
+                if not self._delete_run_folder(task_instance_id):
+                    # Stopped: the remaining folders are removed with their receipts.
+                    return total
+
+            if len(ids) < self.batch_size:
+                break
+        return total
+
+    def purge_old_receipts(self):
+        """
+        Hard deletes receipts past the retention period, removing any run folder a
+        stopped or interrupted reap left behind. Returns the number purged.
+        """
+        total = 0
+        while not self._stop.is_set():
+            with transaction():
+                ids = self.task_instance_service.hard_delete_deleted_before(
+                    self.receipt_retention_seconds,
+                    limit=self.batch_size
+                )
+                self.task_stage_instance_service.delete_for_task_instances(ids)
+                # Before the commit, so a crash cannot drop the row but keep its folder.
+                for task_instance_id in ids:
+                    shutil.rmtree(os.path.join(self.runs_root, str(task_instance_id)), ignore_errors=True)
+            if not ids:
+                break
+            total += len(ids)
+
+            if len(ids) < self.batch_size:
+                break
+        return total
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+                self.last_error = None
+            except Exception as e:
+                self.last_error = e
+            self._stop.wait(self.interval_seconds)
+
+    def _delete_run_folder(self, task_instance_id):
+        """
+        Removes agent_runs/<id>, then waits out the rate limit.
+        Returns False if the reaper was stopped while waiting.
+        """
+        run_folder = os.path.join(self.runs_root, str(task_instance_id))
+        if not os.path.isdir(run_folder):
+            return not self._stop.is_set()
+        shutil.rmtree(run_folder, ignore_errors=True)
+        if self.folder_deletes_per_second:
+            return not self._stop.wait(1 / self.folder_deletes_per_second)
+        return not self._stop.is_set()
@@ -1,15 +1,32 @@
 # ==========================================
 # File: stage_execution_engine.py
-# Updated in iteration: 4
+# Updated in iteration: 5
 # Author: Karl Concha
 #
 # Executes stages 1..N (after Stage 0 is done).
 # - Skips stage defs with TaskStageDef_Type == "input"
-# - Creates TaskStageInstance per stage
+# - Plans stages as a DAG (TaskStageDef_Depends_On, or the previous non-visual
+#   stage by default) and runs ready stages concurrently (max_concurrency)
+# - Pre-creates a PENDING TaskStageInstance for every stage to run (one
+#   INSERT), then moves each through RUNNING to COMPLETED/FAILED
 # - Builds per-stage prompt (master prompt + stage directive + current input)
 # - Calls model client
 # - Writes each stage output to an artifact file
+#   (stream_output=True writes chunks to <artifact>.part as they arrive)
 # - Returns the final output artifact path
+# - Resumed runs pass completed_results so finished stages are not re-executed
+# - Stages with TaskStageDef_Chunk_Tokens map over input chunks in parallel
+#   (see chunker.py), then merge the partial results in the stage's final call
+# - prompt_mode "compact" adds the Stage 0 input to stages that opt in with
+#   TaskStageDef_Include_Input (the master prompt only carries a digest)
+# - Records the estimated prompt tokens of each stage (Prompt_Tokens)
+# - Iteration 5: runs a compiled flow plan (flow_plan.py): the DAG, output
+#   types, output rules, artifact names and stage prompt templates are built
+#   once per flow version, so a stage only fills in its prompt template
+# - Iteration 5: dependency artifacts are read through ArtifactStore
+#   (memory-mapped when large, stripped before decoding)
+# - When a stage fails, stages that were never scheduled are marked FAILED
+#   ("not run: upstream stage failed") instead of staying PENDING
 #
 # #ChatGPT (OpenAI, 2025) – Assisted in designing the sequential stage
 # execution engine, including stop-on-failure logic and registration
@@ -22,8 +39,68 @@
 
 import json
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 
+from dao.db_connection import transaction
+from service.flow.chunker import InputChunker
+from service.flow.flow_plan import FlowPlan
+from service.flow.prompt_compiler import PROMPT_MODE_COMPACT, PROMPT_MODE_FULL
 from service.integrations.chart_renderer import render_chart_svg
+from service.process.artifact_store import ArtifactStore
+
+
+DEFAULT_MAX_STAGE_CONCURRENCY = 4
+
+# Chunk (map) calls in flight at once for a single chunked stage.
+DEFAULT_MAP_CONCURRENCY = 4
+
+# Error recorded on the PENDING rows of stages that were never scheduled.
+UNSCHEDULED_STAGE_MESSAGE = "not run: upstream stage failed"
+
+
+class PartialArtifactWriter:
+    """
+    Writes streamed model output to a stage's .part artifact with the same strip()
+    semantics as the buffered path (leading/trailing whitespace dropped).
+    Shared by the sync and asyncio engines.
+    """
+
+    def __init__(self, partial_path, head_chars=500):
+        self.partial_path = partial_path
+        self.head_chars = head_chars
+        self.head = ""
+        self._pending = ""
+        self._written = 0
+        self._file = open(partial_path, "w", encoding="utf-8")
+
+    def write(self, chunk):
+        text = self._pending + chunk
+        if not self._written:
+            text = text.lstrip()
+        body = text.rstrip()
+        self._pending = text[len(body):]
+        if not body:
+            return
+        self._file.write(body)
+        self._file.flush()
+        self._written += len(body)
+        if len(self.head) < self.head_chars:
+            self.head += body[:self.head_chars - len(self.head)]
+
+    def finish(self):
+        """Closes the file and returns the head text; empty output is an error."""
+        self._file.close()
+        if not self._written:
+            os.remove(self.partial_path)
+            raise Exception("Model client returned no output.")
+        return self.head
+
+    def discard(self):
+        """Closes and removes the partial file after a failed stream."""
+        self._file.close()
+        if os.path.exists(self.partial_path):
+            os.remove(self.partial_path)
 
 
 class StageExecutionEngine:
@@ -40,56 +117,236 @@ class StageExecutionEngine:
         model_name,
         task_stage_instance_service,
         stage0_artifact_path,
-        system_prompt=None
+        system_prompt=None,
+        stream_output=False,
+        max_concurrency=DEFAULT_MAX_STAGE_CONCURRENCY,
+        completed_results=None,
+        prompt_mode=PROMPT_MODE_FULL,
+        flow_plan=None
     ):
         """
         Executes stages 1..N (skipping input) and returns final artifact path + type.
         If system_prompt is provided, it is sent to the model client as a system-level instruction.
+        If stream_output is True and the model client supports generate_stream, output is
+        written to the artifact as it is generated instead of being buffered in memory.
+
+        Stages form a DAG (see FlowPlan._plan_nodes). flow_plan is the compiled plan of
+        stage_defs when the caller has one; otherwise it is compiled here. A stage starts as soon as every stage it
+        depends on has completed, with at most max_concurrency stages running at once.
+
+        completed_results ({stage order: (artifact path, output type)}, see reusable_results)
+        marks stages that already completed in an earlier attempt; they are not re-executed.
+
+        prompt_mode must match the mode the master prompt was compiled with; in "compact"
+        mode stages with include_input also receive the Stage 0 artifact.
         """
 
         os.makedirs(artifacts_dir, exist_ok=True)
 
-        # Sort stages deterministically (by TaskStageDef_ID if present)
-        sorted_stages = sorted(stage_defs or [], key=lambda s: getattr(s, "TaskStageDef_ID", 0))
+        flow_plan = flow_plan or FlowPlan.compile(stage_defs)
+        plan = flow_plan.nodes
+        names = flow_plan.names
 
-        # Filter out "input" stages (Stage 0 already handled that)
-        exec_stages = []
-        for s in sorted_stages:
-            stage_type = (getattr(s, "TaskStageDef_Type", "") or "").strip().lower()
-            if stage_type == "input":
-                continue
-            exec_stages.append(s)
+        # order -> (artifact path, output type); order 0 is the Stage 0 input artifact
+        results = {0: (stage0_artifact_path, "text")}
+        results.update(completed_results or {})
+        pending = {node["order"]: node for node in plan if node["order"] not in results}
+        running = {}
+        first_error = None
+
+        # One INSERT for every stage row; each stage then only updates its own row.
+        stage_instance_ids = task_stage_instance_service.create_pending_stage_instances(
+            task_instance_id,
+            [(order, pending[order]["stage_type"]) for order in sorted(pending)]
+        )
+
+        # SQLite has a single writer, so stage bookkeeping is serialised across workers.
+        db_lock = threading.Lock()
 
-        current_input_path = stage0_artifact_path
+        with ThreadPoolExecutor(max_workers=max(1, max_concurrency)) as pool:
+            while pending or running:
+                if first_error is None:
+                    for order in sorted(pending):
+                        node = pending[order]
+                        if not all(dep in results for dep in node["depends_on"]):
+                            continue
+                        del pending[order]
+                        future = pool.submit(
+                            StageExecutionEngine._execute_stage,
+                            node,
+                            stage_instance_ids[order],
+                            StageExecutionEngine._stage_inputs(node, names, results, prompt_mode),
+                            task_instance_id,
+                            artifacts_dir,
+                            master_prompt,
+                            model_client,
+                            model_name,
+                            task_stage_instance_service,
+                            system_prompt,
+                            stream_output,
+                            db_lock
+                        )
+                        running[future] = order
+
+                if not running:
+                    break
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    order = running.pop(future)
+                    try:
+                        results[order] = future.result()
+                    except Exception as e:
+                        # Stop scheduling new stages; in-flight stages are allowed to finish.
+                        if first_error is None:
+                            first_error = e
+
+        if first_error is not None:
+            StageExecutionEngine._fail_unscheduled(task_stage_instance_service, stage_instance_ids, pending)
+            raise first_error
+
+        return StageExecutionEngine._select_final_output(plan, results)
+
+    @staticmethod
+    def _fail_unscheduled(task_stage_instance_service, stage_instance_ids, pending):
+        """Marks the PENDING rows of stages that were never scheduled FAILED (one transaction)."""
+        if not pending:
+            return
+        with transaction():
+            task_stage_instance_service.mark_stages_failed(
+                [stage_instance_ids[order] for order in sorted(pending)],
+                UNSCHEDULED_STAGE_MESSAGE
+            )
+
+    @staticmethod
+    def _select_final_output(plan, results):
+        """
+        Final output = last non-visual artifact (by stage order);
+        visual-only flows fall back to the first visual artifact.
+        """
         final_output_path = None
         final_output_type = None
+        for node in plan:
+            out_path, output_type = results[node["order"]]
+            if output_type != "svg":
+                final_output_path = out_path
+                final_output_type = output_type
+            elif final_output_path is None:
+                final_output_path = out_path
+                final_output_type = output_type
+
+        return final_output_path, final_output_type
+
+    @staticmethod
+    def reusable_results(stage_defs, stage_instances, flow_plan=None):
+        """
+        Returns {stage order: (artifact path, output type)} for stages of an earlier attempt
+        that can be reused as-is: the stage COMPLETED, its artifact is still on disk, it
+        still matches the flow's stage at that order, and everything it depends on is
+        reused too (anything downstream of a failed stage is re-executed).
+        flow_plan is the compiled plan of stage_defs, if the caller has one.
+        """
+        completed = {}
+        for st in stage_instances or []:
+            if st.Status != "COMPLETED" or not st.Output_Artifact_Path:
+                continue
+            if not os.path.isfile(st.Output_Artifact_Path):
+                continue
+            completed[st.Stage_Order] = st
 
-        for i, stage in enumerate(exec_stages, start=1):
-            stage_type_raw = (getattr(stage, "TaskStageDef_Type", "") or "").strip()
-            stage_desc = (getattr(stage, "TaskStageDef_Description", "") or "").strip()
-
-            # Create stage instance row (RUNNING)
-            stage_instance_id = task_stage_instance_service.create_stage_instance(
-                task_instance_id_fk=task_instance_id,
-                stage_order=i,
-                stage_name=stage_type_raw,
-                status="RUNNING",
-                output_artifact_path=None
+        reusable = {}
+        for node in (flow_plan or FlowPlan.compile(stage_defs)).nodes:
+            st = completed.get(node["order"])
+            if not st or st.Stage_Name != node["stage_type"]:
+                continue
+            if not all(dep == 0 or dep in reusable for dep in node["depends_on"]):
+                continue
+            reusable[node["order"]] = (
+                st.Output_Artifact_Path,
+                StageExecutionEngine._artifact_output_type(st.Output_Artifact_Path)
             )
+        return reusable
 
-            try:
-                # Read current input from previous artifact
-                with open(current_input_path, "r", encoding="utf-8") as f:
-                    input_text = f.read()
-
-                # Build stage prompt
-                stage_prompt = StageExecutionEngine._build_stage_prompt(
-                    master_prompt=master_prompt,
-                    stage_type=stage_type_raw,
-                    stage_description=stage_desc,
-                    input_text=input_text
+    @staticmethod
+    def _stage_inputs(node, names, results, prompt_mode):
+        """
+        (name, artifact path) pairs a stage reads: its dependencies, plus the Stage 0
+        input first for include_input stages in compact mode.
+        """
+        orders = list(node["depends_on"])
+        if prompt_mode == PROMPT_MODE_COMPACT and node.get("include_input") and 0 not in orders:
+            orders.insert(0, 0)
+        return [(names[order], results[order][0]) for order in orders]
+
+    @staticmethod
+    def _prompt_tokens(system_prompt, stage_prompt, extra_tokens=0):
+        """Estimated tokens a stage sends to the model (system + stage prompt + map calls)."""
+        return (
+            InputChunker.estimate_tokens(system_prompt)
+            + InputChunker.estimate_tokens(stage_prompt)
+            + extra_tokens
+        )
+
+    @staticmethod
+    def _execute_stage(
+        node,
+        stage_instance_id,
+        inputs,
+        task_instance_id,
+        artifacts_dir,
+        master_prompt,
+        model_client,
+        model_name,
+        task_stage_instance_service,
+        system_prompt,
+        stream_output,
+        db_lock
+    ):
+        """
+        Runs a single stage: marks its (PENDING) TaskStageInstance RUNNING, builds the
+        prompt from its dependency artifacts, calls the model and writes the output artifact.
+        Returns (artifact path, output type).
+        """
+        prompt_tokens = None
+
+        # Mark stage instance row RUNNING
+        with db_lock:
+            task_stage_instance_service.mark_stage_running(stage_instance_id)
+
+        try:
+            # Read current input from the dependency artifact(s)
+            input_text = StageExecutionEngine._read_inputs(inputs)
+
+            # Build stage prompt (oversized input: map over chunks, the call below merges)
+            map_tokens = 0
+            if StageExecutionEngine._needs_chunking(node, input_text):
+                stage_prompt, map_tokens = StageExecutionEngine._map_reduce_prompt(
+                    node,
+                    input_text,
+                    artifacts_dir,
+                    master_prompt,
+                    model_client,
+                    model_name,
+                    system_prompt
                 )
+            else:
+                stage_prompt = node["prompt"].render(master_prompt, input_text)
 
+            prompt_tokens = StageExecutionEngine._prompt_tokens(system_prompt, stage_prompt, map_tokens)
+
+            if stream_output and hasattr(model_client, "generate_stream"):
+                # Stream chunks straight to disk; only the head is kept for type inference.
+                partial_path = StageExecutionEngine._partial_path(artifacts_dir, node)
+                head_text = StageExecutionEngine._stream_to_file(
+                    model_client.generate_stream(
+                        model_name,
+                        stage_prompt,
+                        system_prompt=system_prompt
+                    ),
+                    partial_path
+                )
+                output_text = None
+            else:
                 # Call model
                 output_text = model_client.generate(
                     model_name,
@@ -98,74 +355,229 @@ class StageExecutionEngine:
                 )
                 if output_text is None:
                     raise Exception("Model client returned no output.")
+                head_text = output_text
 
-                # Write output artifact (infer type from stage intent or model output)
-                desired_type = StageExecutionEngine._desired_output_type(stage_type_raw, stage_desc)
-                output_type = desired_type or StageExecutionEngine._infer_output_type(output_text)
-                if output_type == "svg":
-                    rendered_svg = StageExecutionEngine._render_svg_from_json(output_text)
-                    if rendered_svg:
-                        output_text = rendered_svg
-                    else:
-                        extracted_svg = StageExecutionEngine._extract_svg(output_text)
-                        if extracted_svg:
-                            output_text = extracted_svg
-                        else:
-                            output_type = "text"
-                safe_stage_type = stage_type_raw.replace(" ", "_").lower() or "stage"
-                file_ext = "txt"
-                if output_type == "svg":
-                    file_ext = "svg"
-                elif output_type == "csv":
-                    file_ext = "csv"
-                elif output_type == "json":
-                    file_ext = "json"
-                out_filename = f"{i:02d}_stage_{safe_stage_type}_output.{file_ext}"
-                out_path = os.path.join(artifacts_dir, out_filename)
-
-                with open(out_path, "w", encoding="utf-8") as f:
-                    f.write(output_text)
-
-                # Mark completed + chain
-                task_stage_instance_service.mark_stage_completed(stage_instance_id, out_path)
-                is_visual = output_type == "svg"
-                if not is_visual:
-                    current_input_path = out_path
-                    final_output_path = out_path
-                    final_output_type = output_type
-                elif final_output_path is None:
-                    # Visual-only flows should still return a final artifact.
-                    final_output_path = out_path
-                    final_output_type = output_type
-
-            except Exception as e:
-                # Mark failed then re-raise so runtime can handle task failure
-                try:
-                    task_stage_instance_service.mark_stage_failed(stage_instance_id, str(e))
-                except Exception:
-                    pass
-                raise
+            out_path, output_type = StageExecutionEngine._write_artifact(
+                artifacts_dir, node, head_text, output_text
+            )
 
-        return final_output_path, final_output_type
+            # Mark completed
+            with db_lock:
+                task_stage_instance_service.mark_stage_completed(stage_instance_id, out_path, prompt_tokens)
+            return out_path, output_type
+
+        except Exception as e:
+            # Mark failed then re-raise so runtime can handle task failure
+            try:
+                with db_lock:
+                    task_stage_instance_service.mark_stage_failed(stage_instance_id, str(e), prompt_tokens)
+            except Exception:
+                pass
+            raise
 
     @staticmethod
-    def _desired_output_type(stage_type, stage_description):
-        stage_type_l = (stage_type or "").lower()
-        stage_desc_l = (stage_description or "").lower()
-        haystack = f"{stage_type_l} {stage_desc_l}"
-        if ("graph" in haystack or "visual" in haystack or "chart" in haystack
-                or "diagram" in haystack or "visualize" in haystack or "plot" in haystack
-                or "infographic" in haystack):
-            return "svg"
-        if ("csv" in haystack or "table" in haystack or "spreadsheet" in haystack
-                or "tabular" in haystack or "rows" in haystack or "columns" in haystack
-                or "export" in haystack):
-            return "csv"
-        if ("json" in haystack or "structured" in haystack or "schema" in haystack
-                or "key-value" in haystack or "object" in haystack or "array" in haystack
-                or "fields" in haystack):
-            return "json"
-        return None
+    def _needs_chunking(node, input_text):
+        chunk_tokens = node.get("chunk_tokens")
+        return bool(chunk_tokens) and InputChunker.estimate_tokens(input_text) > chunk_tokens
+
+    @staticmethod
+    def _map_reduce_prompt(node, input_text, artifacts_dir, master_prompt, model_client, model_name,
+                           system_prompt, max_concurrency=DEFAULT_MAP_CONCURRENCY):
+        """
+        Map step for a chunked stage: runs the stage on every input chunk in parallel and,
+        if the partial results are still too large, merges them in groups. Returns the
+        prompt for the final merge call, which the caller executes like a normal stage,
+        and the estimated prompt tokens already sent by the map/merge calls.
+        Raises if the results cannot be merged below chunk_tokens.
+        """
+        chunk_tokens = node["chunk_tokens"]
+        chunks = InputChunker.split(input_text, chunk_tokens)
+
+        sent_tokens = 0
+
+        def generate(prompt):
+            text = model_client.generate(model_name, prompt, system_prompt=system_prompt)
+            if not text:
+                raise Exception("Model client returned no output.")
+            return text
+
+        with ThreadPoolExecutor(max_workers=max(1, max_concurrency)) as pool:
+            prompts = StageExecutionEngine._map_prompts(node, master_prompt, chunks)
+            sent_tokens += sum(StageExecutionEngine._prompt_tokens(system_prompt, p) for p in prompts)
+            partials = list(pool.map(generate, prompts))
+            StageExecutionEngine._write_chunk_outputs(artifacts_dir, node, partials)
+
+            groups = StageExecutionEngine._merge_groups(partials, chunk_tokens)
+            while 1 < len(groups) < len(partials):
+                prompts = [StageExecutionEngine._merge_prompt(node, master_prompt, group) for group in groups]
+                sent_tokens += sum(StageExecutionEngine._prompt_tokens(system_prompt, p) for p in prompts)
+                partials = list(pool.map(generate, prompts))
+                groups = StageExecutionEngine._merge_groups(partials, chunk_tokens)
+
+        StageExecutionEngine._check_final_merge(node, partials)
+        return StageExecutionEngine._merge_prompt(node, master_prompt, partials), sent_tokens
+
+    @staticmethod
+    def _check_final_merge(node, partials):
+        """
+        Raises if the partial results still exceed chunk_tokens once merging stops
+        shrinking them, instead of sending an oversized final merge prompt.
+        """
+        total_tokens = sum(InputChunker.estimate_tokens(text) for text in partials)
+        if total_tokens > node["chunk_tokens"]:
+            raise Exception(
+                f"Stage '{node['stage_type']}': the chunk results (~{total_tokens} tokens) "
+                f"could not be merged below chunk_tokens ({node['chunk_tokens']}). "
+                "Increase the stage's chunk_tokens."
+            )
+
+    @staticmethod
+    def _map_prompts(node, master_prompt, chunks):
+        """Stage prompts for each input chunk (map step)."""
+        total = len(chunks)
+        return [
+            node["prompt"].render(
+                master_prompt,
+                chunk,
+                goal=(
+                    f"{node['stage_desc']}\n"
+                    f"(This is part {idx} of {total} of a larger input. "
+                    "Cover only what appears in this part.)"
+                )
+            )
+            for idx, chunk in enumerate(chunks, start=1)
+        ]
+
+    @staticmethod
+    def _merge_prompt(node, master_prompt, partials):
+        """Stage prompt that merges partial (per-chunk) results into one result."""
+        total = len(partials)
+        merged_input = "\n\n".join(
+            f"=== PART {idx} OF {total} ===\n{text.strip()}"
+            for idx, text in enumerate(partials, start=1)
+        )
+        return node["prompt"].render(
+            master_prompt,
+            merged_input,
+            goal=(
+                f"{node['stage_desc']}\n"
+                f"(Merge step: the input holds this stage's results for {total} consecutive parts "
+                "of a larger input. Combine them into one complete result, remove duplicates, "
+                "keep every distinct finding and add nothing that is not in them.)"
+            )
+        )
+
+    @staticmethod
+    def _merge_groups(partials, chunk_tokens):
+        """Packs consecutive partial results into groups that fit in one merge call."""
+        groups = []
+        current = []
+        current_tokens = 0
+        for text in partials:
+            tokens = InputChunker.estimate_tokens(text)
+            if current and current_tokens + tokens > chunk_tokens:
+                groups.append(current)
+                current = []
+                current_tokens = 0
+            current.append(text)
+            current_tokens += tokens
+        if current:
+            groups.append(current)
+        return groups
+
+    @staticmethod
+    def _write_chunk_outputs(artifacts_dir, node, partials):
+        """Persists map-step outputs under artifacts/NN_stage_<type>_chunks/ for traceability."""
+        chunks_dir = os.path.join(artifacts_dir, f"{node['artifact_stem']}_chunks")
+        os.makedirs(chunks_dir, exist_ok=True)
+        for idx, text in enumerate(partials, start=1):
+            with open(os.path.join(chunks_dir, f"chunk_{idx:03d}.txt"), "w", encoding="utf-8") as f:
+                f.write(text)
+
+    @staticmethod
+    def _partial_path(artifacts_dir, node):
+        """Path of the in-progress (streamed) artifact for a stage."""
+        return os.path.join(artifacts_dir, f"{node['artifact_stem']}_output.part")
+
+    @staticmethod
+    def _write_artifact(artifacts_dir, node, head_text, output_text=None):
+        """
+        Writes the final artifact for a stage and returns (artifact path, output type).
+        output_text=None means the output was streamed to the stage's .part file, which is
+        renamed into place (or read back and converted, for visual stages).
+        """
+        output_type = node["output_type"] or StageExecutionEngine._infer_output_type(head_text)
+        partial_path = StageExecutionEngine._partial_path(artifacts_dir, node)
+
+        if output_type == "svg":
+            if output_text is None:
+                output_text = ArtifactStore.read_text(partial_path)
+                os.remove(partial_path)
+            output_text, output_type = StageExecutionEngine._to_visual(output_text)
+
+        file_ext = "txt"
+        if output_type == "svg":
+            file_ext = "svg"
+        elif output_type == "csv":
+            file_ext = "csv"
+        elif output_type == "json":
+            file_ext = "json"
+        out_path = os.path.join(artifacts_dir, f"{node['artifact_stem']}_output.{file_ext}")
+
+        if output_text is None:
+            os.replace(partial_path, out_path)
+        else:
+            with open(out_path, "w", encoding="utf-8") as f:
+                f.write(output_text)
+        return out_path, output_type
+
+    @staticmethod
+    def _read_inputs(inputs):
+        """
+        Reads dependency artifacts. A single dependency is passed through unchanged;
+        several are joined with a header per source stage.
+        """
+        if len(inputs) == 1:
+            return ArtifactStore.read_text(inputs[0][1])
+
+        return "\n\n".join(
+            f"=== {name} ===\n{ArtifactStore.read_text(path, strip=True)}"
+            for name, path in inputs
+        )
+
+    @staticmethod
+    def _stream_to_file(chunks, partial_path, head_chars=500):
+        """
+        Writes streamed chunks to partial_path (see PartialArtifactWriter).
+        Returns the first head_chars characters for output type inference.
+        """
+        writer = PartialArtifactWriter(partial_path, head_chars)
+        try:
+            for chunk in chunks:
+                writer.write(chunk)
+        except Exception:
+            writer.discard()
+            raise
+        return writer.finish()
+
+    @staticmethod
+    def _artifact_output_type(artifact_path):
+        """Maps an artifact file extension back to its output type."""
+        ext = os.path.splitext(artifact_path)[1].lower()
+        if ext in (".svg", ".csv", ".json"):
+            return ext[1:]
+        return "text"
+
+    @staticmethod
+    def _to_visual(output_text):
+        """Turns a JSON chart spec (or embedded SVG) into SVG; falls back to text."""
+        rendered_svg = StageExecutionEngine._render_svg_from_json(output_text)
+        if rendered_svg:
+            return rendered_svg, "svg"
+        extracted_svg = StageExecutionEngine._extract_svg(output_text)
+        if extracted_svg:
+            return extracted_svg, "svg"
+        return output_text, "text"
 
     @staticmethod
     def _infer_output_type(output_text):
@@ -216,68 +628,3 @@ class StageExecutionEngine:
         if start != -1 and end != -1 and end > start:
             return text[start:end + len("</svg>")]
         return None
-
-    @staticmethod
-    def _build_stage_prompt(master_prompt, stage_type, stage_description, input_text):
-        master_prompt = (master_prompt or "").strip()
-        stage_type = (stage_type or "").strip()
-        stage_description = (stage_description or "").strip()
-        input_text = (input_text or "").strip()
-        output_rules = StageExecutionEngine._output_rules_for_stage(stage_type, stage_description)
-        priority_rules = """
-[PRIORITY RULES]
-- The system primer sets global rules, tone, and formatting.
-- Stage instructions define the task for this step.
-- If there is a conflict, follow the system primer.
-""".strip()
-
-        return f"""
-{master_prompt}
-
-[CURRENT STAGE]
-Type: {stage_type}
-Goal: {stage_description}
-
-[CURRENT INPUT]
-{input_text}
-
-[PRIORITY]
-{priority_rules}
-
-[INSTRUCTIONS]
-Perform ONLY this stage. Output must be suitable as input to the next stage.
-{output_rules}
-""".strip()
-
-    @staticmethod
-    def _output_rules_for_stage(stage_type, stage_description):
-        stage_type_l = (stage_type or "").lower()
-        stage_desc_l = (stage_description or "").lower()
-        if stage_type_l == "output":
-            return """
-[OUTPUT RULES FOR FINAL STAGE]
-- This is the final stage. Do not mention stages, pipelines, or scripts.
-- Do not ask to proceed or request confirmation.
-- Provide the final response only.
-- Do not include code, pseudocode, or implementation steps.
-""".strip()
-        if "graph" in stage_type_l or "graph" in stage_desc_l or "visual" in stage_type_l or "visual" in stage_desc_l:
-            return """
-[OUTPUT RULES FOR GRAPH]
-- Return ONLY JSON with keys: title, labels, values, x_label, y_label.
-- "labels" must be a list of strings and "values" must be a list of numbers.
-- Do not include prose, markdown, or code fences.
-""".strip()
-        if "csv" in stage_type_l or "csv" in stage_desc_l or "table" in stage_desc_l:
-            return """
-[OUTPUT RULES FOR TABLE]
-- Return ONLY CSV text (no prose, no markdown).
-- First line must be the header row.
-""".strip()
-        if "json" in stage_type_l or "json" in stage_desc_l or "structured" in stage_desc_l:
-            return """
-[OUTPUT RULES FOR STRUCTURED]
-- Return ONLY valid JSON.
-- Do not wrap in code fences or add commentary.
-""".strip()
-        return ""
@@ -1,6 +1,6 @@
 # ==========================================
 # File: taskdef_service.py
-# Updated in iteration: 4
+# Updated in iteration: 5
 # Author: Karl Concha
 #
 # #ChatGPT (OpenAI, 2025) – Assisted in refactoring the service layer by 
@@ -13,9 +13,14 @@
 # - SQLite3 Documentation – https://docs.python.org/3/library/sqlite3.html
 # - Flask Service Layer Patterns – https://flask.palletsprojects.com/
 # - UCC IS4470 FYP Bible – Code modularity + documentation guidelines
+#
+# Iteration 5: TaskDef changes invalidate the cached flow definitions
+# (flow_definition_cache.py) built on that TaskDef.
 # ==========================================
 
-from dao.task_def_dao import TaskDefDAO
+from dao.db_connection import DEFAULT_PAGE_SIZE
+from dao.task_def_dao import TASK_DEF_COLUMNS, TaskDefDAO
+from service.flow.flow_definition_cache import get_flow_cache
 from model.task_def import TaskDef
 
 class TaskDefService:
@@ -39,11 +44,23 @@ class TaskDefService:
         """ Returns all TaskDefs in the system. """
         return self.taskdef_dao.get_all_TaskDefs()
 
+    def list_taskdefs_page(self, columns=TASK_DEF_COLUMNS, before_id=None, limit=DEFAULT_PAGE_SIZE):
+        """ Returns one page of TaskDefs (newest first) and the before_id of the next page. """
+        return self.taskdef_dao.get_TaskDef_page(columns, before_id, limit)
+
+    def get_taskdef_names(self, taskdef_ids):
+        """ Returns {TaskDef_ID: TaskDef_Name} for the given TaskDefs. """
+        return self.taskdef_dao.get_TaskDef_names(taskdef_ids)
+
     def update_taskdef(self, taskdef_id, name, description):
         """ Updates an existing TaskDef entry. """
         updated_task = TaskDef(taskdef_id, name, description)
-        return self.taskdef_dao.update_TaskDef(updated_task)
+        updated = self.taskdef_dao.update_TaskDef(updated_task)
+        get_flow_cache().invalidate_taskdef(taskdef_id)
+        return updated
 
     def delete_taskdef(self, taskdef_id):
         """ Deletes a TaskDef entry. """
-        return self.taskdef_dao.delete_TaskDef(taskdef_id)
+        deleted = self.taskdef_dao.delete_TaskDef(taskdef_id)
+        get_flow_cache().invalidate_taskdef(taskdef_id)
+        return deleted
@@ -1,6 +1,6 @@
 # ==========================================
 # File: task_instance_service.py
-# Updated in iteration: 4
+# Updated in iteration: 5
 # Author: Karl Concha
 #
 # Service layer for managing TaskInstance lifecycle during runtime.
@@ -10,7 +10,8 @@
 
 from datetime import datetime, timedelta
 
-from dao.task_instance_dao import TaskInstanceDAO
+from dao.db_connection import DEFAULT_PAGE_SIZE
+from dao.task_instance_dao import TASK_INSTANCE_COLUMNS, TaskInstanceDAO
 from model.task_instance import TaskInstance
 
 
@@ -23,8 +24,9 @@ class TaskInstanceService:
     def __init__(self):
         self.dao = TaskInstanceDAO()
 
-    def create_task_instance(self, process_id_fk, taskdef_id_fk, status, run_folder):
-        """Creates a new TaskInstance entry."""
+    def create_task_instance(self, process_id_fk, taskdef_id_fk, status, run_folder,
+                             parent_task_instance_id_fk=None):
+        """Creates a new TaskInstance entry (optionally as a child of a batch run)."""
         now = datetime.utcnow()
         expires_at = now + timedelta(seconds=DEFAULT_TTL_SECONDS)
         now_str = now.strftime("%Y-%m-%d %H:%M:%S")
@@ -40,7 +42,8 @@ class TaskInstanceService:
             Deleted_At=None,
             Downloaded_At=None,
             Created_At=None,
-            Updated_At=None
+            Updated_At=None,
+            Parent_TaskInstance_ID_FK=parent_task_instance_id_fk
         )
         return self.dao.create_task_instance(new_instance)
 
@@ -52,6 +55,15 @@ class TaskInstanceService:
         """Returns all TaskInstances (newest first)."""
         return self.dao.get_all_task_instances()
 
+    def list_task_instances_page(self, columns=TASK_INSTANCE_COLUMNS, before_id=None, limit=DEFAULT_PAGE_SIZE,
+                                 status=None, process_id=None):
+        """Returns one page of TaskInstances (newest first) and the before_id of the next page."""
+        return self.dao.get_task_instance_page(columns, before_id, limit, status, process_id)
+
+    def list_child_task_instances(self, parent_task_instance_id):
+        """Returns the per-file runs of a batch run."""
+        return self.dao.get_child_task_instances(parent_task_instance_id)
+
     def update_task_instance(self, task_instance):
         """Updates an existing TaskInstance entry."""
         return self.dao.update_task_instance(task_instance)
@@ -80,27 +92,63 @@ class TaskInstanceService:
         expires_str = expires_at.strftime("%Y-%m-%d %H:%M:%S")
         return self.dao.mark_downloaded(task_instance_id, now_str, expires_str)
 
+    def fail_interrupted_runs(self, ttl_seconds=DEFAULT_TTL_SECONDS):
+        """
+        Marks runs left RUNNING by a previous process FAILED (resumable, then reapable
+        once the TTL passes). Returns their IDs.
+        """
+        now = datetime.utcnow()
+        expires_at = now + timedelta(seconds=ttl_seconds)
+        now_str = now.strftime("%Y-%m-%d %H:%M:%S")
+        expires_str = expires_at.strftime("%Y-%m-%d %H:%M:%S")
+        return self.dao.fail_running_task_instances(now_str, expires_str)
+
     def mark_deleted(self, task_instance_id):
         """Marks a run as deleted."""
         now = datetime.utcnow()
         now_str = now.strftime("%Y-%m-%d %H:%M:%S")
         return self.dao.mark_deleted(task_instance_id, now_str)
 
-    def get_expired_task_instances(self):
-        """Returns task instances that have expired and are not deleted."""
+    def mark_deleted_many(self, task_instance_ids):
+        """Marks several runs as deleted (one statement). Returns their IDs."""
+        now_str = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
+        return self.dao.mark_deleted_many(task_instance_ids, now_str)
+
+    def mark_expired_deleted(self, task_instance_ids):
+        """Marks the runs that are still expired as deleted (one transaction). Returns their IDs."""
         now_str = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
-        return self.dao.get_expired_task_instances(now_str)
+        return self.dao.mark_expired_deleted(task_instance_ids, now_str, now_str)
 
-    def get_deleted_before(self, seconds_ago):
-        """Returns task instances deleted before a cutoff."""
+    def get_expired_task_instances(self, limit=None):
+        """Returns task instances that have expired and are not deleted (at most limit)."""
+        now_str = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
+        return self.dao.get_expired_task_instances(now_str, limit)
+
+    def get_expired_task_instance_ids(self, limit=None):
+        """Returns the IDs of expired, not deleted task instances (at most limit)."""
+        now_str = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
+        return self.dao.get_expired_task_instance_ids(now_str, limit)
+
+    def get_deleted_before(self, seconds_ago, limit=None):
+        """Returns task instances deleted before a cutoff (at most limit)."""
         cutoff = datetime.utcnow() - timedelta(seconds=seconds_ago)
         cutoff_str = cutoff.strftime("%Y-%m-%d %H:%M:%S")
-        return self.dao.get_deleted_task_instances_before(cutoff_str)
+        return self.dao.get_deleted_task_instances_before(cutoff_str, limit)
 
     def hard_delete(self, task_instance_id):
         """Hard deletes a TaskInstance row."""
         return self.dao.delete_task_instance(task_instance_id)
 
+    def hard_delete_many(self, task_instance_ids):
+        """Hard deletes several TaskInstance rows (one statement). Returns their IDs."""
+        return self.dao.delete_task_instances(task_instance_ids)
+
+    def hard_delete_deleted_before(self, seconds_ago, limit=None):
+        """Hard deletes runs deleted before a cutoff (at most limit). Returns their IDs."""
+        cutoff = datetime.utcnow() - timedelta(seconds=seconds_ago)
+        cutoff_str = cutoff.strftime("%Y-%m-%d %H:%M:%S")
+        return self.dao.delete_deleted_before(cutoff_str, limit)
+
     def is_active(self, task_instance):
         """Returns True if a task instance is not deleted and not expired."""
         if not task_instance:
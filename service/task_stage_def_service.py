@@ -1,6 +1,6 @@
 # ==========================================
 # File: taskstage_service.py
-# Updated in iteration: 4
+# Updated in iteration: 5
 # Author: Karl Concha
 #
 # #ChatGPT (OpenAI, 2025) – Assisted in restructuring stage-handling logic
@@ -13,9 +13,14 @@
 # - SQLite3 Documentation – https://docs.python.org/3/library/sqlite3.html
 # - DAO/Service Design Patterns – https://flask.palletsprojects.com/
 # - UCC IS4470 FYP Bible – Modularity + documentation standards
+#
+# Iteration 5: stage changes invalidate the cached flow definitions
+# (flow_definition_cache.py) of the TaskDef they belong to.
 # ==========================================
 
-from dao.task_stage_def_dao import TaskStageDefDAO
+from dao.db_connection import DEFAULT_PAGE_SIZE
+from dao.task_stage_def_dao import TASK_STAGE_DEF_COLUMNS, TaskStageDefDAO
+from service.flow.flow_definition_cache import get_flow_cache
 from model.task_stage_def import TaskStageDef
 
 class TaskStageService:
@@ -25,10 +30,19 @@ class TaskStageService:
         """ Initializes DAO instance for TaskStageDef operations. """
         self.taskstage_dao = TaskStageDefDAO()
 
-    def create_stage(self, taskdef_id, stage_type, description):
-        """ Creates a new stage for a specific TaskDef. """
-        new_stage = TaskStageDef(None, taskdef_id, stage_type, description)
-        return self.taskstage_dao.add_TaskStageDef(new_stage)
+    def create_stage(self, taskdef_id, stage_type, description, depends_on=None, chunk_tokens=None,
+                     include_input=False):
+        """ Creates a new stage for a specific TaskDef.
+        depends_on is an optional list (or comma-separated string) of earlier stage names.
+        chunk_tokens opts the stage into map-reduce over input chunks of that size.
+        include_input sends the original input to the stage in compact prompt mode. """
+        if isinstance(depends_on, (list, tuple)):
+            depends_on = ",".join(d.strip() for d in depends_on if d and d.strip())
+        new_stage = TaskStageDef(None, taskdef_id, stage_type, description, depends_on or None,
+                                 chunk_tokens or None, 1 if include_input else 0)
+        created = self.taskstage_dao.add_TaskStageDef(new_stage)
+        get_flow_cache().invalidate_taskdef(taskdef_id)
+        return created
 
     def get_stages_for_task(self, taskdef_id):
         """ Retrieves all stages belonging to a specific TaskDef. """
@@ -42,9 +56,16 @@ class TaskStageService:
         """ Returns all TaskStageDef entries in the system. """
         return self.taskstage_dao.get_all_TaskStageDefs()
 
+    def list_stages_page(self, columns=TASK_STAGE_DEF_COLUMNS, before_id=None, limit=DEFAULT_PAGE_SIZE,
+                         taskdef_id=None):
+        """ Returns one page of TaskStageDefs (newest first) and the before_id of the next page. """
+        return self.taskstage_dao.get_TaskStageDef_page(columns, before_id, limit, taskdef_id)
+
     def delete_stage(self, stage_id):
         """ Deletes a single TaskStageDef. """
-        return self.taskstage_dao.delete_TaskStageDef(stage_id)
+        deleted = self.taskstage_dao.delete_TaskStageDef(stage_id)
+        get_flow_cache().invalidate()
+        return deleted
 
     def delete_stages_for_task(self, taskdef_id):
         """ Deletes all stages associated with a given TaskDef. """
@@ -52,3 +73,4 @@ class TaskStageService:
         for s in stages:
             if s.TaskDef_ID_FK == taskdef_id:
                 self.taskstage_dao.delete_TaskStageDef(s.TaskStageDef_ID)
+        get_flow_cache().invalidate_taskdef(taskdef_id)
@@ -1,6 +1,6 @@
  # ==========================================
 # File: task_stage_instance_service.py
-# Updated in iteration: 4
+# Updated in iteration: 5
 # Author: Karl Concha
 #
 # Purpose:
@@ -9,7 +9,8 @@
 # Date: January 2026
 # ==========================================
 
-from dao.task_stage_instance_dao import TaskStageInstanceDAO
+from dao.db_connection import DEFAULT_PAGE_SIZE
+from dao.task_stage_instance_dao import TASK_STAGE_INSTANCE_COLUMNS, TaskStageInstanceDAO
 from model.task_stage_instance import TaskStageInstance
 
 
@@ -47,13 +48,37 @@ class TaskStageInstanceService:
         """Returns all TaskStageInstances (newest first)."""
         return self.dao.get_all_stage_instances()
 
-    def mark_stage_completed(self, stage_instance_id, output_artifact_path):
-        """Marks a stage as completed."""
-        return self.dao.mark_completed(stage_instance_id, output_artifact_path)
+    def list_stage_instances_page(self, columns=TASK_STAGE_INSTANCE_COLUMNS, before_id=None,
+                                  limit=DEFAULT_PAGE_SIZE, task_instance_id=None, status=None):
+        """Returns one page of TaskStageInstances (newest first) and the before_id of the next page."""
+        return self.dao.get_stage_instance_page(columns, before_id, limit, task_instance_id, status)
 
-    def mark_stage_failed(self, stage_instance_id, error_message):
+    def create_pending_stage_instances(self, task_instance_id_fk, stages):
+        """
+        Pre-creates PENDING rows for [(stage_order, stage_name), ...] in one statement.
+        Returns {stage_order: TaskStageInstance_ID}.
+        """
+        return self.dao.create_pending_stage_instances(task_instance_id_fk, stages)
+
+    def mark_stage_running(self, stage_instance_id):
+        """Marks a PENDING stage as running."""
+        return self.dao.mark_running(stage_instance_id)
+
+    def mark_stage_completed(self, stage_instance_id, output_artifact_path, prompt_tokens=None):
+        """Marks a stage as completed; prompt_tokens is the estimated prompt size it sent."""
+        return self.dao.mark_completed(stage_instance_id, output_artifact_path, prompt_tokens)
+
+    def mark_stage_failed(self, stage_instance_id, error_message, prompt_tokens=None):
         """Marks a stage as failed."""
-        return self.dao.mark_failed(stage_instance_id, error_message)
+        return self.dao.mark_failed(stage_instance_id, error_message, prompt_tokens)
+
+    def mark_stages_failed(self, stage_instance_ids, error_message):
+        """Marks several stages as failed (one statement), e.g. stages skipped after a failure."""
+        return self.dao.mark_failed_many(stage_instance_ids, error_message)
+
+    def fail_unfinished_stages(self, task_instance_ids, error_message):
+        """Marks the RUNNING / PENDING stages of several TaskInstances as failed."""
+        return self.dao.fail_unfinished_for_task_instances(task_instance_ids, error_message)
 
     def clear_outputs_for_task_instance(self, task_instance_id_fk):
         """Clears output paths and error messages for a TaskInstance."""
@@ -62,3 +87,15 @@ class TaskStageInstanceService:
     def delete_for_task_instance(self, task_instance_id_fk):
         """Hard deletes stage instances for a TaskInstance."""
         return self.dao.delete_for_task_instance(task_instance_id_fk)
+
+    def clear_outputs_for_task_instances(self, task_instance_ids):
+        """Clears output paths and error messages for several TaskInstances."""
+        return self.dao.clear_outputs_for_task_instances(task_instance_ids)
+
+    def delete_for_task_instances(self, task_instance_ids):
+        """Hard deletes stage instances for several TaskInstances."""
+        return self.dao.delete_for_task_instances(task_instance_ids)
+
+    def delete_stage_instances(self, stage_instance_ids):
+        """Hard deletes specific stage instances (e.g. stages a resumed run re-executes)."""
+        return self.dao.delete_stage_instances(stage_instance_ids)
@@ -0,0 +1,222 @@
+# ==========================================
+# File: csv_table.py
+# Added in iteration: 5
+# Author: Karl Concha
+#
+# Purpose:
+# Columnar reading of CSV uploads, so Stage 0 can give the model a compact
+# description of a table instead of every row joined into text.
+# - The file is parsed once, in batches of rows that are transposed into
+#   columns (one list of cells per column)
+# - Each column's type is inferred from its non-empty cells: integer,
+#   number, date (ISO YYYY-MM-DD) or text
+# - Numeric columns are converted in one pass into array("d") and aggregated
+#   over the whole array (total, min, max, mean); every column gets counts of
+#   values, blanks and distinct values, text columns their most common values
+# - The flow's Csv_Input_Mode picks what Stage 0 emits for a CSV:
+#   "full" (every row, as FileReader.read_csv), "summary" (column summaries)
+#   or "sample" (column summaries plus evenly spaced rows)
+#
+# Notes:
+# - Standard library only (csv / array); NumPy is not a Rainn dependency.
+# - A summary that would not be shorter than the full text is not used
+#   (render returns None), so small line-item files stay as they are.
+# - The first row is the header. Short rows are padded with blanks and cells
+#   beyond the header are ignored.
+#
+# Used by FileReader.iter_csv_table (file_reader.py)
+# ==========================================
+
+import csv
+import math
+import re
+from array import array
+from collections import Counter
+from itertools import chain, islice, repeat
+from operator import itemgetter
+
+
+CSV_INPUT_FULL = "full"
+CSV_INPUT_SUMMARY = "summary"
+CSV_INPUT_SAMPLE = "sample"
+CSV_INPUT_MODES = (CSV_INPUT_FULL, CSV_INPUT_SUMMARY, CSV_INPUT_SAMPLE)
+
+# Rows parsed before each batch is transposed into the columns.
+PARSE_BATCH_ROWS = 1000
+
+# Rows listed in "sample" mode (first, last and evenly spaced rows in between).
+SAMPLE_ROWS = 20
+
+# Text columns with at most this many distinct values list all of them; others list the TOP_VALUES most common.
+MAX_LISTED_VALUES = 8
+TOP_VALUES = 5
+
+# Listed text values longer than this are cut short.
+MAX_VALUE_CHARS = 40
+
+# Number columns are shown with the decimal places found in the data, up to this many.
+MAX_DECIMALS = 6
+
+_ISO_DATE = re.compile(r"\d{4}-\d{2}-\d{2}(?:[T ]\d{2}:\d{2}(?::\d{2}(?:\.\d+)?)?)?")
+
+
+class CsvColumn:
+    """ One column's type and aggregates, worked out from all of its cells at once. """
+
+    __slots__ = ("name", "kind", "count", "blanks", "distinct", "numbers", "decimals", "_values")
+
+    def __init__(self, name, cells):
+        self.name = name
+        values = [cell for cell in map(str.strip, cells) if cell]
+        self.count = len(values)
+        self.blanks = len(cells) - self.count
+        self.numbers = None
+        self.decimals = 0
+        self._values = values
+
+        if not values:
+            self.kind = "empty"
+            self.distinct = 0
+            return
+
+        distinct_values = set(values)
+        self.distinct = len(distinct_values)
+        numbers = CsvColumn._parse_numbers(values)
+        if numbers is not None:
+            self.numbers = numbers
+            # Longest fraction ("15.50" -> "50"), taken over the distinct values.
+            fractions = map(itemgetter(2), map(str.partition, distinct_values, repeat(".")))
+            self.decimals = min(MAX_DECIMALS, max(map(len, fractions)))
+            is_integer = self.decimals == 0 and all(map(float.is_integer, numbers))
+            self.kind = "integer" if is_integer else "number"
+        elif all(map(_ISO_DATE.fullmatch, values)):
+            self.kind = "date"
+        else:
+            self.kind = "text"
+
+    @staticmethod
+    def _parse_numbers(values):
+        """ All values as array("d"), or None if any of them is not a finite number. """
+        try:
+            numbers = array("d", map(float, values))
+        except ValueError:
+            return None
+        if not all(map(math.isfinite, numbers)):
+            return None
+        return numbers
+
+    def describe(self):
+        """ One summary line, e.g. "- Total (number): 16 values, 16 distinct; total 2883.87, ...". """
+        counts = f"{self.count} values"
+        if self.blanks:
+            counts += f" ({self.blanks} blank)"
+        if self.kind == "empty":
+            return f"- {self.name} (empty): {counts}"
+        counts += f", {self.distinct} distinct"
+
+        if self.numbers is not None:
+            total = math.fsum(self.numbers)
+            mean_decimals = min(MAX_DECIMALS, self.decimals + 2)
+            return (
+                f"- {self.name} ({self.kind}): {counts}; "
+                f"total {total:.{self.decimals}f}, "
+                f"min {min(self.numbers):.{self.decimals}f}, "
+                f"max {max(self.numbers):.{self.decimals}f}, "
+                f"mean {total / self.count:.{mean_decimals}f}"
+            )
+        if self.kind == "date":
+            return f"- {self.name} (date): {counts}; from {min(self._values)} to {max(self._values)}"
+
+        listed = Counter(self._values).most_common(
+            self.distinct if self.distinct <= MAX_LISTED_VALUES else TOP_VALUES
+        )
+        label = "values" if self.distinct <= MAX_LISTED_VALUES else "most common"
+        return f"- {self.name} (text): {counts}; {label}: " + ", ".join(
+            f"{CsvColumn._shorten(value)} ({n})" for value, n in listed
+        )
+
+    @staticmethod
+    def _shorten(value):
+        if len(value) <= MAX_VALUE_CHARS:
+            return value
+        return value[:MAX_VALUE_CHARS - 3] + "..."
+
+
+class CsvTable:
+    """ A CSV file parsed once into columns (see CsvTable.read). """
+
+    __slots__ = ("header", "columns", "row_count", "full_chars", "_cells")
+
+    def __init__(self, header, cells, full_chars=0):
+        self.header = header
+        self._cells = cells
+        self.row_count = len(cells[0]) if cells else 0
+        # Approximate length of FileReader.read_csv's text for the same file.
+        self.full_chars = full_chars
+        self.columns = [
+            CsvColumn(name.strip() or f"column {idx}", column_cells)
+            for idx, (name, column_cells) in enumerate(zip(header, cells), start=1)
+        ]
+
+    @staticmethod
+    def read(path, batch_rows=PARSE_BATCH_ROWS):
+        """ Parses path (UTF-8 CSV, first row = header) into columns. """
+        with open(path, newline="", encoding="utf-8") as f:
+            reader = csv.reader(f)
+            header = next(reader, None) or []
+            width = len(header)
+            cells = [[] for _ in range(width)]
+            full_chars = len(", ".join(header))
+
+            while True:
+                batch = list(islice(reader, batch_rows))
+                if not batch:
+                    break
+                batch = [row if len(row) == width else (row + [""] * width)[:width] for row in batch]
+                full_chars += sum(map(len, chain.from_iterable(batch))) + len(batch) * (2 * width - 1)
+                for column_cells, batch_cells in zip(cells, zip(*batch)):
+                    column_cells.extend(batch_cells)
+
+        return CsvTable(header, cells, full_chars)
+
+    def summary_text(self):
+        """ Table shape plus one line per column (type, counts and aggregates). """
+        lines = [f"[CSV SUMMARY] {self.row_count} rows, {len(self.columns)} columns"]
+        lines.extend(column.describe() for column in self.columns)
+        return "\n".join(lines)
+
+    def sample_text(self, sample_rows=SAMPLE_ROWS):
+        """ summary_text followed by the header and up to sample_rows evenly spaced rows. """
+        rows = CsvTable._sample_indexes(self.row_count, sample_rows)
+        lines = [
+            self.summary_text(),
+            "",
+            f"[CSV SAMPLE] {len(rows)} of {self.row_count} rows",
+            ", ".join(self.header)
+        ]
+        lines.extend(", ".join(column_cells[i] for column_cells in self._cells) for i in rows)
+        return "\n".join(lines)
+
+    def render(self, csv_mode):
+        """
+        Stage 0 text for csv_mode ("summary" or "sample"), or None when the full
+        text should be used instead ("full", no columns, or not shorter than it).
+        """
+        if csv_mode == CSV_INPUT_SUMMARY:
+            text = self.summary_text()
+        elif csv_mode == CSV_INPUT_SAMPLE:
+            text = self.sample_text()
+        else:
+            return None
+        if not self.columns or len(text) >= self.full_chars:
+            return None
+        return text
+
+    @staticmethod
+    def _sample_indexes(row_count, sample_rows):
+        if row_count <= sample_rows:
+            return range(row_count)
+        if sample_rows <= 1:
+            return range(min(row_count, sample_rows))
+        step = (row_count - 1) / (sample_rows - 1)
+        return [round(i * step) for i in range(sample_rows)]
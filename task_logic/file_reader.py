@@ -1,8 +1,23 @@
 # ==========================================
 # File: file_reader.py
 # Created in iteration: 2
+# Updated in iteration: 5
 # Author: Karl Concha
 #
+# Iteration 5: PDF pages can be read as a generator (iter_pdf_pages) so Stage 0
+# writes its artifact while extraction is still running. Large PDFs are split
+# into page ranges extracted by a shared process pool (PDF_WORKERS); pages
+# still come back in document order. read_pdf joins the pages once instead of
+# concatenating page by page.
+# Iteration 5: iter_file reads .txt in blocks and .csv in batches of rows, so
+# Stage 0 can normalise and write large uploads without holding them in memory
+# (the finished artifact is still read back whole for the prompts).
+# Iteration 5: with a csv_mode of "summary" or "sample", a .csv is read into
+# columns (csv_table.py) and Stage 0 gets column summaries (and sampled rows)
+# instead of every row.
+# Pool workers are spawned (not forked), so a script that reads large PDFs
+# needs the usual if __name__ == "__main__": guard.
+#
 # ChatGPT (OpenAI, 2025) – Assisted in refining
 # file-handling structure and ensuring consistent
 # read-function routing for PDF, TXT, and CSV files.
@@ -16,8 +31,73 @@
 # ==========================================
 
 import csv 
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
 from PyPDF2 import PdfReader
 
+from task_logic.csv_table import CSV_INPUT_FULL, CsvTable
+
+PAGE_BREAK = "\f"
+
+# Bump whenever extraction output changes (retires Stage 0 extraction cache entries).
+READER_VERSION = 1
+
+# Worker processes for PDF extraction (1 = extract in the calling thread).
+PDF_WORKERS = min(4, os.cpu_count() or 1)
+
+# PDFs with fewer pages are extracted in the calling thread (pool overhead is not worth it).
+PARALLEL_PDF_MIN_PAGES = 32
+
+# Smallest page range handed to one worker (each worker re-opens the PDF).
+MIN_PAGES_PER_TASK = 16
+
+# Piece sizes for streamed reading (iter_file): characters of a .txt, rows of a .csv.
+TXT_BLOCK_CHARS = 1024 * 1024
+CSV_ROWS_PER_PIECE = 1000
+
+_pdf_pool = None
+_pdf_pool_lock = threading.Lock()
+
+
+def _get_pdf_pool():
+    """ The process-wide PDF extraction pool (created on first use). """
+    global _pdf_pool
+    with _pdf_pool_lock:
+        if _pdf_pool is None:
+            # "spawn": the app is multi-threaded, and forked workers could inherit held locks.
+            _pdf_pool = ProcessPoolExecutor(
+                max_workers=PDF_WORKERS,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return _pdf_pool
+
+
+def _discard_pdf_pool(pool):
+    """ Drops a broken pool (a worker died) so the next PDF starts a new one. """
+    global _pdf_pool
+    with _pdf_pool_lock:
+        if _pdf_pool is pool:
+            _pdf_pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _page_text(page):
+    text = page.extract_text()
+    if not text:
+        return None
+    return (text + '\n' + PAGE_BREAK).replace("\r\n", "\n").replace("\r", "\n")
+
+
+def _extract_pdf_pages(path, start, stop):
+    """ Worker task: texts of pages start..stop-1 (None for pages without text). """
+    reader = PdfReader(path)
+    return [_page_text(reader.pages[i]) for i in range(start, stop)]
+
+
 class FileReader:
 
     @staticmethod
@@ -31,37 +111,116 @@ class FileReader:
         else:
             return "[Unsupported file type]"
 
+    @staticmethod
+    def iter_file(file_path, csv_mode=CSV_INPUT_FULL):
+        """
+        Streaming counterpart of read_file: an iterable of text pieces that join to
+        read_file's text, or None for unsupported file types. Pieces never split a
+        CRLF pair (PDF pages end in a page break, txt newlines are already translated,
+        CSV pieces end after a row separator).
+        csv_mode other than "full" reads a .csv as columns (see iter_csv_table).
+        """
+        if file_path.endswith(".pdf"):
+            return FileReader.iter_pdf_pages(file_path)
+        elif file_path.endswith(".txt"):
+            return FileReader.iter_txt_blocks(file_path)
+        elif file_path.endswith(".csv"):
+            if csv_mode != CSV_INPUT_FULL:
+                return FileReader.iter_csv_table(file_path, csv_mode)
+            return FileReader.iter_csv_rows(file_path)
+        return None
+
     @staticmethod
     #This is how using PyPDF2 can enable Rainn to read pdf files
     #Basically a text extractor which is added into a var (or array) combined with breaks using \n
+    #Iteration 5: pages end with a form feed so the chunker can split on page boundaries
     def read_pdf(path):
-        reader = PdfReader(path)
-        
-        plain_text = ""
-        for page in reader.pages:
-            text = page.extract_text()
-            if text:
-                plain_text += text + '\n'
-        
-        plain_text = plain_text.replace("\r\n", "\n").replace("\r", "\n")
+        plain_text = "".join(FileReader.iter_pdf_pages(path))
 
         if "\n" not in plain_text and len(plain_text) > 250:
             plain_text = plain_text.replace(". ", ".\n")
         
         return plain_text
 
+    @staticmethod
+    def iter_pdf_pages(path):
+        """
+        Yields the text of each PDF page in order, ending in "\n" + PAGE_BREAK
+        (pages without text are skipped). With PDF_WORKERS > 1 and at least
+        PARALLEL_PDF_MIN_PAGES pages, page ranges are extracted in the process pool.
+        """
+        reader = PdfReader(path)
+        page_count = len(reader.pages)
+
+        if PDF_WORKERS <= 1 or page_count < PARALLEL_PDF_MIN_PAGES:
+            for page in reader.pages:
+                text = _page_text(page)
+                if text:
+                    yield text
+            return
+
+        # Two ranges per worker keeps workers busy when pages differ in cost.
+        per_task = max(MIN_PAGES_PER_TASK, -(-page_count // (PDF_WORKERS * 2)))
+        pool = _get_pdf_pool()
+        futures = [
+            pool.submit(_extract_pdf_pages, path, start, min(start + per_task, page_count))
+            for start in range(0, page_count, per_task)
+        ]
+        try:
+            for future in futures:
+                for text in future.result():
+                    if text:
+                        yield text
+        except BrokenProcessPool:
+            _discard_pdf_pool(pool)
+            raise
+        finally:
+            # Reader stopped early (or a range failed): drop ranges not started yet.
+            for future in futures:
+                future.cancel()
+
     # Simple helper for reading txt files from the project directory.
     @staticmethod
     def read_txt(path):
         with open(path, "r", encoding="utf-8") as f:
             return f.read()
 
+    @staticmethod
+    def iter_txt_blocks(path, block_chars=TXT_BLOCK_CHARS):
+        """Yields a txt file in blocks of block_chars characters (newlines translated as in read_txt)."""
+        with open(path, "r", encoding="utf-8") as f:
+            for block in iter(lambda: f.read(block_chars), ""):
+                yield block
+
     #Utilising csv in order to read excel spreadsheets, in later iterations need to have a function to convert them automatically
     @staticmethod
     def read_csv(path):
-        rows = []
+        return "".join(FileReader.iter_csv_rows(path))
+
+    @staticmethod
+    def iter_csv_rows(path, rows_per_piece=CSV_ROWS_PER_PIECE):
+        """
+        Yields read_csv's text in pieces of rows_per_piece rows. A piece ends with the
+        newline before the next row, so no piece starts with a row separator.
+        """
         with open(path, newline="", encoding="utf-8") as f:
-            reader = csv.reader(f)
-            for row in reader:
-                rows.append(", ".join(row))
-        return "\n".join(rows)
+            batch = []
+            for row in csv.reader(f):
+                if len(batch) == rows_per_piece:
+                    yield "\n".join(batch) + "\n"
+                    batch = []
+                batch.append(", ".join(row))
+            if batch:
+                yield "\n".join(batch)
+
+    @staticmethod
+    def iter_csv_table(path, csv_mode):
+        """
+        Yields the columnar rendering of a CSV for csv_mode ("summary" / "sample",
+        see CsvTable.render), or read_csv's rows when that would not be shorter.
+        """
+        text = CsvTable.read(path).render(csv_mode)
+        if text is None:
+            yield from FileReader.iter_csv_rows(path)
+        else:
+            yield text